@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+
+
+class QueueFull(Exception):
+    """Raised when the admission controller rejects a job"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Obfuscation queue is full, retry after {retry_after}s")
+
+
+class AdmissionController:
+    """Bound the number of running and waiting obfuscation jobs.
+
+    At most `max_running` jobs execute at once and at most `max_queued`
+    more may wait for a slot. Anything beyond that is rejected immediately
+    with a Retry-After estimate derived from recent job durations, instead
+    of piling more work onto the host.
+    """
+
+    def __init__(self, max_running=None, max_queued=None):
+        self.max_running = max_running if max_running is not None else int(os.environ.get("OBF_MAX_RUNNING_JOBS", 1))
+        self.max_queued = max_queued if max_queued is not None else int(os.environ.get("OBF_MAX_QUEUED_JOBS", 8))
+        # A zero-slot semaphore would make every admitted job wait forever
+        if self.max_running < 1:
+            raise ValueError(f"OBF_MAX_RUNNING_JOBS must be at least 1, got {self.max_running}")
+        if self.max_queued < 0:
+            raise ValueError(f"OBF_MAX_QUEUED_JOBS must not be negative, got {self.max_queued}")
+        self.slots = asyncio.Semaphore(self.max_running)
+        # Jobs needing several slots take them one at a time under this lock,
+        # so two of them can't each hold part of what the other needs
+        self.acquiring = asyncio.Lock()
+        self.admitted = 0
+        self.recent_durations = []
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up"""
+        if not self.recent_durations:
+            return 5
+        average = sum(self.recent_durations) / len(self.recent_durations)
+        waiting = max(self.admitted - self.max_running, 0) + 1
+        return max(1, int(average * waiting / self.max_running + 0.5))
+
+    def stats(self):
+        return {
+            "running": min(self.admitted, self.max_running),
+            "queued": max(self.admitted - self.max_running, 0),
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+        }
+
+    def check(self):
+        """Raise QueueFull if no running or queued slot is available"""
+        if self.admitted >= self.max_running + self.max_queued:
+            raise QueueFull(self.retry_after())
+
+    async def run(self, func, *args, slots=1, **kwargs):
+        """Admit a job and run the blocking `func` in a worker thread.
+
+        The job holds `slots` running slots (at most max_running), for jobs
+        that run several pipelines at once.
+        """
+        self.check()
+        self.admitted += 1
+        held = 0
+        try:
+            async with self.acquiring:
+                while held < min(slots, self.max_running):
+                    await self.slots.acquire()
+                    held += 1
+            start = time.time()
+            try:
+                return await asyncio.to_thread(func, *args, **kwargs)
+            finally:
+                self.recent_durations = (self.recent_durations + [time.time() - start])[-20:]
+        finally:
+            for _ in range(held):
+                self.slots.release()
+            self.admitted -= 1
@@ -0,0 +1,191 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+
+class ArtifactStore:
+    """Per-job workspaces under one root, with an index and bounded disk usage.
+
+    Each job gets its own directory. Artifacts are recorded in an in-memory
+    index (persisted to index.json) so lookups never glob the filesystem.
+    Finished jobs are evicted when older than `ttl` seconds, and least
+    recently used jobs are evicted while the total exceeds `quota_bytes`.
+    Jobs that are still running are pinned and never evicted.
+    """
+
+    def __init__(self, root, ttl=None, quota_bytes=None):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl if ttl is not None else int(os.environ.get("OBF_ARTIFACT_TTL", 24 * 3600))
+        self.quota_bytes = quota_bytes if quota_bytes is not None else \
+            int(os.environ.get("OBF_ARTIFACT_QUOTA_MB", 1024)) * 1024 * 1024
+        self.index_path = self.root / "index.json"
+        self.lock = threading.RLock()
+        self.jobs = {}
+        self.path_to_job = {}
+        self._sweeper = None
+        self._stop = threading.Event()
+        self._load_index()
+
+    # Index persistence
+
+    def _load_index(self):
+        if not self.index_path.exists():
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                jobs = json.load(f)
+        except Exception as e:
+            print(f"Could not read artifact index: {e}")
+            return
+        for job_id, job in jobs.items():
+            if not (self.root / job_id).exists():
+                continue
+            job["pinned"] = False  # a job left running by a previous process is dead
+            self.jobs[job_id] = job
+            for artifact in job["artifacts"].values():
+                self.path_to_job[artifact["path"]] = job_id
+
+    def _save_index(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.jobs, f)
+        os.replace(tmp_path, self.index_path)
+
+    # Job lifecycle
+
+    def create_job(self, job_id=None):
+        """Create a pinned workspace directory for a new job"""
+        job_id = job_id or uuid.uuid4().hex
+        job_dir = self.root / job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        with self.lock:
+            self.jobs[job_id] = {
+                "created": now, "last_access": now, "pinned": True,
+                "bytes": 0, "artifacts": {}
+            }
+        return job_id, job_dir
+
+    def job_dir(self, job_id):
+        return self.root / job_id
+
+    def add_artifact(self, job_id, kind, path):
+        """Record an artifact produced by a job under a kind such as "exe" or "report" """
+        path = Path(path).resolve()
+        if not path.exists():
+            return None
+        with self.lock:
+            job = self.jobs[job_id]
+            job["artifacts"][kind] = {"path": str(path), "size": path.stat().st_size}
+            self.path_to_job[str(path)] = job_id
+        return str(path)
+
+    def finish_job(self, job_id):
+        """Unpin a job, record its disk usage and enforce the quota"""
+        job_dir = self.root / job_id
+        # rglob: multi-target jobs keep each target's files in a subdirectory
+        total = sum(f.stat().st_size for f in job_dir.rglob("*") if f.is_file()) if job_dir.exists() else 0
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job["pinned"] = False
+            job["bytes"] = total
+            job["last_access"] = time.time()
+            self._save_index()
+        self.sweep()
+
+    # Lookups
+
+    def get(self, job_id, kind):
+        """Path of a job's artifact, or None. Counts as an access for LRU."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or kind not in job["artifacts"]:
+                return None
+            job["last_access"] = time.time()
+            return job["artifacts"][kind]["path"]
+
+    def latest_job(self, kind):
+        """ID of the most recently created finished job that has an artifact of `kind`"""
+        with self.lock:
+            candidates = [
+                (job["created"], job_id) for job_id, job in self.jobs.items()
+                if kind in job["artifacts"] and not job["pinned"]
+            ]
+        return max(candidates)[1] if candidates else None
+
+    def touch(self, path):
+        """Mark the job owning `path` as recently used"""
+        with self.lock:
+            job_id = self.path_to_job.get(str(Path(path).resolve()))
+            if job_id in self.jobs:
+                self.jobs[job_id]["last_access"] = time.time()
+
+    # Eviction
+
+    def evict(self, job_id):
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            if job is None:
+                return
+            for artifact in job["artifacts"].values():
+                self.path_to_job.pop(artifact["path"], None)
+        shutil.rmtree(self.root / job_id, ignore_errors=True)
+
+    def sweep(self):
+        """Evict expired jobs, then LRU jobs until usage fits the quota"""
+        now = time.time()
+        evicted = []
+        with self.lock:
+            finished = [(job["last_access"], job_id) for job_id, job in self.jobs.items() if not job["pinned"]]
+            if self.ttl:
+                evicted += [job_id for last_access, job_id in finished if now - last_access > self.ttl]
+            remaining = sorted(item for item in finished if item[1] not in evicted)
+            usage = sum(job["bytes"] for job_id, job in self.jobs.items() if job_id not in evicted)
+            for _, job_id in remaining:
+                if not self.quota_bytes or usage <= self.quota_bytes:
+                    break
+                usage -= self.jobs[job_id]["bytes"]
+                evicted.append(job_id)
+        for job_id in evicted:
+            self.evict(job_id)
+        if evicted:
+            with self.lock:
+                self._save_index()
+            print(f"🧹 Artifact store evicted {len(evicted)} job(s)")
+        return evicted
+
+    def start_sweeper(self, interval=None):
+        """Run sweep() periodically on a daemon thread"""
+        interval = interval or int(os.environ.get("OBF_ARTIFACT_SWEEP_INTERVAL", 300))
+        if self._sweeper and self._sweeper.is_alive():
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Artifact sweep failed: {e}")
+
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=loop, name="artifact-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "jobs": len(self.jobs),
+                "bytes": sum(job["bytes"] for job in self.jobs.values()),
+                "quota_bytes": self.quota_bytes,
+                "ttl": self.ttl,
+            }
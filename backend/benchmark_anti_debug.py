@@ -0,0 +1,99 @@
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmark_passes import DEFAULT_SOURCES, PLUGIN, benchmark, build_variant, time_binary
+
+# Each placement of the debugger check, plus a check on every call of every
+# function for comparison: that is what the naive placement would cost
+MODES = [
+    ("per-call", "anti-debug<mode=sampled;every=1>"),
+    ("startup", "anti-debug<mode=startup>"),
+    ("sampled", "anti-debug<mode=sampled;every=1024>"),
+    ("sampled-1s", "anti-debug<mode=sampled;every=1024;seconds=1>"),
+    ("cold", "anti-debug<mode=cold>"),
+]
+
+# Calls to a tiny function, so per-call overhead dominates. Kept low enough
+# that the per-call variant (a /proc read per call on Linux) finishes quickly.
+CALLS = 1000000
+
+KERNEL = """
+#include <stdio.h>
+
+__attribute__((noinline)) unsigned step(unsigned acc, unsigned i) {
+    return acc * 31 + i;
+}
+
+__attribute__((noinline)) void report(unsigned acc) {
+    printf("%%u\\n", acc);
+}
+
+int main(int argc, char **argv) {
+    unsigned acc = (unsigned)argc;
+    for (unsigned i = 0; i < %d; i++)
+        acc = step(acc, i);
+    report(acc);
+    return 0;
+}
+"""
+
+
+def benchmark_kernel(runs):
+    """Overhead per instrumented call of each mode, from a loop calling one small function"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        source = work_dir / "kernel.c"
+        source.write_text(KERNEL % CALLS, encoding="utf-8")
+        base_times, base_output = time_binary(build_variant(source, work_dir, "base"), runs)
+        base = min(base_times)
+        for mode, pipeline in MODES:
+            times, output = time_binary(build_variant(source, work_dir, mode, pipeline), runs)
+            best = min(times)
+            results.append({
+                "mode": mode,
+                "pipeline": pipeline,
+                "seconds": round(best, 6),
+                "slowdown": round(best / base, 3) if base else None,
+                "ns_per_call": round(max(best - base, 0) / CALLS * 1e9, 2),
+                "output_matches": len(output) == 1 and output == base_output,
+            })
+    return {"calls": CALLS, "baseline_seconds": round(base, 6), "modes": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the runtime overhead of each anti-debug placement mode")
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES, help="C sources (default: test/*.c)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per binary; the fastest is reported")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    if not PLUGIN.exists():
+        print(f"Plugin not found: {PLUGIN}")
+        sys.exit(1)
+
+    report = {
+        "kernel": benchmark_kernel(args.runs),
+        "programs": benchmark(args.sources, [pipeline for _, pipeline in MODES], args.runs),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    kernel = report["kernel"]
+    print(f"Call kernel ({kernel['calls']} calls): baseline {kernel['baseline_seconds']:.6f}s")
+    for result in kernel["modes"]:
+        check = "✅" if result["output_matches"] else "⚠️ output differs"
+        print(f"  {result['mode']:<12} {result['seconds']:.6f}s  x{result['slowdown']}  "
+              f"{result['ns_per_call']:.2f} ns/call  {check}")
+    for entry in report["programs"]:
+        print(f"{entry['source']}: baseline {entry['baseline_seconds']:.6f}s")
+        for (mode, _), variant in zip(MODES, entry["variants"]):
+            if "error" in variant:
+                print(f"  {mode:<12} ❌ {variant['error']}")
+                continue
+            check = "✅" if variant["output_matches"] else "⚠️ output differs"
+            print(f"  {mode:<12} {variant['seconds']:.6f}s  x{variant['slowdown']}  {check}")
@@ -0,0 +1,106 @@
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark_passes import PLUGIN, backend_dir, run
+from pass_host import PassHostPool, find_binary
+
+DEFAULT_SOURCE = backend_dir.parent / "test" / "simple_test.c"
+DEFAULT_PASSES = ["stringenc", "bogus-instructions", "cfflatten", "opaque-preds", "bbsplit"]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(timings):
+    return {
+        "p50_ms": round(percentile(timings, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 2),
+        "mean_ms": round(statistics.mean(timings) * 1000, 2),
+    }
+
+
+def job_with_opt(bc_file, work_dir, passes):
+    """One small job the way the pipeline runs it without hosts: opt per pass, then llvm-as"""
+    current = bc_file
+    for i, name in enumerate(passes):
+        next_ll = work_dir / f"opt_{i}.ll"
+        next_bc = work_dir / f"opt_{i}.bc"
+        run(["opt", "-load-pass-plugin", str(PLUGIN), "-passes", name, "-S", str(current), "-o", str(next_ll)])
+        run(["llvm-as", str(next_ll), "-o", str(next_bc)])
+        current = next_bc
+
+
+def job_with_pool(bc_file, pool, passes):
+    """The same job on a warm pass host pool"""
+    module = bc_file.read_bytes()
+    for name in passes:
+        response = pool.run(name, module)
+        if not response.get("ok"):
+            raise RuntimeError(f"{name} failed on pass host: {response.get('error')}")
+        module = response["bitcode"]
+
+
+def benchmark_pass_host(source, passes, jobs):
+    """Per-job latency of the pass stage with opt subprocesses versus a pass host pool"""
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        bc_file = work_dir / "input.bc"
+        run(["clang", "-O0", "-c", "-emit-llvm", str(source), "-o", str(bc_file)])
+
+        opt_times = []
+        for _ in range(jobs):
+            start = time.perf_counter()
+            job_with_opt(bc_file, work_dir, passes)
+            opt_times.append(time.perf_counter() - start)
+
+        pool = PassHostPool(size=1)
+        try:
+            pool.check_health()  # warm up: start the host before timing
+            host_times = []
+            for _ in range(jobs):
+                start = time.perf_counter()
+                job_with_pool(bc_file, pool, passes)
+                host_times.append(time.perf_counter() - start)
+        finally:
+            pool.shutdown()
+
+    opt_summary, host_summary = summarize(opt_times), summarize(host_times)
+    return {
+        "source": Path(source).name,
+        "passes": passes,
+        "jobs": jobs,
+        "opt_subprocess": opt_summary,
+        "pass_host": host_summary,
+        "speedup_p50": round(opt_summary["p50_ms"] / host_summary["p50_ms"], 2) if host_summary["p50_ms"] else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare small-job latency of opt subprocesses and the pass host")
+    parser.add_argument("source", nargs="?", default=DEFAULT_SOURCE, help="C source (default: test/simple_test.c)")
+    parser.add_argument("--pass", action="append", dest="passes", help="Pass to run per job (repeatable)")
+    parser.add_argument("--jobs", type=int, default=20, help="Jobs to time per mode")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    if not PLUGIN.exists() or find_binary() is None:
+        print(f"Plugin or obf-pass-host not found in {backend_dir / 'build'}")
+        sys.exit(1)
+
+    report = benchmark_pass_host(args.source, args.passes or DEFAULT_PASSES, args.jobs)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    print(f"{report['source']}: {len(report['passes'])} passes per job, {report['jobs']} jobs")
+    for mode in ("opt_subprocess", "pass_host"):
+        s = report[mode]
+        print(f"  {mode:<16} p50 {s['p50_ms']:.2f} ms  p95 {s['p95_ms']:.2f} ms  mean {s['mean_ms']:.2f} ms")
+    print(f"  speedup (p50): x{report['speedup_p50']}")
@@ -0,0 +1,107 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+backend_dir = Path(__file__).parent.resolve()
+PLUGIN = backend_dir / "build" / "AdvancedObfuscationPasses.dll"
+DEFAULT_SOURCES = sorted((backend_dir.parent / "test").glob("*.c"))
+
+
+def run(cmd):
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(map(str, cmd))} failed: {result.stderr.strip()}")
+    return result
+
+
+def build_variant(source, work_dir, name, pipeline=None, opt_level="-O2"):
+    """Compile source to an executable, running `pipeline` through opt first if given"""
+    bc_file = work_dir / f"{name}.bc"
+    run(["clang", "-O0", "-c", "-emit-llvm", str(source), "-o", str(bc_file)])
+    if pipeline:
+        obf_bc = work_dir / f"{name}.obf.bc"
+        run(["opt", "-load-pass-plugin", str(PLUGIN), "-passes", pipeline, str(bc_file), "-o", str(obf_bc)])
+        bc_file = obf_bc
+    obj_file = work_dir / f"{name}.o"
+    exe_file = work_dir / f"{name}.exe"
+    run(["llc", opt_level, "-filetype=obj", str(bc_file), "-o", str(obj_file)])
+    run(["clang", str(obj_file), "-o", str(exe_file)])
+    return exe_file
+
+
+def time_binary(exe_file, runs):
+    """Wall-clock seconds of each run; output is captured so all variants can be compared"""
+    timings, outputs = [], set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([str(exe_file)], capture_output=True)
+        timings.append(time.perf_counter() - start)
+        outputs.add(result.stdout)
+    return timings, outputs
+
+
+def benchmark(sources, pipelines, runs):
+    """Slowdown of each pass pipeline relative to the unobfuscated build of each source"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        for source in sources:
+            source = Path(source)
+            base_exe = build_variant(source, work_dir, f"{source.stem}_base")
+            base_times, base_output = time_binary(base_exe, runs)
+            base = min(base_times)
+            entry = {"source": source.name, "baseline_seconds": round(base, 6), "variants": []}
+            for i, pipeline in enumerate(pipelines):
+                try:
+                    exe = build_variant(source, work_dir, f"{source.stem}_{i}", pipeline)
+                except RuntimeError as e:
+                    entry["variants"].append({"pipeline": pipeline, "error": str(e)})
+                    continue
+                times, output = time_binary(exe, runs)
+                best = min(times)
+                entry["variants"].append({
+                    "pipeline": pipeline,
+                    "seconds": round(best, 6),
+                    "median_seconds": round(statistics.median(times), 6),
+                    "slowdown": round(best / base, 3) if base else None,
+                    "size_bytes": exe.stat().st_size,
+                    "baseline_size_bytes": base_exe.stat().st_size,
+                    "output_matches": len(output) == 1 and output == base_output,
+                })
+            results.append(entry)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure runtime overhead of obfuscation passes")
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES, help="C sources (default: test/*.c)")
+    parser.add_argument("--pipeline", action="append", dest="pipelines",
+                        help="opt -passes pipeline to compare (repeatable)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per binary; the fastest is reported")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    pipelines = args.pipelines or ["cfflatten", "cfflatten<keep-loops>"]
+    if not PLUGIN.exists():
+        print(f"Plugin not found: {PLUGIN}")
+        sys.exit(1)
+
+    results = benchmark(args.sources, pipelines, args.runs)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        sys.exit(0)
+
+    for entry in results:
+        print(f"{entry['source']}: baseline {entry['baseline_seconds']:.6f}s")
+        for variant in entry["variants"]:
+            if "error" in variant:
+                print(f"  {variant['pipeline']:<28} ❌ {variant['error']}")
+                continue
+            check = "✅" if variant["output_matches"] else "⚠️ output differs"
+            print(f"  {variant['pipeline']:<28} {variant['seconds']:.6f}s  x{variant['slowdown']}  "
+                  f"{variant['size_bytes']} bytes  {check}")
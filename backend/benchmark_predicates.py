@@ -0,0 +1,97 @@
+import argparse
+import json
+import re
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmark_passes import PLUGIN, backend_dir, build_variant, time_binary
+
+# The kernel loop lowers to three blocks at -O0 (cond, body, inc), and
+# opaque-preds<only=...> puts one predicate in each of them.
+PREDICATES_PER_ITERATION = 3
+ITERATIONS = 200000000
+
+KERNEL = """
+#include <stdio.h>
+
+unsigned spin(unsigned n, unsigned seed) {
+    unsigned acc = seed;
+    for (unsigned i = 0; i < n; i++)
+        acc = acc * 31 + i;
+    return acc;
+}
+
+int main(int argc, char **argv) {
+    printf("%%u\\n", spin(%d, (unsigned)argc));
+    return 0;
+}
+"""
+
+LIBRARY_RE = re.compile(r'\{"([a-z-]+)", (\d+), (\d+), \[\]')
+
+
+def load_library():
+    """(name, declared cycles, resistance) of every predicate in OpaquePredicates.cpp"""
+    source = (backend_dir / "src" / "OpaquePredicates.cpp").read_text(encoding="utf-8")
+    # Costs are declared in tenths of a cycle
+    return [(name, int(cost) / 10, int(resistance)) for name, cost, resistance in LIBRARY_RE.findall(source)]
+
+
+def cpu_ghz():
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            match = re.search(r"cpu MHz\s*:\s*([\d.]+)", f.read())
+        return float(match.group(1)) / 1000 if match else None
+    except OSError:
+        return None
+
+
+def benchmark_predicates(runs, ghz=None):
+    """Overhead of each predicate per evaluation, from a loop with one predicate per block"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        source = work_dir / "kernel.c"
+        source.write_text(KERNEL % ITERATIONS, encoding="utf-8")
+        base_times, base_output = time_binary(build_variant(source, work_dir, "base"), runs)
+        base = min(base_times)
+        evaluations = ITERATIONS * PREDICATES_PER_ITERATION
+
+        for name, declared_cost, resistance in load_library():
+            exe = build_variant(source, work_dir, name, f"opaque-preds<only={name}>")
+            times, output = time_binary(exe, runs)
+            ns = max(min(times) - base, 0) / evaluations * 1e9
+            results.append({
+                "predicate": name,
+                "resistance": resistance,
+                "declared_cycles": declared_cost,
+                "ns_per_eval": round(ns, 3),
+                "cycles_per_eval": round(ns * ghz, 2) if ghz else None,
+                "output_matches": len(output) == 1 and output == base_output,
+            })
+    return {"baseline_seconds": round(base, 6), "ghz": ghz, "predicates": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the runtime cost of each opaque predicate")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per binary; the fastest is reported")
+    parser.add_argument("--ghz", type=float, help="CPU clock for cycle estimates (default: /proc/cpuinfo)")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    if not PLUGIN.exists():
+        print(f"Plugin not found: {PLUGIN}")
+        sys.exit(1)
+
+    report = benchmark_predicates(args.runs, args.ghz or cpu_ghz())
+    if args.json:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    print(f"Baseline: {report['baseline_seconds']:.6f}s")
+    for result in report["predicates"]:
+        cycles = f"{result['cycles_per_eval']:.2f}" if result["cycles_per_eval"] is not None else "?"
+        check = "✅" if result["output_matches"] else "⚠️ output differs"
+        print(f"  {result['predicate']:<20} resistance {result['resistance']}  "
+              f"{result['ns_per_eval']:.3f} ns  ~{cycles} cycles (declared {result['declared_cycles']})  {check}")
@@ -0,0 +1,76 @@
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmark_passes import DEFAULT_SOURCES, PLUGIN, build_variant, run, time_binary
+from run_advanced_obfuscation import ALL_PASSES, SEEDED_PASSES
+
+
+def build_obfuscated(source, work_dir, name, steps):
+    """Build source with one opt run per step, as the service does; returns (exe, IR text)"""
+    bc_file = work_dir / f"{name}.bc"
+    run(["clang", "-O0", "-c", "-emit-llvm", str(source), "-o", str(bc_file)])
+    for i, step in enumerate(steps):
+        next_bc = work_dir / f"{name}.{i}.bc"
+        run(["opt", "-load-pass-plugin", str(PLUGIN), "-passes", step, str(bc_file), "-o", str(next_bc)])
+        bc_file = next_bc
+    # The module ID names the input file, which differs between builds
+    ir = run(["llvm-dis", str(bc_file), "-o", "-"]).stdout.split("\n", 1)[1]
+    obj_file = work_dir / f"{name}.o"
+    exe_file = work_dir / f"{name}.exe"
+    run(["llc", "-O2", "-filetype=obj", str(bc_file), "-o", str(obj_file)])
+    run(["clang", str(obj_file), "-o", str(exe_file)])
+    return exe_file, ir
+
+
+def check(sources, pipelines):
+    """Compare each obfuscated build's output with the unobfuscated build's.
+
+    Every pipeline is built twice; both builds must produce the same IR,
+    since seeded jobs and the result caches rely on reproducible output.
+    Returns (source, pipeline, error) for each check that failed.
+    """
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        for source in sources:
+            source = Path(source)
+            _, expected = time_binary(build_variant(source, work_dir, f"{source.stem}_base"), 1)
+            for i, steps in enumerate(pipelines):
+                label = " → ".join(steps)
+                try:
+                    builds = [build_obfuscated(source, work_dir, f"{source.stem}_{i}_{n}", steps) for n in range(2)]
+                except RuntimeError as e:
+                    failures.append((source.name, label, str(e)))
+                    continue
+                _, output = time_binary(builds[0][0], 1)
+                if output != expected:
+                    failures.append((source.name, label, "output differs from the unobfuscated build"))
+                elif builds[0][1] != builds[1][1]:
+                    failures.append((source.name, label, "two builds with the same seed differ"))
+                else:
+                    print(f"✅ {source.name}: {label}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that obfuscation leaves program output unchanged")
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES, help="C sources (default: test/*.c)")
+    parser.add_argument("--pass", action="append", dest="passes",
+                        help="Pass to check (repeatable; default: every pass)")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for seeded passes")
+    args = parser.parse_args()
+
+    if not PLUGIN.exists():
+        print(f"Plugin not found: {PLUGIN}")
+        sys.exit(1)
+
+    # Each pass alone, then all of them in pipeline order
+    names = args.passes or [p[0] for p in ALL_PASSES]
+    steps = [f"{name}<seed={args.seed}>" if name in SEEDED_PASSES else name for name in names]
+    pipelines = [[step] for step in steps] + ([steps] if len(steps) > 1 else [])
+    failures = check(args.sources, pipelines)
+    for source, label, error in failures:
+        print(f"❌ {source}: {label}: {error}")
+    sys.exit(1 if failures else 0)
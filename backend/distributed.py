@@ -0,0 +1,552 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+
+from admission import QueueFull
+from obfuscate import artifact_store, load_report, obfuscate_code, run_history, symbol_maps
+from resource_limits import LimitExceeded
+
+# Artifacts a worker uploads with a finished job, by result key
+RESULT_ARTIFACTS = ("exe", "report", "llvm_ir", "advanced_report", "symbol_map", "bitcode", "object", "source")
+
+# Seconds a lease request waits for a job before returning empty
+LEASE_WAIT = 10
+
+
+class UnknownWorker(Exception):
+    """The coordinator has no such worker, e.g. it was declared dead; register again"""
+
+
+class LeaseLost(Exception):
+    """The job is no longer assigned to this worker, e.g. it was requeued after missed heartbeats"""
+
+
+class Coordinator:
+    """Job queue and scheduler for obfuscation workers on other machines.
+
+    The API node submits jobs here instead of running them inline. Workers
+    register with their slot count, heartbeat their load and lease jobs;
+    each queued job goes to the live worker with the lowest share of busy
+    slots, then the lowest CPU load. A worker that misses heartbeats for
+    OBF_WORKER_TIMEOUT seconds is dropped, and a job a worker releases or
+    holds for longer than OBF_JOB_DEADLINE seconds is taken back; such jobs
+    go back to the front of the queue, up to OBF_JOB_MAX_ATTEMPTS times.
+    Pipeline failures are not retried; they would fail the same way on any
+    worker.
+
+    Workers reach it over HTTP through CoordinatorClient, but the two share
+    one interface, so a Worker can also drive a Coordinator in-process.
+    """
+
+    def __init__(self, heartbeat_interval=None, heartbeat_timeout=None, max_attempts=None, max_queued=None,
+                 job_deadline=None):
+        self.heartbeat_interval = heartbeat_interval or float(os.environ.get("OBF_WORKER_HEARTBEAT", 5))
+        self.heartbeat_timeout = heartbeat_timeout or float(
+            os.environ.get("OBF_WORKER_TIMEOUT", 3 * self.heartbeat_interval)
+        )
+        self.max_attempts = max_attempts or int(os.environ.get("OBF_JOB_MAX_ATTEMPTS", 3))
+        self.max_queued = max_queued if max_queued is not None else int(os.environ.get("OBF_MAX_QUEUED_JOBS", 8))
+        # Seconds a leased job may run before it is taken back from its worker
+        self.job_deadline = job_deadline or float(os.environ.get("OBF_JOB_DEADLINE", 1800))
+        self.workers = {}
+        self.jobs = {}
+        self.queue = deque()
+        self.condition = threading.Condition()
+        # (event loop, asyncio.Event) of lease_async calls waiting for a job
+        self.lease_waiters = set()
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.recent_durations = []
+        self._reaper = None
+        self._stop = threading.Event()
+
+    # Submitting
+
+    def retry_after(self):
+        """Seconds until a queued job is likely to start, from recent job durations"""
+        if not self.recent_durations:
+            return 5
+        average = sum(self.recent_durations) / len(self.recent_durations)
+        slots = sum(worker["slots"] for worker in self.workers.values()) or 1
+        return max(1, int(average * (len(self.queue) + 1) / slots + 0.5))
+
+    def check(self):
+        """Raise QueueFull if the queue has no room for another job"""
+        with self.condition:
+            if len(self.queue) >= self.max_queued:
+                raise QueueFull(self.retry_after())
+
+    def submit(self, content, filename, options):
+        """Queue a job; returns a Future for the same result dict obfuscate_code returns"""
+        job_id = uuid.uuid4().hex
+        future = Future()
+        with self.condition:
+            self.jobs[job_id] = {
+                "content": content,
+                "content_hash": hashlib.sha256(content).hexdigest(),
+                "filename": filename,
+                "options": options,
+                "future": future,
+                "worker": None,
+                "attempts": 0,
+                "artifacts": {},
+                "submitted": time.time(),
+            }
+            self.queue.append(job_id)
+            self._dispatch()
+        return future
+
+    async def run(self, content, filename, options):
+        self.check()
+        return await asyncio.wrap_future(self.submit(content, filename, options))
+
+    def _dispatch(self):
+        """Hand queued jobs to the least loaded live workers with free slots (lock held)"""
+        while self.queue:
+            free = [w for w in self.workers.values() if len(w["jobs"]) < w["slots"]]
+            if not free:
+                break
+            worker = min(free, key=lambda w: (len(w["jobs"]) / w["slots"], w["load"]))
+            job_id = self.queue.popleft()
+            self.jobs[job_id]["worker"] = worker["id"]
+            worker["jobs"].add(job_id)
+            worker["inbox"].append(job_id)
+        self.condition.notify_all()
+        for loop, event in self.lease_waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _requeue(self, job_id):
+        """Put a job taken from its worker back at the front of the queue (lock held).
+
+        Returns the job if it has used up its attempts and was dropped instead.
+        """
+        job = self.jobs[job_id]
+        job["attempts"] += 1
+        job["worker"] = None
+        job.pop("started", None)
+        # The next attempt uploads its own artifacts
+        job["artifacts"] = {}
+        if job["attempts"] >= self.max_attempts:
+            del self.jobs[job_id]
+            self.failed += 1
+            return job
+        # Lost jobs go first; they have waited longest
+        self.queue.appendleft(job_id)
+        self.retried += 1
+        return None
+
+    # Worker interface, shared with CoordinatorClient
+
+    def register(self, name, slots=1, cpus=1):
+        worker_id = uuid.uuid4().hex[:12]
+        with self.condition:
+            self.workers[worker_id] = {
+                "id": worker_id, "name": name, "slots": max(int(slots), 1), "cpus": cpus,
+                "load": 0.0, "jobs": set(), "inbox": deque(), "last_seen": time.time(), "served": 0,
+            }
+            self._dispatch()
+        print(f"🛰️ Worker {name} registered as {worker_id} with {slots} slot(s)")
+        return {"worker_id": worker_id, "heartbeat_interval": self.heartbeat_interval}
+
+    def _worker(self, worker_id):
+        worker = self.workers.get(worker_id)
+        if worker is None:
+            raise UnknownWorker(worker_id)
+        worker["last_seen"] = time.time()
+        return worker
+
+    def _owned_job(self, worker_id, job_id):
+        worker = self._worker(worker_id)
+        if job_id not in worker["jobs"]:
+            raise LeaseLost(job_id)
+        return self.jobs[job_id]
+
+    def heartbeat(self, worker_id, load=0.0):
+        """Record a worker's load (CPU load per core); raises UnknownWorker if it was dropped"""
+        with self.condition:
+            self._worker(worker_id)["load"] = float(load)
+            self._dispatch()
+
+    def lease(self, worker_id, wait=LEASE_WAIT):
+        """Next job assigned to this worker, waiting up to `wait` seconds, or None"""
+        deadline = time.time() + wait
+        with self.condition:
+            while True:
+                worker = self._worker(worker_id)
+                if worker["inbox"]:
+                    job_id = worker["inbox"].popleft()
+                    job = self.jobs[job_id]
+                    job["started"] = time.time()
+                    return {"job_id": job_id, "filename": job["filename"], "options": job["options"],
+                            "attempt": job["attempts"] + 1}
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    async def lease_async(self, worker_id, wait=LEASE_WAIT):
+        """lease() for the event loop: the long poll waits without holding a thread"""
+        deadline = time.time() + wait
+        loop = asyncio.get_running_loop()
+        while True:
+            waiter = (loop, asyncio.Event())
+            with self.condition:
+                job = self.lease(worker_id, 0)
+                remaining = deadline - time.time()
+                if job or remaining <= 0:
+                    return job
+                self.lease_waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter[1].wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.condition:
+                    self.lease_waiters.discard(waiter)
+
+    def source(self, worker_id, job_id):
+        with self.condition:
+            return self._owned_job(worker_id, job_id)["content"]
+
+    def store_artifact(self, worker_id, job_id, kind, name, data):
+        """Keep one uploaded artifact in the coordinator's own store, under the job's ID"""
+        with self.condition:
+            job = self._owned_job(worker_id, job_id)
+            if not job["artifacts"]:
+                artifact_store.create_job(job_id)
+        path = artifact_store.job_dir(job_id) / Path(name).name
+        path.write_bytes(data)
+        with self.condition:
+            job["artifacts"][kind] = artifact_store.add_artifact(job_id, kind, path)
+
+    def complete(self, worker_id, job_id, result):
+        """Finish a job with the worker's result, pointing its paths at the uploaded copies"""
+        with self.condition:
+            job = self._owned_job(worker_id, job_id)
+            worker = self.workers[worker_id]
+            worker["jobs"].discard(job_id)
+            worker["served"] += 1
+            del self.jobs[job_id]
+            self.completed += 1
+            self.recent_durations = (self.recent_durations + [time.time() - job["started"]])[-20:]
+            self._dispatch()
+
+        uploaded = job["artifacts"]
+        for kind in RESULT_ARTIFACTS:
+            result[kind] = uploaded.get(kind)
+        for triple, target in (result.get("targets") or {}).items():
+            for kind in ("exe", "object", "llvm_ir"):
+                if target.get(kind):
+                    target[kind] = uploaded.get(f"{kind}:{triple}")
+        # The build ID is the job ID here too, so crash symbolization works on the API node
+        if result.get("symbol_map"):
+            result["symbol_map"] = artifact_store.add_artifact(
+                job_id, "symbol_map", symbol_maps.save(job_id, result["symbol_map"])
+            )
+        artifact_store.finish_job(job_id)
+        self._record(job_id, job, "success", load_report(result.get("report")), {
+            kind: result.get(kind) for kind in ("exe", "report", "llvm_ir", "symbol_map", "bitcode", "object", "source")
+            if result.get(kind)
+        })
+        job["future"].set_result(result)
+
+    def fail(self, worker_id, job_id, error, limit_violation=None):
+        """Fail a job the pipeline rejected; the client gets the same error as a local run"""
+        with self.condition:
+            job = self._owned_job(worker_id, job_id)
+            self.workers[worker_id]["jobs"].discard(job_id)
+            del self.jobs[job_id]
+            self.failed += 1
+            self._dispatch()
+        if job["artifacts"]:
+            artifact_store.finish_job(job_id)
+        if limit_violation:
+            exception = LimitExceeded(limit_violation["stage"], limit_violation["limit"], limit_violation["value"])
+        else:
+            exception = RuntimeError(error)
+        self._record(job_id, job, "killed" if limit_violation else "failed", {}, {})
+        job["future"].set_exception(exception)
+
+    def release(self, worker_id, job_id, error):
+        """Take back a job the worker could not finish or report, e.g. an upload failed, and requeue it"""
+        with self.condition:
+            self._owned_job(worker_id, job_id)
+            self.workers[worker_id]["jobs"].discard(job_id)
+            print(f"↩️ Job {job_id} released by worker {worker_id}: {error}")
+            lost = self._requeue(job_id)
+            self._dispatch()
+        if lost:
+            lost["future"].set_exception(RuntimeError(f"Job failed on {lost['attempts']} workers; giving up: {error}"))
+
+    def _record(self, job_id, job, status, report, artifacts):
+        options = job["options"]
+        try:
+            run_history.record_run(job_id, job["content_hash"], options.get("selected_techniques"),
+                                   options.get("seed", 0), status, report, artifacts)
+        except Exception as e:
+            print(f"Could not record run history: {e}")
+
+    # Failure detection
+
+    def reap(self):
+        """Requeue or fail the jobs of workers that missed heartbeats and jobs past their deadline"""
+        now = time.time()
+        lost = []
+        with self.condition:
+            for worker_id, worker in list(self.workers.items()):
+                if now - worker["last_seen"] > self.heartbeat_timeout:
+                    del self.workers[worker_id]
+                    print(f"💀 Worker {worker['name']} ({worker_id}) missed heartbeats; "
+                          f"{len(worker['jobs'])} job(s) to reschedule")
+                    expired = list(worker["jobs"])
+                else:
+                    # A live worker can still wedge on one job; its later result is dropped
+                    expired = [job_id for job_id in worker["jobs"]
+                               if now - self.jobs[job_id].get("started", now) > self.job_deadline]
+                    for job_id in expired:
+                        worker["jobs"].discard(job_id)
+                        print(f"⏰ Job {job_id} passed its {self.job_deadline:.0f}s deadline on {worker['name']}")
+                lost += [job for job in map(self._requeue, expired) if job]
+            self._dispatch()
+        for job in lost:
+            job["future"].set_exception(RuntimeError(f"Job lost with {job['attempts']} workers; giving up"))
+
+    def start_reaper(self, interval=None):
+        """Run reap() periodically on a daemon thread"""
+        interval = interval or self.heartbeat_interval
+        if self._reaper and self._reaper.is_alive():
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.reap()
+                except Exception as e:
+                    print(f"Worker reaping failed: {e}")
+
+        self._stop.clear()
+        self._reaper = threading.Thread(target=loop, name="worker-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self):
+        self._stop.set()
+
+    def stats(self):
+        now = time.time()
+        with self.condition:
+            return {
+                "queued": len(self.queue),
+                "running": sum(len(w["jobs"]) for w in self.workers.values()),
+                "slots": sum(w["slots"] for w in self.workers.values()),
+                "completed": self.completed,
+                "failed": self.failed,
+                "retried": self.retried,
+                "workers": [
+                    {
+                        "id": w["id"], "name": w["name"], "slots": w["slots"], "running": len(w["jobs"]),
+                        "load": w["load"], "served": w["served"], "last_seen": round(now - w["last_seen"], 1),
+                    }
+                    for w in self.workers.values()
+                ],
+            }
+
+
+class CoordinatorClient:
+    """Coordinator interface over the API node's /workers endpoints"""
+
+    def __init__(self, url, token=None, timeout=60):
+        self.url = url.rstrip("/")
+        self.token = token if token is not None else os.environ.get("OBF_WORKER_TOKEN", "")
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None, query=None, raw=False, timeout=None):
+        url = f"{self.url}/workers{path}"
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+        headers = {"X-Worker-Token": self.token}
+        if body is not None and not raw:
+            body = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(url, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                data = response.read()
+                if response.status == 204:
+                    return None
+                return data if response.headers.get_content_type() != "application/json" else json.loads(data)
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode(errors="replace")
+            if e.code == 404:
+                raise UnknownWorker(detail)
+            if e.code == 409:
+                raise LeaseLost(detail)
+            raise RuntimeError(f"{method} {path} failed with {e.code}: {detail}")
+
+    def register(self, name, slots=1, cpus=1):
+        return self._request("POST", "/register", {"name": name, "slots": slots, "cpus": cpus})
+
+    def heartbeat(self, worker_id, load=0.0):
+        self._request("POST", f"/{worker_id}/heartbeat", {"load": load})
+
+    def lease(self, worker_id, wait=LEASE_WAIT):
+        return self._request("POST", f"/{worker_id}/lease", query={"wait": wait}, timeout=wait + self.timeout)
+
+    def source(self, worker_id, job_id):
+        return self._request("GET", f"/{worker_id}/jobs/{job_id}/source")
+
+    def store_artifact(self, worker_id, job_id, kind, name, data):
+        self._request("PUT", f"/{worker_id}/jobs/{job_id}/artifacts", data, {"kind": kind, "name": name}, raw=True)
+
+    def complete(self, worker_id, job_id, result):
+        self._request("POST", f"/{worker_id}/jobs/{job_id}/complete", result)
+
+    def fail(self, worker_id, job_id, error, limit_violation=None):
+        self._request("POST", f"/{worker_id}/jobs/{job_id}/fail", {"error": error, "limit_violation": limit_violation})
+
+    def release(self, worker_id, job_id, error):
+        self._request("POST", f"/{worker_id}/jobs/{job_id}/release", {"error": error})
+
+
+def cpu_load():
+    """1-minute load average per core; 0 where the OS doesn't report one"""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+class Worker:
+    """Runs leased jobs through the local pipeline and sends the artifacts back.
+
+    `coordinator` is a CoordinatorClient for a remote API node, or a
+    Coordinator itself for an in-process stand-in. Each slot leases and runs
+    one job at a time; a heartbeat thread reports the machine's load and
+    registers again if the coordinator has dropped this worker.
+    """
+
+    def __init__(self, coordinator, slots=1, name=None):
+        self.coordinator = coordinator
+        self.slots = slots
+        self.name = name or socket.gethostname()
+        self.worker_id = None
+        self.heartbeat_interval = 5
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self.threads = []
+
+    def register(self, stale_id=None):
+        """Register, unless another thread already replaced `stale_id`"""
+        with self.lock:
+            if self.worker_id is None or self.worker_id == stale_id:
+                info = self.coordinator.register(self.name, self.slots, os.cpu_count() or 1)
+                self.worker_id = info["worker_id"]
+                self.heartbeat_interval = info["heartbeat_interval"]
+                print(f"🛰️ Registered as {self.worker_id}")
+            return self.worker_id
+
+    def heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            worker_id = self.worker_id
+            try:
+                self.coordinator.heartbeat(worker_id, cpu_load())
+            except UnknownWorker:
+                self.register(worker_id)
+            except Exception as e:
+                print(f"Heartbeat failed: {e}")
+
+    def slot_loop(self):
+        while not self._stop.is_set():
+            worker_id = self.worker_id
+            try:
+                job = self.coordinator.lease(worker_id)
+            except UnknownWorker:
+                self.register(worker_id)
+                continue
+            except Exception as e:
+                print(f"Lease failed: {e}")
+                self._stop.wait(self.heartbeat_interval)
+                continue
+            if job:
+                self.execute(worker_id, job)
+
+    def execute(self, worker_id, job):
+        job_id = job["job_id"]
+        print(f"⚙️ Job {job_id} (attempt {job['attempt']}): {job['filename']}")
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                input_path = Path(tmp) / Path(job["filename"]).name
+                input_path.write_bytes(self.coordinator.source(worker_id, job_id))
+                try:
+                    result = obfuscate_code(str(input_path), job_id=job_id, **job["options"])
+                except LimitExceeded as e:
+                    self.coordinator.fail(worker_id, job_id, str(e), e.to_dict())
+                    return
+                except Exception as e:
+                    self.coordinator.fail(worker_id, job_id, str(e))
+                    return
+            uploads = [(kind, result[kind]) for kind in RESULT_ARTIFACTS if result.get(kind)]
+            for triple, target in (result.get("targets") or {}).items():
+                uploads += [(f"{kind}:{triple}", target[kind]) for kind in ("exe", "object", "llvm_ir") if target.get(kind)]
+            for kind, path in uploads:
+                self.coordinator.store_artifact(worker_id, job_id, kind, Path(path).name, Path(path).read_bytes())
+            self.coordinator.complete(worker_id, job_id, result)
+            print(f"✅ Job {job_id} done")
+        except LeaseLost:
+            # Requeued elsewhere while this worker was unreachable; the other run wins
+            print(f"⚠️ Job {job_id} was reassigned; result dropped")
+        except UnknownWorker:
+            print(f"⚠️ Dropped by the coordinator during job {job_id}")
+        except Exception as e:
+            # An upload or report failed: hand the job back so it runs again elsewhere.
+            # If even that fails, the coordinator takes it back at its deadline.
+            print(f"Job {job_id} could not be reported: {e}")
+            try:
+                self.coordinator.release(worker_id, job_id, str(e))
+            except (LeaseLost, UnknownWorker):
+                pass
+            except Exception as release_error:
+                print(f"Job {job_id} could not be released: {release_error}")
+
+    def start(self):
+        self.register()
+        self._stop.clear()
+        self.threads = [threading.Thread(target=self.heartbeat_loop, name="worker-heartbeat", daemon=True)]
+        self.threads += [
+            threading.Thread(target=self.slot_loop, name=f"worker-slot-{i}", daemon=True) for i in range(self.slots)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run obfuscation jobs for a coordinator API node")
+    parser.add_argument("coordinator", help="API node URL, e.g. http://10.0.0.5:8000")
+    parser.add_argument("--slots", type=int, default=int(os.environ.get("OBF_WORKER_SLOTS", 1)),
+                        help="Jobs run at once on this machine")
+    parser.add_argument("--name", help="Worker name (default: host name)")
+    args = parser.parse_args()
+
+    worker = Worker(CoordinatorClient(args.coordinator), args.slots, args.name)
+    worker.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        worker.stop()
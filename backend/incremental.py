@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+# Passes that transform each function independently; their results can be
+# cached per function. Everything else runs over the whole module.
+FUNCTION_PASSES = {"bogus-instructions", "cfflatten", "opaque-preds", "bbsplit"}
+
+# Function attribute that tells function passes to leave a body untouched
+SKIP_ATTRIBUTE = '"obf-skip"'
+
+DEFINE_NAME_RE = re.compile(r'@("[^"]+"|[-a-zA-Z$._0-9]+)\(')
+ATTR_REF_RE = re.compile(r'#(\d+)\b')
+META_REF_RE = re.compile(r'!(\d+)\b')
+GLOBAL_REF_RE = re.compile(r'@("[^"]+"|[-a-zA-Z$._][-a-zA-Z$._0-9]*)')
+ATTR_DEF_RE = re.compile(r'^attributes #(\d+) = (.*)$', re.M)
+META_DEF_RE = re.compile(r'^!(\d+) = (.*)$', re.M)
+
+
+def split_functions(ll_text):
+    """Map function name -> (start, end) offsets of its `define ... }` block"""
+    functions = {}
+    pos = 0
+    while True:
+        start = ll_text.find("\ndefine ", pos)
+        if start < 0:
+            break
+        start += 1
+        end = ll_text.find("\n}\n", start)
+        if end < 0:
+            break
+        end += 3
+        header = ll_text[start:ll_text.find("\n", start)]
+        match = DEFINE_NAME_RE.search(header)
+        if match:
+            functions[match.group(1)] = (start, end)
+        pos = end - 1
+    return functions
+
+
+def function_key(ll_text, block, seed, pass_names):
+    """Cache key of one function: its pre-obfuscation IR, seed and pass list.
+
+    Attribute group and metadata numbers are replaced by their definitions so
+    edits elsewhere in the module that renumber them don't invalidate the key.
+    """
+    attr_defs = dict(ATTR_DEF_RE.findall(ll_text))
+    meta_defs = dict(META_DEF_RE.findall(ll_text))
+    normalized = ATTR_REF_RE.sub(lambda m: attr_defs.get(m.group(1), m.group(0)), block)
+    normalized = META_REF_RE.sub(lambda m: meta_defs.get(m.group(1), m.group(0)), normalized)
+    digest = hashlib.sha256()
+    digest.update(normalized.encode("utf-8"))
+    digest.update(f"|seed={seed}|passes={','.join(pass_names)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def mark_skipped(block):
+    """Add the skip attribute to a function's define line"""
+    header_end = block.index("\n")
+    header = block[:header_end]
+    group = ATTR_REF_RE.search(header)
+    if group:
+        header = header[:group.start()] + f"{SKIP_ATTRIBUTE} " + header[group.start():]
+    else:
+        header = header[:header.rindex("{")] + f"{SKIP_ATTRIBUTE} {{"
+    return header + block[header_end:]
+
+
+def clear_skipped(ll_text):
+    """Remove the skip attribute, and attribute groups left empty without it"""
+    ll_text = ll_text.replace(f" {SKIP_ATTRIBUTE}", "")
+    for num in re.findall(r'^attributes #(\d+) = \{ \}\n', ll_text, re.M):
+        ll_text = re.sub(rf'^attributes #{num} = \{{ \}}\n', "", ll_text, flags=re.M)
+        ll_text = re.sub(rf' #{num}\b', "", ll_text)
+    return ll_text
+
+
+def top_level_definitions(ll_text):
+    """Map global name -> its top-level `@name = ...` or `declare` line"""
+    definitions = {}
+    for line in ll_text.splitlines():
+        if line.startswith("@") or line.startswith("declare "):
+            match = GLOBAL_REF_RE.search(line)
+            if match:
+                definitions[match.group(1)] = line
+        elif line.startswith("define "):
+            match = DEFINE_NAME_RE.search(line)
+            if match:
+                definitions[match.group(1)] = None
+    return definitions
+
+
+def capture_function(ll_text, block):
+    """Snapshot an obfuscated function with the module context it depends on.
+
+    Attribute groups, metadata nodes (transitively) and global declarations
+    are numbered per module, so they are stored alongside the body and
+    renumbered when the body is spliced into another module.
+    """
+    attr_defs = dict(ATTR_DEF_RE.findall(ll_text))
+    meta_defs = dict(META_DEF_RE.findall(ll_text))
+    globals_defs = top_level_definitions(ll_text)
+
+    # Declarations the body uses, and those their initializers use; other
+    # defined functions exist in every target
+    globals_needed = {}
+    pending = list(set(GLOBAL_REF_RE.findall(block)))
+    while pending:
+        name = pending.pop()
+        if name in globals_needed or globals_defs.get(name) is None:
+            continue
+        globals_needed[name] = globals_defs[name]
+        pending.extend(GLOBAL_REF_RE.findall(globals_defs[name]))
+
+    context = block + "\n".join(globals_needed.values())
+    attrs = {num: attr_defs[num] for num in set(ATTR_REF_RE.findall(context)) if num in attr_defs}
+
+    metadata = {}
+    pending = list(set(META_REF_RE.findall(context)))
+    while pending:
+        num = pending.pop()
+        if num in metadata or num not in meta_defs:
+            continue
+        metadata[num] = meta_defs[num]
+        pending.extend(META_REF_RE.findall(meta_defs[num]))
+
+    return {"block": block, "attrs": attrs, "metadata": metadata, "globals": globals_needed}
+
+
+def splice_function(ll_text, name, entry):
+    """Replace function `name` in ll_text with a cached body, renumbering its context"""
+    functions = split_functions(ll_text)
+    if name not in functions:
+        return ll_text
+    start, end = functions[name]
+
+    existing_attrs = dict(ATTR_DEF_RE.findall(ll_text))
+    attr_by_body = {body: num for num, body in existing_attrs.items()}
+    next_attr = max([int(n) for n in existing_attrs] + [-1]) + 1
+    existing_meta = META_DEF_RE.findall(ll_text)
+    next_meta = max([int(n) for n, _ in existing_meta] + [-1]) + 1
+
+    attr_map, appended = {}, []
+    for num, body in entry["attrs"].items():
+        if body in attr_by_body:
+            attr_map[num] = attr_by_body[body]
+        else:
+            attr_map[num] = str(next_attr)
+            attr_by_body[body] = str(next_attr)
+            appended.append(f"attributes #{next_attr} = {body}")
+            next_attr += 1
+
+    meta_map = {}
+    for num in sorted(entry["metadata"], key=int):
+        meta_map[num] = str(next_meta)
+        next_meta += 1
+
+    def renumber(text):
+        text = ATTR_REF_RE.sub(lambda m: "#" + attr_map.get(m.group(1), m.group(1)), text)
+        return META_REF_RE.sub(lambda m: "!" + meta_map.get(m.group(1), m.group(1)), text)
+
+    appended += [f"!{meta_map[num]} = {renumber(body)}" for num, body in entry["metadata"].items()]
+
+    present = top_level_definitions(ll_text)
+    declarations = [
+        renumber(line) for global_name, line in entry["globals"].items()
+        if global_name not in present
+    ]
+
+    block = renumber(entry["block"])
+    ll_text = ll_text[:start] + block + ll_text[end:]
+    if declarations:
+        first_define = ll_text.find("\ndefine ") + 1
+        ll_text = ll_text[:first_define] + "\n".join(declarations) + "\n\n" + ll_text[first_define:]
+    if appended:
+        ll_text = ll_text.rstrip("\n") + "\n\n" + "\n".join(appended) + "\n"
+    return ll_text
+
+
+class FunctionCache:
+    """On-disk cache of obfuscated function bodies keyed by function_key()"""
+
+    def __init__(self, root=None):
+        self.root = Path(root or os.environ.get(
+            "OBF_FUNCTION_CACHE", Path(__file__).parent / "function_cache"))
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def put(self, key, entry):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,195 @@
+import bisect
+import difflib
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# A checkpoint (line number, byte offset) every ~64 KiB: finding any line
+# scans at most one block, and building the index is one newline count per
+# block instead of a Python step per line.
+BLOCK_BYTES = 1 << 16
+
+FUNCTION_NAME = re.compile(rb'@("[^"]+"|[-\w$.]+)\(')
+
+
+class IRIndex:
+    """Line and function offsets of one .ll file, read through a read-only mmap.
+
+    The index is built once when the file is opened; afterwards a page of
+    lines, a function body or a search hit costs only the bytes it touches,
+    so multi-hundred-MB modules are never read into Python memory whole.
+    Line numbers are 0-based.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        stat = self.path.stat()
+        self.signature = (stat.st_size, stat.st_mtime_ns)
+        self.size = stat.st_size
+        with open(self.path, "rb") as f:
+            # mmap refuses empty files; an empty module is just b""
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.checkpoint_lines = [0]
+        self.checkpoint_offsets = [0]
+        self.line_count = 0
+        self.functions = OrderedDict()  # name -> (start offset, end offset)
+        self._index_lines()
+        self._index_functions()
+
+    def _index_lines(self):
+        data, size = self.data, self.size
+        pos = line = 0
+        while pos < size:
+            # Cut blocks at line ends, so every checkpoint starts a line
+            newline = data.find(b"\n", min(pos + BLOCK_BYTES, size) - 1)
+            end = size if newline < 0 else newline + 1
+            line += data[pos:end].count(b"\n")
+            pos = end
+            if pos < size:
+                self.checkpoint_lines.append(line)
+                self.checkpoint_offsets.append(pos)
+        # A last line without a trailing newline still counts
+        self.line_count = line + (1 if size and data[size - 1:size] != b"\n" else 0)
+
+    def _index_functions(self):
+        data, size = self.data, self.size
+        pos = 0 if data[:7] == b"define " else data.find(b"\ndefine ")
+        while pos >= 0:
+            start = pos if data[pos:pos + 1] != b"\n" else pos + 1
+            header_end = data.find(b"\n", start)
+            header = data[start:header_end if header_end >= 0 else size]
+            close = data.find(b"\n}", start)
+            end = size if close < 0 else data.find(b"\n", close + 2)
+            end = size if end < 0 else end + 1
+            match = FUNCTION_NAME.search(header)
+            if match:
+                self.functions[match.group(1).decode("utf-8", "replace").strip('"')] = (start, end)
+            pos = data.find(b"\ndefine ", end - 1)
+
+    # Offsets
+
+    def offset_of_line(self, line):
+        """Byte offset where a line starts (the file size past the last line)"""
+        if line >= self.line_count:
+            return self.size
+        i = bisect.bisect_right(self.checkpoint_lines, line) - 1
+        pos = self.checkpoint_offsets[i]
+        for _ in range(line - self.checkpoint_lines[i]):
+            pos = self.data.find(b"\n", pos) + 1
+        return pos
+
+    def line_of_offset(self, offset):
+        i = bisect.bisect_right(self.checkpoint_offsets, offset) - 1
+        return self.checkpoint_lines[i] + self.data[self.checkpoint_offsets[i]:offset].count(b"\n")
+
+    def _decode(self, start, end):
+        return self.data[start:end].decode("utf-8", "replace").splitlines()
+
+    # Queries
+
+    def lines(self, start, count):
+        """Up to `count` lines from line `start`"""
+        start = max(start, 0)
+        first = self.offset_of_line(start)
+        last = self.offset_of_line(start + count)
+        return self._decode(first, last)
+
+    def function_list(self):
+        """[{name, start_line, lines}] in file order"""
+        listing = []
+        for name, (start, end) in self.functions.items():
+            first = self.line_of_offset(start)
+            listing.append({"name": name, "start_line": first, "lines": self.line_of_offset(end) - first})
+        return listing
+
+    def function_lines(self, name):
+        """Lines of one function definition, or None if the module has no such function"""
+        if name not in self.functions:
+            return None
+        return self._decode(*self.functions[name])
+
+    def search(self, pattern, regex=False, ignore_case=False, start_line=0, limit=100):
+        """Lines matching pattern from start_line on, one hit per line.
+
+        Returns (hits, next_line); next_line resumes the search, or is None
+        when the file has been searched to the end.
+        """
+        flags = re.IGNORECASE if ignore_case else 0
+        compiled = re.compile(pattern.encode("utf-8") if regex else re.escape(pattern.encode("utf-8")), flags)
+        hits = []
+        pos = self.offset_of_line(start_line)
+        while pos < self.size:
+            match = compiled.search(self.data, pos)
+            if match is None:
+                return hits, None
+            line_start = self.data.rfind(b"\n", 0, match.start()) + 1
+            line_end = self.data.find(b"\n", match.start())
+            line_end = self.size if line_end < 0 else line_end
+            line = self.line_of_offset(line_start)
+            if len(hits) == limit:
+                return hits, line
+            hits.append({
+                "line": line,
+                "column": match.start() - line_start,
+                "text": self.data[line_start:line_end].decode("utf-8", "replace"),
+            })
+            pos = line_end + 1
+        return hits, None
+
+
+def diff_function(before, after, name, context=3):
+    """Unified diff of one function between two indexed stages.
+
+    A function missing from a stage diffs as empty, so functions added or
+    removed by a pass show up whole.
+    """
+    old = before.function_lines(name) or []
+    new = after.function_lines(name) or []
+    diff = list(difflib.unified_diff(
+        old, new, fromfile=f"{before.path.stem}:{name}", tofile=f"{after.path.stem}:{name}",
+        n=context, lineterm=""
+    ))
+    body = diff[2:]
+    return {
+        "function": name,
+        "in_before": name in before.functions,
+        "in_after": name in after.functions,
+        "lines_before": len(old),
+        "lines_after": len(new),
+        "added": sum(1 for l in body if l.startswith("+")),
+        "removed": sum(1 for l in body if l.startswith("-")),
+        "diff": diff,
+    }
+
+
+class IRIndexCache:
+    """Recently used IR indexes, rebuilt when their file changes.
+
+    Mapped files are only referenced, never closed on eviction, so a request
+    still reading an evicted index is unaffected; the mapping goes away with
+    the last reference.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or int(os.environ.get("OBF_IR_INDEX_CACHE", 8))
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        path = Path(path).resolve()
+        stat = path.stat()
+        key = str(path)
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is not None and index.signature == (stat.st_size, stat.st_mtime_ns):
+                self.indexes.move_to_end(key)
+                return index
+        index = IRIndex(path)
+        with self.lock:
+            self.indexes[key] = index
+            while len(self.indexes) > self.size:
+                self.indexes.popitem(last=False)
+        return index
@@ -0,0 +1,373 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+backend_dir = Path(__file__).parent.resolve()
+CORPUS_DIR = backend_dir.parent / "test"
+
+# Stand-in for clang/opt/llc/llvm-as/llvm-dis: sleeps, then copies its input
+# (a file argument or stdin) to its -o output so every stage finds a file.
+FAKE_TOOL = '''#!{python}
+import os, sys, time
+time.sleep(float(os.environ.get("OBF_FAKE_TOOL_DELAY", "0.05")))
+args = sys.argv[1:]
+out = args[args.index("-o") + 1] if "-o" in args else "-"
+inputs = [a for i, a in enumerate(args)
+          if os.path.isfile(a) and a != out and (i == 0 or args[i - 1] != "-load-pass-plugin")]
+data = open(inputs[0], "rb").read() if inputs else (sys.stdin.buffer.read() if "-" in args[:-1] else b"")
+if out == "-":
+    sys.stdout.buffer.write(data or b"fake")
+else:
+    with open(out, "wb") as f:
+        f.write(data or b"fake")
+'''
+FAKE_TOOLS = ("clang", "opt", "llc", "llvm-as", "llvm-dis")
+
+GENERATED_FUNCTION = """
+static unsigned fn_{index}(unsigned x) {{
+    unsigned acc = {seed}u;
+    for (unsigned i = 0; i < x % {bound}u + 1; i++) {{
+        switch ((acc ^ i) % 4) {{
+        case 0: acc = acc * 31 + i; break;
+        case 1: acc ^= acc >> 3; break;
+        case 2: acc += {seed}u; break;
+        default: acc = (acc << 1) | (acc >> 31);
+        }}
+    }}
+    return acc;
+}}
+"""
+
+
+def generate_source(index, functions=8):
+    """A deterministic C program with loops, switches and strings for the passes to chew on"""
+    rng = random.Random(index)
+    body = "".join(
+        GENERATED_FUNCTION.format(index=i, seed=rng.randrange(1, 1 << 30), bound=rng.randrange(8, 64))
+        for i in range(functions)
+    )
+    calls = " + ".join(f"fn_{i}((unsigned)argc + {i})" for i in range(functions))
+    return (
+        "#include <stdio.h>\n" + body +
+        f'\nint main(int argc, char **argv) {{\n    printf("generated {index}: %u\\n", {calls});\n    return 0;\n}}\n'
+    )
+
+
+def load_corpus(generated, functions):
+    """(name, source bytes) of test/*.c plus `generated` synthetic programs"""
+    corpus = [(path.name, path.read_bytes()) for path in sorted(CORPUS_DIR.glob("*.c"))]
+    corpus += [(f"generated_{i}.c", generate_source(i, functions).encode()) for i in range(generated)]
+    return corpus
+
+
+def make_fake_toolchain(directory):
+    """Write the fake LLVM tools into directory; returns it for prepending to PATH"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in FAKE_TOOLS:
+        tool = directory / name
+        tool.write_text(FAKE_TOOL.format(python=sys.executable), encoding="utf-8")
+        tool.chmod(0o755)
+    return directory
+
+
+def encode_multipart(fields, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="uploaded_file"; filename="{filename}"\r\n'
+        f'Content-Type: text/x-csrc\r\n\r\n'.encode() + content + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def send_request(url, fields, filename, content, timeout):
+    """POST one job; returns (HTTP status or None, seconds, error text)"""
+    body, content_type = encode_multipart(fields, filename, content)
+    request = urllib.request.Request(f"{url}/obfuscate", data=body, headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status, time.perf_counter() - start, None
+    except urllib.error.HTTPError as e:
+        return e.code, time.perf_counter() - start, e.read().decode(errors="replace")[:200]
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
+
+def process_tree(pid):
+    """pid and all its live descendants, from /proc"""
+    children = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            ppid = int((entry / "stat").read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry.name))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def tree_usage(pid):
+    """(CPU seconds, RSS bytes) summed over the server and its toolchain children"""
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    cpu = rss = 0
+    for member in process_tree(pid):
+        try:
+            fields = Path(f"/proc/{member}/stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+        if member == pid:
+            # children the server already reaped (finished toolchain runs)
+            cpu += (int(fields[13]) + int(fields[14])) / ticks
+        rss += int(fields[21]) * page
+    return cpu, rss
+
+
+class ResourceSampler:
+    """Samples CPU% and RSS of the server's process tree on a background thread"""
+
+    def __init__(self, pid, interval):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="load-test-sampler", daemon=True)
+
+    def _loop(self):
+        start = time.perf_counter()
+        last_cpu, last_time = tree_usage(self.pid)[0], start
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            cpu, rss = tree_usage(self.pid)
+            self.samples.append({
+                "t": round(now - start, 2),
+                "cpu_percent": round((cpu - last_cpu) / (now - last_time) * 100, 1),
+                "rss_mb": round(rss / (1024 * 1024), 1),
+            })
+            last_cpu, last_time = cpu, now
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+def start_server(port, fake_delay=None, env_overrides=None):
+    """Run main:app under uvicorn in a scratch directory; returns the process once /health answers.
+
+    Workspaces, rename maps, run history and the PCH and function caches all
+    live in the scratch directory, so test runs (fake toolchain or not) never
+    touch the real ones. stop_server removes it.
+    """
+    scratch = Path(tempfile.mkdtemp(prefix="obf-load-"))
+    env = dict(
+        os.environ,
+        OBF_WORKSPACE_ROOT=str(scratch / "work"),
+        OBF_SYMBOL_MAP_DIR=str(scratch / "maps"),
+        OBF_RUN_HISTORY=str(scratch / "run_history.db"),
+        OBF_PCH_CACHE=str(scratch / "pch_cache"),
+        OBF_FUNCTION_CACHE=str(scratch / "function_cache"),
+    )
+    if fake_delay is not None:
+        toolchain = make_fake_toolchain(scratch / "bin")
+        env["PATH"] = f"{toolchain}{os.pathsep}{env.get('PATH', '')}"
+        env["OBF_FAKE_TOOL_DELAY"] = str(fake_delay)
+        env["OBF_PASS_HOSTS"] = "0"  # the real pass host would bypass the fake opt
+    env.update(env_overrides or {})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=backend_dir, env=env
+    )
+    process.scratch = scratch
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if process.poll() is not None:
+            stop_server(process)
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError("Server did not become healthy")
+
+
+def stop_server(process):
+    """Stop a server from start_server and remove its scratch directory"""
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    shutil.rmtree(process.scratch, ignore_errors=True)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(int(len(ordered) * q), len(ordered) - 1)] * 1000, 1)
+    return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "max_ms": round(ordered[-1] * 1000, 1), "mean_ms": round(statistics.mean(ordered) * 1000, 1)}
+
+
+def run_load(url, corpus, requests, concurrency, rate=None, fields=None, timeout=600, unique=True):
+    """Send `requests` jobs with at most `concurrency` in flight.
+
+    Without a rate every worker sends its next request as soon as the last
+    one returns (closed loop). With a rate, requests arrive as a Poisson
+    process at `rate` per second regardless of how fast the server answers.
+    Unless `unique` is off, each upload gets a distinct trailing comment so
+    single-flight deduplication doesn't collapse the load.
+    """
+    fields = fields or {}
+    results = []
+    lock = threading.Lock()
+
+    def one(index):
+        name, content = corpus[index % len(corpus)]
+        if unique:
+            content += f"\n/* load-test request {index} */\n".encode()
+        status, seconds, error = send_request(url, fields, name, content, timeout)
+        with lock:
+            results.append({"index": index, "status": status, "seconds": seconds, "error": error})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if rate:
+            rng = random.Random(0)
+            next_arrival = start
+            for index in range(requests):
+                next_arrival += rng.expovariate(rate)
+                time.sleep(max(0.0, next_arrival - time.perf_counter()))
+                pool.submit(one, index)
+        else:
+            list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    ok = [r["seconds"] for r in results if r["status"] == 200]
+    rejected = sum(1 for r in results if r["status"] == 429)
+    failed = [r for r in results if r["status"] not in (200, 429)]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "arrival_rate": rate,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else None,
+        "succeeded": len(ok),
+        "rejected_429": rejected,
+        "errors": len(failed),
+        "error_rate": round(len(failed) / requests, 4) if requests else 0,
+        "latency": percentiles(ok),
+        "sample_errors": [r["error"] or f"HTTP {r['status']}" for r in failed[:5]],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the /obfuscate endpoint")
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="PID to sample CPU/RSS from when using --url")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the server this script starts")
+    parser.add_argument("--requests", type=int, default=50, help="Total requests to send")
+    parser.add_argument("--concurrency", type=int, action="append",
+                        help="Max in-flight requests (repeatable to sweep levels; default 4)")
+    parser.add_argument("--rate", type=float, help="Open-loop arrival rate in requests/s (default: closed loop)")
+    parser.add_argument("--generated", type=int, default=8, help="Synthetic sources to add to test/*.c")
+    parser.add_argument("--functions", type=int, default=8, help="Functions per synthetic source")
+    parser.add_argument("--techniques", default='["cfflatten", "opaque-preds", "bogus-instructions"]',
+                        help="techniques form field (JSON list)")
+    parser.add_argument("--field", action="append", default=[], help="Extra form field, e.g. streaming=true")
+    parser.add_argument("--no-unique", action="store_true", help="Send identical sources (exercises single-flight)")
+    parser.add_argument("--fake-toolchain", type=float, metavar="SECONDS",
+                        help="Replace clang/opt/llc with fakes that sleep this long (tests the web/queue layer)")
+    parser.add_argument("--max-running", type=int, help="OBF_MAX_RUNNING_JOBS for the started server")
+    parser.add_argument("--max-queued", type=int, help="OBF_MAX_QUEUED_JOBS for the started server")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Seconds between CPU/RSS samples")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    fields = {"techniques": args.techniques}
+    for field in args.field:
+        name, _, value = field.partition("=")
+        fields[name] = value
+
+    server = None
+    if args.url:
+        url, pid = args.url.rstrip("/"), args.server_pid
+    else:
+        overrides = {}
+        if args.max_running:
+            overrides["OBF_MAX_RUNNING_JOBS"] = str(args.max_running)
+        if args.max_queued is not None:
+            overrides["OBF_MAX_QUEUED_JOBS"] = str(args.max_queued)
+        server, url = start_server(args.port, args.fake_toolchain, overrides)
+        pid = server.pid
+
+    corpus = load_corpus(args.generated, args.functions)
+    runs = []
+    try:
+        for concurrency in args.concurrency or [4]:
+            sampler = ResourceSampler(pid, args.sample_interval) if pid and Path("/proc").exists() else None
+            if sampler:
+                sampler.start()
+            result = run_load(url, corpus, args.requests, concurrency, args.rate, fields, unique=not args.no_unique)
+            samples = sampler.stop() if sampler else []
+            result["server"] = {
+                "peak_cpu_percent": max((s["cpu_percent"] for s in samples), default=None),
+                "peak_rss_mb": max((s["rss_mb"] for s in samples), default=None),
+                "timeline": samples,
+            }
+            runs.append(result)
+    finally:
+        if server:
+            stop_server(server)
+
+    report = {"url": url, "corpus": len(corpus), "fake_toolchain": args.fake_toolchain, "runs": runs}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    print(f"Corpus: {len(corpus)} sources" + (f", fake toolchain {args.fake_toolchain}s/tool" if args.fake_toolchain else ""))
+    for run in runs:
+        lat, srv = run["latency"], run["server"]
+        print(f"concurrency {run['concurrency']}" + (f", {run['arrival_rate']} req/s" if run["arrival_rate"] else "") +
+              f": {run['throughput_rps']} req/s, {run['succeeded']} ok, {run['rejected_429']} rejected, "
+              f"{run['errors']} errors ({run['error_rate']:.1%})")
+        if lat:
+            print(f"  latency p50 {lat['p50_ms']} ms  p95 {lat['p95_ms']} ms  p99 {lat['p99_ms']} ms  max {lat['max_ms']} ms")
+        if srv["timeline"]:
+            print(f"  server peak CPU {srv['peak_cpu_percent']}%  peak RSS {srv['peak_rss_mb']} MB")
+        for error in run["sample_errors"]:
+            print(f"  ❌ {error}")
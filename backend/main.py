@@ -1,15 +1,32 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from urllib.parse import unquote
 from pathlib import Path
 import shutil
 import os
+import asyncio
 import uuid
 import json
+import re
+import codecs
+import secrets
+from typing import List
 
-from obfuscate import obfuscate_code
+from obfuscate import (
+    obfuscate_code, artifact_store, run_history, pass_host_pool, symbol_maps, pch_cache, find_cached_result,
+    find_source
+)
+from admission import AdmissionController, QueueFull
+from run_advanced_obfuscation import abi_families
+from single_flight import SingleFlight, job_key
+from resource_limits import LimitExceeded
+from protections import ANTI_DEBUG_MODES, OPT_LEVELS
+from streaming import STREAM_ARTIFACTS
+from symbolize import symbolize_line
+from ir_index import IRIndexCache, diff_function
+from distributed import Coordinator, LeaseLost, UnknownWorker
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -31,12 +48,68 @@ app.add_middleware(
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-def generate_pdf_report(json_report_path, pdf_output_path):
+# Bounds concurrent and queued obfuscation jobs (OBF_MAX_RUNNING_JOBS / OBF_MAX_QUEUED_JOBS)
+admission = AdmissionController()
+
+# Identical concurrent requests share one pipeline execution
+single_flight = SingleFlight()
+
+# Cross-compilation targets a job may request, e.g. aarch64-linux-gnu
+TARGET_TRIPLE = re.compile(r"[A-Za-z0-9_.]+(-[A-Za-z0-9_.]+){1,3}")
+MAX_TARGETS = 4
+
+# Line/function indexes of recently viewed IR files (OBF_IR_INDEX_CACHE)
+ir_indexes = IRIndexCache()
+
+# With OBF_DISTRIBUTED=1 jobs run on worker nodes (python distributed.py <this URL>), not inline
+coordinator = Coordinator() if os.environ.get("OBF_DISTRIBUTED", "0") == "1" else None
+
+# Shared secret workers send as X-Worker-Token. Workers receive uploaded sources and
+# supply the artifacts clients download, so distributed mode doesn't start without one.
+WORKER_TOKEN = os.environ.get("OBF_WORKER_TOKEN", "")
+if coordinator and not WORKER_TOKEN:
+    raise RuntimeError("OBF_DISTRIBUTED=1 requires OBF_WORKER_TOKEN, the secret workers authenticate with")
+
+@app.on_event("startup")
+async def start_artifact_sweeper():
+    # Keep temp_work bounded by TTL and quota (OBF_ARTIFACT_TTL / OBF_ARTIFACT_QUOTA_MB)
+    artifact_store.sweep()
+    artifact_store.start_sweeper()
+
+@app.on_event("shutdown")
+async def stop_artifact_sweeper():
+    artifact_store.stop_sweeper()
+
+@app.on_event("startup")
+async def start_pass_hosts():
+    # Keep opt hosts warm and replace dead ones (OBF_PASS_HOSTS / OBF_PASS_HOST_HEALTH_INTERVAL)
+    if pass_host_pool:
+        pass_host_pool.check_health()
+        pass_host_pool.start_health_checks()
+
+@app.on_event("shutdown")
+async def stop_pass_hosts():
+    if pass_host_pool:
+        pass_host_pool.shutdown()
+
+@app.on_event("startup")
+async def start_worker_reaper():
+    # Requeue jobs of workers that miss heartbeats (OBF_WORKER_TIMEOUT)
+    if coordinator:
+        coordinator.start_reaper()
+
+@app.on_event("shutdown")
+async def stop_worker_reaper():
+    if coordinator:
+        coordinator.stop_reaper()
+
+def generate_pdf_report(json_report_path, pdf_output_path, report_data=None):
     """Generate a PDF report from the JSON obfuscation report"""
     
-    # Load JSON report
-    with open(json_report_path, 'r', encoding='utf-8') as f:
-        report_data = json.load(f)
+    # Load JSON report unless it was passed in directly
+    if report_data is None:
+        with open(json_report_path, 'r', encoding='utf-8') as f:
+            report_data = json.load(f)
     
     # Create PDF document
     doc = SimpleDocTemplate(pdf_output_path, pagesize=letter)
@@ -225,60 +298,223 @@ def generate_pdf_report(json_report_path, pdf_output_path):
     doc.build(story)
     return True
 
+def parse_job_options(techniques, keep_loops, opaque_budget, opt_level, artifacts,
+                      anti_debug_mode="", anti_debug_every=0, anti_debug_seconds=0, targets=""):
+    """Validate the job options shared by /obfuscate and its preflight.
+
+    Returns (selected techniques, pass options, requested artifacts, target
+    triples) and raises ValueError with a message for the client.
+    """
+    try:
+        selected_techniques = json.loads(techniques)
+    except:
+        selected_techniques = []
+
+    # keep-loops leaves loop back-edges out of the flattening dispatcher
+    pass_options = {"cfflatten": "keep-loops"} if keep_loops else {}
+    # Per-block opaque predicate cost budget, in tenths of a cycle
+    if opaque_budget > 0:
+        pass_options["opaque-preds"] = f"budget={opaque_budget}"
+    # Where anti-debug checks run: startup (default), sampled or cold
+    if anti_debug_mode:
+        if anti_debug_mode not in ANTI_DEBUG_MODES:
+            raise ValueError(f"anti_debug_mode must be one of {', '.join(ANTI_DEBUG_MODES)}")
+        option = f"mode={anti_debug_mode}"
+        if anti_debug_mode == "sampled":
+            if anti_debug_every > 0:
+                option += f";every={anti_debug_every}"
+            if anti_debug_seconds > 0:
+                option += f";seconds={anti_debug_seconds}"
+        pass_options["anti-debug"] = option
+    if opt_level not in OPT_LEVELS:
+        raise ValueError(f"opt_level must be one of {', '.join(OPT_LEVELS)}")
+
+    # Streaming writes only these artifacts, e.g. "exe,llvm_ir" (default)
+    requested = sorted({a.strip() for a in artifacts.split(",") if a.strip()})
+    unknown = [a for a in requested if a not in STREAM_ARTIFACTS]
+    if unknown:
+        raise ValueError(f"Unknown artifacts {', '.join(unknown)}; choose from {', '.join(STREAM_ARTIFACTS)}")
+
+    # Target triples, e.g. "x86_64-linux-gnu,aarch64-linux-gnu"; empty builds for the host
+    triples = list(dict.fromkeys(t.strip() for t in targets.split(",") if t.strip()))
+    invalid = [t for t in triples if not TARGET_TRIPLE.fullmatch(t)]
+    if invalid:
+        raise ValueError(f"Invalid target triples: {', '.join(invalid)}")
+    if len(triples) > MAX_TARGETS:
+        raise ValueError(f"At most {MAX_TARGETS} targets per job")
+    return selected_techniques, pass_options, requested, triples
+
+def obfuscation_response(result, deduplicated=False, cached=False):
+    return {
+        "message": "Obfuscation successful!",
+        "job_id": result["job_id"],
+        "exe": result["exe"],
+        "ll": result["llvm_ir"],
+        "io": result.get("io"),
+        "symbol_map": result.get("symbol_map"),
+        "report": result["report"],
+        "advanced_report": result.get("advanced_report"),
+        "metrics": result.get("metrics", {}),
+        "incremental": result.get("incremental"),
+        "post_optimization": result.get("post_optimization"),
+        "size_optimization": result.get("size_optimization"),
+        "targets": result.get("targets"),
+        "frontend": result.get("frontend"),
+        "deduplicated": deduplicated,
+        "cached": cached,
+        "success": True
+    }
+
+@app.post("/obfuscate/preflight")
+async def obfuscate_preflight(
+    content_hash: str = Form(...),
+    techniques: str = Form("[]"),
+    seed: int = Form(0),
+    keep_loops: bool = Form(False),
+    opaque_budget: int = Form(0),
+    opt_level: str = Form("O0"),
+    streaming: bool = Form(False),
+    artifacts: str = Form(""),
+    size_optimize: bool = Form(False),
+    anti_debug_mode: str = Form(""),
+    anti_debug_every: int = Form(0),
+    anti_debug_seconds: int = Form(0),
+    targets: str = Form(""),
+    ordered: bool = Form(False),
+    incremental: bool = Form(False)
+):
+    """Check by SHA-256 whether a source has to be uploaded at all.
+
+    "completed": an identical job already finished and its artifacts are
+    still here, so its result comes back without running anything.
+    "source_known": the server has the source, so /obfuscate can be called
+    with content_hash instead of a file. "upload_required" otherwise.
+    """
+    try:
+        selected_techniques, pass_options, requested, triples = parse_job_options(
+            techniques, keep_loops, opaque_budget, opt_level, artifacts,
+            anti_debug_mode, anti_debug_every, anti_debug_seconds, targets
+        )
+    except ValueError as e:
+        return JSONResponse({"error": str(e), "success": False}, status_code=400)
+
+    content_hash = content_hash.strip().lower()
+    cached = find_cached_result(content_hash, selected_techniques, seed, pass_options, opt_level, streaming,
+                                requested or None, size_optimize, triples, ordered, incremental)
+    if cached:
+        return {"status": "completed", **obfuscation_response(cached, cached=True)}
+    if find_source(content_hash):
+        return {"status": "source_known", "success": True}
+    return {"status": "upload_required", "success": True}
+
 @app.post("/obfuscate")
 async def obfuscate(
-    uploaded_file: UploadFile = File(...),
-    techniques: str = Form("[]")
+    uploaded_file: UploadFile = File(None),
+    content_hash: str = Form(""),
+    filename: str = Form(""),
+    techniques: str = Form("[]"),
+    seed: int = Form(0),
+    incremental: bool = Form(False),
+    keep_loops: bool = Form(False),
+    opaque_budget: int = Form(0),
+    opt_level: str = Form("O0"),
+    streaming: bool = Form(False),
+    artifacts: str = Form(""),
+    size_optimize: bool = Form(False),
+    anti_debug_mode: str = Form(""),
+    anti_debug_every: int = Form(0),
+    anti_debug_seconds: int = Form(0),
+    targets: str = Form(""),
+    ordered: bool = Form(False)
 ):
     try:
+        if uploaded_file is not None:
+            filename = uploaded_file.filename
+            content = await uploaded_file.read()
+        else:
+            # Preflight said the server has this source, so the client skipped the upload
+            source = find_source(content_hash.strip().lower()) if content_hash else None
+            if source is None:
+                return JSONResponse({
+                    "error": "Source is not on the server; upload the file",
+                    "upload_required": True,
+                    "success": False
+                }, status_code=409)
+            content = Path(source).read_bytes()
+            filename = filename or Path(source).name
+
         # Validate file type
-        if not uploaded_file.filename.lower().endswith(('.c', '.cpp')):
+        if not filename.lower().endswith(('.c', '.cpp')):
             return JSONResponse({
                 "error": "Only C/C++ files are supported",
                 "success": False
             }, status_code=400)
 
-        # Parse selected techniques
         try:
-            selected_techniques = json.loads(techniques)
-        except:
-            selected_techniques = []
+            selected_techniques, pass_options, requested, triples = parse_job_options(
+                techniques, keep_loops, opaque_budget, opt_level, artifacts,
+                anti_debug_mode, anti_debug_every, anti_debug_seconds, targets
+            )
+        except ValueError as e:
+            return JSONResponse({"error": str(e), "success": False}, status_code=400)
 
-        # Generate unique filename to avoid conflicts
-        file_extension = Path(uploaded_file.filename).suffix
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        
-        # Save uploaded file to backend/uploads
-        input_path = UPLOAD_DIR / unique_filename
-        with open(input_path, "wb") as f:
-            shutil.copyfileobj(uploaded_file.file, f)
+        key = job_key(content, selected_techniques, seed, incremental, keep_loops, opaque_budget, opt_level,
+                      streaming, tuple(requested), size_optimize, pass_options.get("anti-debug"), tuple(triples),
+                      tuple(selected_techniques) if ordered else None)
+
+        # Only a new leader job needs a slot; rejected jobs never touch the disk
+        if not single_flight.is_inflight(key):
+            (coordinator or admission).check()
 
-        print(f"Processing: {uploaded_file.filename}")
+        file_extension = Path(filename).suffix
+
+        async def run_job():
+            if coordinator:
+                return await coordinator.run(content, filename, {
+                    "selected_techniques": selected_techniques, "seed": seed, "incremental": incremental,
+                    "pass_options": pass_options, "opt_level": opt_level, "streaming": streaming,
+                    "keep_artifacts": requested or None, "size_optimize": size_optimize,
+                    "targets": triples or None, "ordered": ordered,
+                })
+            # Generate unique filename to avoid conflicts
+            input_path = UPLOAD_DIR / f"{uuid.uuid4()}{file_extension}"
+            input_path.write_bytes(content)
+            try:
+                # One slot per target pipeline the job runs at once (one per ABI family)
+                workers = min(len(abi_families(triples)), admission.max_running) if triples else 1
+                # Run obfuscation pipeline with selected techniques
+                return await admission.run(obfuscate_code, str(input_path), selected_techniques, seed, incremental,
+                                           pass_options, opt_level, streaming, requested or None,
+                                           size_optimize, triples or None, ordered,
+                                           slots=workers, target_workers=workers)
+            finally:
+                # Clean up uploaded file
+                input_path.unlink(missing_ok=True)
+
+        print(f"Processing: {filename}")
         print(f"Selected techniques: {selected_techniques}")
-        
-        # Run obfuscation pipeline with selected techniques
-        result = obfuscate_code(str(input_path), selected_techniques)
 
-        # Clean up uploaded file
-        input_path.unlink(missing_ok=True)
+        result, shared = await single_flight.run(key, run_job)
 
         # Return results
+        return JSONResponse(obfuscation_response(result, deduplicated=shared))
+
+    except QueueFull as e:
+        return JSONResponse({
+            "error": str(e),
+            "success": False
+        }, status_code=429, headers={"Retry-After": str(e.retry_after)})
+
+    except LimitExceeded as e:
+        print(f"Job killed: {e}")
         return JSONResponse({
-            "message": "Obfuscation successful!",
-            "exe": result["exe"],
-            "ll": result["llvm_ir"],
-            "report": result["report"],
-            "advanced_report": result.get("advanced_report"),
-            "metrics": result.get("metrics", {}),
-            "success": True
-        })
+            "error": str(e),
+            "limit_violation": e.to_dict(),
+            "success": False
+        }, status_code=422)
 
     except Exception as e:
         print(f"Error: {e}")
-        # Clean up on error
-        if 'input_path' in locals():
-            input_path.unlink(missing_ok=True)
-            
         return JSONResponse({
             "error": str(e),
             "success": False
@@ -292,6 +528,8 @@ async def download_file(path: str):
         
         if not file_path.exists():
             raise HTTPException(status_code=404, detail=f"File not found: {decoded_path}")
+        
+        artifact_store.touch(file_path)
             
         filename = file_path.name
         
@@ -316,29 +554,26 @@ async def download_file(path: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/generate-pdf")
-async def generate_pdf():
-    """Generate PDF report from the latest obfuscation report"""
+async def generate_pdf(job_id: str = None):
+    """Generate PDF report for a job, defaulting to the latest successful run"""
     try:
-        # Look for the latest report.json in the current directory
-        report_path = Path("report.json")
-        
-        if not report_path.exists():
-            # Try to find any JSON report file
-            json_files = list(Path(".").glob("*.json"))
-            if not json_files:
-                raise HTTPException(
-                    status_code=404, 
-                    detail="No obfuscation report found. Please run obfuscation first."
-                )
-            report_path = json_files[0]
+        run = run_history.get(job_id) if job_id else run_history.latest()
+        if run is None or not run["report"]:
+            raise HTTPException(
+                status_code=404, 
+                detail="No obfuscation report found. Please run obfuscation first."
+            )
+        job_id = run["job_id"]
+        if not artifact_store.job_dir(job_id).exists():
+            raise HTTPException(status_code=410, detail=f"Artifacts for job {job_id} have been evicted")
         
-        # Generate PDF
-        pdf_filename = "obfuscation_report.pdf"
-        pdf_path = Path(pdf_filename)
+        # Generate PDF next to the report so it is evicted with the job
+        pdf_path = artifact_store.job_dir(job_id) / "obfuscation_report.pdf"
         
-        success = generate_pdf_report(str(report_path), str(pdf_path))
+        success = generate_pdf_report(None, str(pdf_path), report_data=run["report"])
         
         if success and pdf_path.exists():
+            artifact_store.add_artifact(job_id, "pdf", pdf_path)
             return JSONResponse({
                 "message": "PDF report generated successfully",
                 "pdf_path": str(pdf_path),
@@ -350,12 +585,234 @@ async def generate_pdf():
                 detail="Failed to generate PDF report"
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/runs")
+async def list_runs(limit: int = 20):
+    """Most recent runs, newest first"""
+    return {"runs": run_history.recent(limit)}
+
+@app.get("/runs/by-hash/{content_hash}")
+async def get_run_by_hash(content_hash: str):
+    """Latest successful run for a source content hash (SHA-256)"""
+    run = run_history.latest_by_hash(content_hash)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"No run found for hash {content_hash}")
+    return run
+
+@app.get("/runs/{job_id}")
+async def get_run(job_id: str):
+    """Report, metrics, timings and artifact paths for one job"""
+    run = run_history.get(job_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Run not found: {job_id}")
+    return run
+
+@app.get("/analytics/trends")
+async def run_trends(last: int = 50):
+    """Per-pass timing averages and run outcomes over the last N runs"""
+    return {
+        "last_runs": last,
+        "pass_times": run_history.pass_time_trends(last),
+        "status": run_history.status_counts(last)
+    }
+
+def load_symbol_map(build_id):
+    try:
+        mapping = symbol_maps.get(build_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if mapping is None:
+        raise HTTPException(status_code=404, detail=f"No symbol map for build {build_id}")
+    return mapping
+
+@app.post("/symbolize/{build_id}")
+async def symbolize_frames(build_id: str, frames: List[str] = Body(..., embed=True)):
+    """De-obfuscate a batch of stack frames from one build's binary"""
+    mapping = load_symbol_map(build_id)
+    symbolized, resolved, unresolved = [], 0, 0
+    for frame in frames:
+        frame, hits, misses = symbolize_line(frame, mapping)
+        symbolized.append(frame)
+        resolved += hits
+        unresolved += misses
+    return {"build_id": build_id, "frames": symbolized, "resolved": resolved, "unresolved": unresolved}
+
+@app.post("/symbolize/{build_id}/stream")
+async def symbolize_stream(build_id: str, request: Request):
+    """De-obfuscate a log of any size sent as the raw request body, streaming lines back"""
+    mapping = load_symbol_map(build_id)
+
+    async def symbolized_lines():
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        async for chunk in request.stream():
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split("\n")
+            if lines:
+                yield "".join(symbolize_line(line + "\n", mapping)[0] for line in lines)
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield symbolize_line(pending, mapping)[0]
+
+    return StreamingResponse(symbolized_lines(), media_type="text/plain; charset=utf-8")
+
+# IR viewer. These handlers are plain functions so FastAPI runs them in its
+# threadpool: indexing a large module must not block the event loop.
+
+MAX_IR_PAGE = 2000
+
+def ir_stage_path(job_id, stage):
+    if not re.fullmatch(r"[0-9A-Za-z_-]+", job_id) or not re.fullmatch(r"[0-9A-Za-z_.-]+", stage):
+        raise HTTPException(status_code=400, detail="Invalid job ID or stage")
+    path = artifact_store.job_dir(job_id) / f"{stage}.ll"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"No IR stage {stage} for job {job_id}")
+    return path
+
+def stage_order(path):
+    # pass_2 before pass_10; named stages (input, final, ...) sort by name after them
+    match = re.fullmatch(r"pass_(\d+)", path.stem)
+    return (0, int(match.group(1)), "") if match else (1, 0, path.stem)
+
+@app.get("/ir/{job_id}/stages")
+def list_ir_stages(job_id: str):
+    """IR files a job left in its workspace, in pass order"""
+    if not re.fullmatch(r"[0-9A-Za-z_-]+", job_id) or not artifact_store.job_dir(job_id).is_dir():
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    paths = sorted(artifact_store.job_dir(job_id).glob("*.ll"), key=stage_order)
+    return {"job_id": job_id, "stages": [{"stage": p.stem, "bytes": p.stat().st_size} for p in paths]}
+
+@app.get("/ir/{job_id}/diff")
+def diff_ir_function(job_id: str, before: str, after: str, function: str, context: int = 3):
+    """Unified diff of one function between two stages, e.g. before=pass_0&after=pass_3"""
+    old = ir_indexes.get(ir_stage_path(job_id, before))
+    new = ir_indexes.get(ir_stage_path(job_id, after))
+    if function not in old.functions and function not in new.functions:
+        raise HTTPException(status_code=404, detail=f"Function {function} is in neither stage")
+    return {"job_id": job_id, "before": before, "after": after, **diff_function(old, new, function, max(context, 0))}
+
+@app.get("/ir/{job_id}/{stage}")
+def read_ir_lines(job_id: str, stage: str, start: int = 0, count: int = 200):
+    """One page of an IR file; `next` is the start of the following page or null"""
+    index = ir_indexes.get(ir_stage_path(job_id, stage))
+    start = max(start, 0)
+    count = min(max(count, 1), MAX_IR_PAGE)
+    end = min(start + count, index.line_count)
+    return {
+        "stage": stage, "start": start, "total_lines": index.line_count, "bytes": index.size,
+        "lines": index.lines(start, count), "next": end if end < index.line_count else None
+    }
+
+@app.get("/ir/{job_id}/{stage}/functions")
+def list_ir_functions(job_id: str, stage: str, offset: int = 0, limit: int = 500):
+    """Functions defined in a stage with their first line and length"""
+    functions = ir_indexes.get(ir_stage_path(job_id, stage)).function_list()
+    offset = max(offset, 0)
+    return {"stage": stage, "total": len(functions), "functions": functions[offset:offset + max(limit, 1)]}
+
+@app.get("/ir/{job_id}/{stage}/functions/{name}")
+def read_ir_function(job_id: str, stage: str, name: str, start: int = 0, count: int = MAX_IR_PAGE):
+    """One page of a single function's body"""
+    lines = ir_indexes.get(ir_stage_path(job_id, stage)).function_lines(name)
+    if lines is None:
+        raise HTTPException(status_code=404, detail=f"Function {name} not found in {stage}")
+    start = max(start, 0)
+    end = start + min(max(count, 1), MAX_IR_PAGE)
+    return {
+        "stage": stage, "function": name, "start": start, "total_lines": len(lines),
+        "lines": lines[start:end], "next": end if end < len(lines) else None
+    }
+
+@app.get("/ir/{job_id}/{stage}/search")
+def search_ir(job_id: str, stage: str, q: str, regex: bool = False, ignore_case: bool = False,
+              start: int = 0, limit: int = 100):
+    """Matching lines of a stage; pass `next` back as `start` for more hits"""
+    index = ir_indexes.get(ir_stage_path(job_id, stage))
+    try:
+        hits, next_line = index.search(q, regex, ignore_case, max(start, 0), min(max(limit, 1), 1000))
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid pattern: {e}")
+    return {"stage": stage, "query": q, "hits": hits, "next": next_line}
+
+# Worker protocol (distributed.CoordinatorClient is the other side)
+
+def authorize_worker(request):
+    if coordinator is None:
+        raise HTTPException(status_code=503, detail="Distributed mode is off (OBF_DISTRIBUTED=1)")
+    if not secrets.compare_digest(request.headers.get("X-Worker-Token", ""), WORKER_TOKEN):
+        raise HTTPException(status_code=403, detail="Bad worker token")
+
+def worker_call(request, call):
+    """Run a coordinator call for a worker, mapping its errors to HTTP statuses"""
+    authorize_worker(request)
+    try:
+        return call()
+    except UnknownWorker:
+        raise HTTPException(status_code=404, detail="Unknown worker; register again")
+    except LeaseLost:
+        raise HTTPException(status_code=409, detail="Job is no longer assigned to this worker")
+
+@app.post("/workers/register")
+def register_worker(request: Request, info: dict = Body(...)):
+    return worker_call(request, lambda: coordinator.register(info.get("name", "worker"), info.get("slots", 1),
+                                                             info.get("cpus", 1)))
+
+@app.post("/workers/{worker_id}/heartbeat")
+def worker_heartbeat(request: Request, worker_id: str, info: dict = Body(...)):
+    worker_call(request, lambda: coordinator.heartbeat(worker_id, info.get("load", 0.0)))
+    return {"ok": True}
+
+@app.post("/workers/{worker_id}/lease")
+async def lease_job(request: Request, worker_id: str, wait: float = 10):
+    # Long poll on the event loop, so idle workers don't tie up threadpool threads
+    authorize_worker(request)
+    try:
+        job = await coordinator.lease_async(worker_id, min(max(wait, 0), 30))
+    except UnknownWorker:
+        raise HTTPException(status_code=404, detail="Unknown worker; register again")
+    return job if job else Response(status_code=204)
+
+@app.get("/workers/{worker_id}/jobs/{job_id}/source")
+def job_source(request: Request, worker_id: str, job_id: str):
+    content = worker_call(request, lambda: coordinator.source(worker_id, job_id))
+    return Response(content, media_type="application/octet-stream")
+
+@app.put("/workers/{worker_id}/jobs/{job_id}/artifacts")
+async def upload_job_artifact(request: Request, worker_id: str, job_id: str, kind: str, name: str):
+    data = await request.body()
+    await asyncio.to_thread(worker_call, request,
+                            lambda: coordinator.store_artifact(worker_id, job_id, kind, name, data))
+    return {"ok": True}
+
+@app.post("/workers/{worker_id}/jobs/{job_id}/complete")
+def complete_job(request: Request, worker_id: str, job_id: str, result: dict = Body(...)):
+    worker_call(request, lambda: coordinator.complete(worker_id, job_id, result))
+    return {"ok": True}
+
+@app.post("/workers/{worker_id}/jobs/{job_id}/fail")
+def fail_job(request: Request, worker_id: str, job_id: str, info: dict = Body(...)):
+    worker_call(request, lambda: coordinator.fail(worker_id, job_id, info.get("error", "Worker failed"),
+                                                  info.get("limit_violation")))
+    return {"ok": True}
+
+@app.post("/workers/{worker_id}/jobs/{job_id}/release")
+def release_job(request: Request, worker_id: str, job_id: str, info: dict = Body(...)):
+    worker_call(request, lambda: coordinator.release(worker_id, job_id, info.get("error", "Worker released the job")))
+    return {"ok": True}
+
+@app.get("/workers")
+def list_workers():
+    if coordinator is None:
+        return {"distributed": False}
+    return {"distributed": True, **coordinator.stats()}
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "LLVM Obfuscation API is running"}
+    return {"status": "healthy", "message": "LLVM Obfuscation API is running", "queue": coordinator.stats() if coordinator else admission.stats(), "single_flight": single_flight.stats(), "artifacts": artifact_store.stats(), "pass_hosts": pass_host_pool.stats() if pass_host_pool else None, "pch_cache": pch_cache.stats() if pch_cache else None}
 
 @app.get("/")
 async def root():
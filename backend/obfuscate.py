@@ -3,51 +3,116 @@ import shutil
 import os
 import sys
 import json
+import hashlib
 
 backend_dir = Path(__file__).parent
 sys.path.insert(0, str(backend_dir))
 
 from run_advanced_obfuscation import AdvancedObfuscationPipeline
+from resource_limits import LimitExceeded
+from artifact_store import ArtifactStore
+from run_history import RunHistory
+from pass_host import create_pool
+from symbolize import SymbolMapStore
+from streaming import DEFAULT_STREAM_ARTIFACTS
+from pch_cache import create_pch_cache
 
-def find_latest_ll_file(work_dir: Path) -> str:
-    """Find the latest LLVM IR file in the working directory"""
-    # List all LL files in work_dir
-    ll_files = list(work_dir.glob("*.ll"))
-    
-    # Also check current directory (backend) in case files were created there
-    current_dir = Path.cwd()
-    if current_dir != work_dir:
-        current_ll_files = list(current_dir.glob("*.ll"))
-        ll_files.extend(current_ll_files)
-    
-    if not ll_files:
-        return None
-    
-    # Try to find pass_7.ll specifically (final pass)
-    for ll_file in ll_files:
-        if ll_file.name == "pass_7.ll":
-            return str(ll_file)
-    
-    # If pass_7.ll doesn't exist, find the highest numbered pass file
-    def get_pass_number(ll_file):
-        try:
-            return int(ll_file.stem.split('_')[1])
-        except:
-            return -1
-    
-    # Sort by pass number and get the highest
-    sorted_ll_files = sorted(ll_files, key=get_pass_number)
-    latest_ll = sorted_ll_files[-1] if sorted_ll_files else None
-    
-    if latest_ll:
-        return str(latest_ll)
-    
+# Every job works in its own directory under temp_work; the store bounds disk usage.
+# OBF_WORKSPACE_ROOT moves the workspaces, e.g. to tmpfs with /dev/shm/obfusca.
+artifact_store = ArtifactStore(os.environ.get("OBF_WORKSPACE_ROOT") or backend_dir / "temp_work")
+
+# Indexed history of every run's report, metrics, timings and artifacts (OBF_RUN_HISTORY moves it)
+run_history = RunHistory(os.environ.get("OBF_RUN_HISTORY") or backend_dir / "run_history.db")
+
+# Persistent opt hosts shared by all jobs; None falls back to spawning opt per pass
+pass_host_pool = create_pool()
+
+# Rename maps by build (job) ID, kept past workspace eviction for crash symbolization
+symbol_maps = SymbolMapStore()
+
+# Precompiled standard headers shared by C++ jobs; None with OBF_PCH=0
+pch_cache = create_pch_cache()
+
+def load_report(report_path):
+    """Load a JSON report, or return {} if it is missing or unreadable"""
+    if not report_path or not Path(report_path).exists():
+        return {}
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Could not read report: {e}")
+        return {}
+
+def find_source(content_hash):
+    """Path of a source with this SHA-256 kept in a past job's workspace, or None"""
+    for run in run_history.runs_by_hash(content_hash):
+        path = (run["artifacts"] or {}).get("source")
+        if path and Path(path).exists():
+            return path
+    return None
+
+def find_cached_result(content_hash, techniques, seed=0, pass_options=None, opt_level="O0",
+                       streaming=False, keep_artifacts=None, size_optimize=False, targets=None, ordered=False,
+                       incremental=False):
+    """Result of an earlier successful job with the same source and options, or None.
+
+    Only runs whose artifacts are all still on disk qualify, so the answer can
+    be served without running the pipeline.
+    """
+    wanted = set(keep_artifacts or DEFAULT_STREAM_ARTIFACTS) if streaming else {"exe", "llvm_ir"}
+    for run in run_history.runs_by_hash(content_hash):
+        metadata = (run["report"] or {}).get("metadata", {})
+        same_job = (
+            run["techniques"] == sorted(set(techniques or []))
+            and metadata.get("seed", 0) == int(seed or 0)
+            and metadata.get("incremental", False) == incremental
+            and metadata.get("opt_level", "O0") == opt_level
+            and metadata.get("pass_options", {}) == (pass_options or {})
+            and metadata.get("streaming", False) == streaming
+            and metadata.get("size_optimize", False) == size_optimize
+            and metadata.get("targets", []) == list(dict.fromkeys(targets or []))
+            # ordered runs must match the order too; unordered ones never recorded one
+            and metadata.get("pass_order") == (list(dict.fromkeys(techniques or [])) if ordered and techniques else None)
+        )
+        artifacts = run["artifacts"] or {}
+        if not same_job or not wanted <= set(artifacts):
+            continue
+        if not all(Path(path).exists() for path in artifacts.values()):
+            continue
+        for path in artifacts.values():
+            artifact_store.touch(path)
+        report = run["report"] or {}
+        return {
+            "job_id": run["job_id"],
+            "exe": artifacts.get("exe"),
+            "report": artifacts.get("report"),
+            "llvm_ir": artifacts.get("llvm_ir"),
+            "symbol_map": artifacts.get("symbol_map"),
+            "bitcode": artifacts.get("bitcode"),
+            "object": artifacts.get("object"),
+            "metrics": run["metrics"] or {},
+            "summary": report.get("summary", {}),
+            "incremental": report.get("incremental"),
+            "post_optimization": report.get("post_optimization"),
+            "io": report.get("io"),
+            "size_optimization": report.get("size_optimization"),
+            "targets": report.get("targets"),
+            "frontend": report.get("frontend"),
+        }
     return None
 
-def obfuscate_code(input_file_path: str, selected_techniques: list = None) -> dict:
+def obfuscate_code(input_file_path: str, selected_techniques: list = None, seed: int = 0,
+                   incremental: bool = False, pass_options: dict = None, opt_level: str = "O0",
+                   streaming: bool = False, keep_artifacts: list = None, size_optimize: bool = False,
+                   targets: list = None, ordered: bool = False, job_id: str = None,
+                   target_workers: int = 1) -> dict:
     """
     Run the obfuscation pipeline on a given file.
     Returns paths to final report, exe, and llvm files.
+    A distributed worker passes the coordinator's job_id, so both sides share it.
+    target_workers bounds how many target pipelines run at once; callers pass
+    the number of admission slots the job holds.
     """
     if selected_techniques is None:
         selected_techniques = []
@@ -56,10 +121,13 @@ def obfuscate_code(input_file_path: str, selected_techniques: list = None) -> di
     if not input_path.exists():
         raise FileNotFoundError(f"Input file not found: {input_file_path}")
 
-    # Use backend directory as work directory
-    backend_dir = Path(__file__).parent
-    work_dir = backend_dir / "temp_work"
-    work_dir.mkdir(exist_ok=True)
+    content_hash = hashlib.sha256(input_path.read_bytes()).hexdigest()
+
+    # Each job gets its own workspace in the artifact store
+    job_id, work_dir = artifact_store.create_job(job_id)
+    status = "failed"
+    report_data = {}
+    artifacts = {}
     
     output_exe = work_dir / f"{input_path.stem}_obfuscated.exe"
 
@@ -71,44 +139,81 @@ def obfuscate_code(input_file_path: str, selected_techniques: list = None) -> di
 
     # Run obfuscation pipeline
     try:
-        # Change to backend directory to run the pipeline
-        original_cwd = os.getcwd()
-        os.chdir(backend_dir)
-        
-        pipeline = AdvancedObfuscationPipeline(str(local_input), str(output_exe))
+        # All pipeline paths are absolute, so jobs can run side by side in one process
+        pipeline = AdvancedObfuscationPipeline(str(local_input), str(output_exe), seed=seed, work_dir=work_dir,
+                                               incremental=incremental, pass_options=pass_options,
+                                               opt_level=opt_level, pass_hosts=pass_host_pool,
+                                               streaming=streaming, artifacts=keep_artifacts,
+                                               size_optimize=size_optimize, targets=targets, ordered=ordered,
+                                               pch_cache=pch_cache, target_workers=target_workers)
         # Pass selected techniques to the pipeline
         success = pipeline.run_advanced_obfuscation(selected_techniques)
 
-        # Change back to original directory
-        os.chdir(original_cwd)
+        report_path = artifact_store.add_artifact(job_id, "report", work_dir / "report.json")
+        report_data = load_report(report_path)
 
         if not success:
+            violation = pipeline.limit_violation
+            if violation:
+                status = "killed"
+                raise LimitExceeded(violation["stage"], violation["limit"], violation["value"])
             raise RuntimeError("Obfuscation pipeline failed")
 
         # Collect results
         result = {
-            "exe": str(output_exe) if output_exe.exists() else None,
-            "report": str(backend_dir / "report.json") if (backend_dir / "report.json").exists() else None,
-            "llvm_ir": find_latest_ll_file(work_dir),
-            "advanced_report": str(backend_dir / "advanced_obfuscation_report.json") if (backend_dir / "advanced_obfuscation_report.json").exists() else None
+            "job_id": job_id,
+            # With target triples the output is the first target that linked
+            "exe": artifact_store.add_artifact(job_id, "exe", pipeline.output_file),
+            "report": artifact_store.get(job_id, "report"),
+            "llvm_ir": artifact_store.add_artifact(job_id, "llvm_ir", pipeline.final_ll) if pipeline.final_ll else None,
+            "advanced_report": artifact_store.add_artifact(job_id, "advanced_report", work_dir / "advanced_obfuscation_report.json")
         }
 
-        # Read metrics from report if available
-        if result['report'] and Path(result['report']).exists():
-            try:
-                with open(result['report'], 'r', encoding='utf-8') as f:
-                    report_data = json.load(f)
-                result["metrics"] = report_data.get("metrics", {})
-                result["summary"] = report_data.get("summary", {})
-            except Exception as e:
-                print(f"Could not read report: {e}")
+        # Extra artifacts a streamed job may have been asked to keep
+        for kind, name in (("bitcode", "final.bc"), ("object", "final.o")):
+            if pipeline.streaming and kind in pipeline.artifacts:
+                result[kind] = artifact_store.add_artifact(job_id, kind, work_dir / name)
+
+        # The build ID is the job ID; its rename map outlives the workspace
+        symbol_map = work_dir / "symbols.map"
+        if symbol_map.exists():
+            result["symbol_map"] = artifact_store.add_artifact(job_id, "symbol_map", symbol_maps.save(job_id, symbol_map))
+
+        # Metrics from the report
+        result["metrics"] = report_data.get("metrics", {})
+        result["summary"] = report_data.get("summary", {})
+        if "incremental" in report_data:
+            result["incremental"] = report_data["incremental"]
+        if "post_optimization" in report_data:
+            result["post_optimization"] = report_data["post_optimization"]
+        result["io"] = report_data.get("io")
+        if "size_optimization" in report_data:
+            result["size_optimization"] = report_data["size_optimization"]
+        # Per-target executables, objects and IR, recorded as e.g. "exe:aarch64-linux-gnu"
+        if "targets" in report_data:
+            for triple, target in report_data["targets"].items():
+                for kind in ("exe", "object", "llvm_ir"):
+                    if target.get(kind):
+                        artifact_store.add_artifact(job_id, f"{kind}:{triple}", target[kind])
+            result["targets"] = report_data["targets"]
+        if "frontend" in report_data:
+            result["frontend"] = report_data["frontend"]
+
+        # The uploaded source stays with the job, so preflight can skip re-uploads
+        result["source"] = artifact_store.add_artifact(job_id, "source", local_input)
 
+        status = "success"
+        artifacts = {
+            kind: result.get(kind) for kind in ("exe", "report", "llvm_ir", "symbol_map", "bitcode", "object", "source")
+            if result.get(kind)
+        }
         print(f"Obfuscation completed: {result['exe']}")
 
         return result
 
-    except Exception as e:
-        # Change back to original directory on error
-        if 'original_cwd' in locals():
-            os.chdir(original_cwd)
-        raise
\ No newline at end of file
+    finally:
+        artifact_store.finish_job(job_id)
+        try:
+            run_history.record_run(job_id, content_hash, selected_techniques, seed, status, report_data, artifacts)
+        except Exception as e:
+            print(f"Could not record run history: {e}")
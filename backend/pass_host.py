@@ -0,0 +1,239 @@
+import json
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from resource_limits import LimitExceeded, _apply_limits, load_stage_limits
+
+backend_dir = Path(__file__).parent.resolve()
+
+
+class PassHostError(Exception):
+    """Raised when a pass host dies or breaks the frame protocol mid-request"""
+
+
+def find_binary():
+    """Path of the built obf-pass-host executable, or None"""
+    for name in ("obf-pass-host.exe", "obf-pass-host"):
+        path = backend_dir / "build" / name
+        if path.exists():
+            return path
+    return None
+
+
+class PassHost:
+    """One obf-pass-host process speaking length-prefixed frames over its stdin/stdout"""
+
+    def __init__(self, binary, memory_mb=0):
+        self.binary = Path(binary)
+        self.memory_mb = memory_mb
+        self.process = None
+        self.started = None
+        self.requests = 0
+
+    def start(self):
+        # RLIMIT_AS covers the host's whole lifetime; CPU limits are per job,
+        # so those are enforced with the wall-clock timeout instead.
+        self.process = subprocess.Popen(
+            [str(self.binary)], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        _apply_limits(self.process.pid, 0, self.memory_mb)
+        self.started = time.time()
+        self.requests = 0
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.alive():
+            try:
+                self._write_frame(json.dumps({"op": "shutdown"}).encode())
+                self.process.stdin.close()
+                self.process.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def _write_frame(self, data):
+        self.process.stdin.write(struct.pack("<I", len(data)) + data)
+
+    def _read_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.process.stdout.read(size - len(data))
+            if not chunk:
+                raise PassHostError(f"pass host exited (code {self.process.poll()})")
+            data += chunk
+        return data
+
+    def _read_frame(self):
+        (size,) = struct.unpack("<I", self._read_exact(4))
+        return self._read_exact(size)
+
+    def request(self, header, module=None, timeout=None):
+        """Send one request; returns (header dict, extra frames).
+
+        A watchdog kills the host if it doesn't answer within `timeout`
+        seconds, which surfaces here as PassHostError.
+        """
+        watchdog = threading.Timer(timeout, self.process.kill) if timeout else None
+        if watchdog:
+            watchdog.start()
+        try:
+            self._write_frame(json.dumps(header).encode())
+            if module is not None:
+                self._write_frame(module)
+            self.process.stdin.flush()
+            response = json.loads(self._read_frame())
+            frames = [self._read_frame(), self._read_frame()] if module is not None else []
+        except (OSError, ValueError) as e:
+            raise PassHostError(f"pass host protocol error: {e}")
+        finally:
+            if watchdog:
+                watchdog.cancel()
+        self.requests += 1
+        return response, frames
+
+    def ping(self, timeout=5):
+        response, _ = self.request({"op": "ping"}, timeout=timeout)
+        return response.get("ok", False)
+
+
+class PassHostPool:
+    """Persistent pass hosts that keep LLVM and the obfuscation passes loaded across jobs.
+
+    Spawning opt with -load-pass-plugin costs a process start, dynamic
+    linking and plugin registration for every pass of every job, which
+    dominates small jobs. The pool keeps `size` hosts running and hands
+    each pass to an idle one. A host that crashes or times out is replaced
+    before it is returned to the pool, and health checks ping idle hosts.
+    """
+
+    def __init__(self, binary=None, size=None, stage_limits=None):
+        self.binary = Path(binary) if binary else find_binary()
+        self.size = size or int(os.environ.get("OBF_PASS_HOSTS", 2))
+        limits = (stage_limits or load_stage_limits()).get("opt", {})
+        self.timeout = limits.get("timeout") or None
+        self.memory_mb = limits.get("memory_mb") or 0
+        self.idle = queue.Queue()
+        self.hosts = []
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self.served = 0
+        self._checker = None
+        self._stop = threading.Event()
+
+    def _ensure_started(self):
+        with self.lock:
+            while len(self.hosts) < self.size:
+                host = PassHost(self.binary, self.memory_mb)
+                host.start()
+                self.hosts.append(host)
+                self.idle.put(host)
+
+    def _restart(self, host):
+        host.stop()
+        host.start()
+        with self.lock:
+            self.restarts += 1
+        print(f"🔁 Restarted pass host (pid {host.process.pid})")
+
+    def run(self, pipeline, module, stage="opt", emit_ll=True):
+        """Run an opt -passes pipeline over module bytes (.bc or .ll).
+
+        Returns {"ok", "soft", "error", "stderr", "seconds", "bitcode", "ll"}.
+        Raises LimitExceeded if the host had to be killed for the opt timeout
+        and PassHostError if it crashed; either way the host is restarted.
+        """
+        self._ensure_started()
+        host = self.idle.get()
+        try:
+            if not host.alive():
+                self._restart(host)
+            start = time.time()
+            try:
+                response, (bitcode, ll) = host.request(
+                    {"op": "run", "pipeline": pipeline, "emit_ll": emit_ll}, module, self.timeout
+                )
+            except PassHostError:
+                elapsed = time.time() - start
+                self._restart(host)
+                if self.timeout and elapsed >= self.timeout:
+                    raise LimitExceeded(stage, "timeout", f"{self.timeout}s", ["obf-pass-host", "-passes", pipeline])
+                raise
+            with self.lock:
+                self.served += 1
+            response["bitcode"] = bitcode
+            response["ll"] = ll.decode("utf-8", errors="ignore")
+            return response
+        finally:
+            self.idle.put(host)
+
+    def check_health(self):
+        """Start missing hosts, ping every idle one and replace those that don't answer"""
+        self._ensure_started()
+        healthy = 0
+        for _ in range(self.idle.qsize()):
+            try:
+                host = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if host.alive() and host.ping():
+                    healthy += 1
+                else:
+                    self._restart(host)
+            except PassHostError:
+                self._restart(host)
+            finally:
+                self.idle.put(host)
+        return healthy
+
+    def start_health_checks(self, interval=None):
+        """Run check_health() periodically on a daemon thread"""
+        interval = interval or int(os.environ.get("OBF_PASS_HOST_HEALTH_INTERVAL", 30))
+        if self._checker and self._checker.is_alive():
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.check_health()
+                except Exception as e:
+                    print(f"Pass host health check failed: {e}")
+
+        self._stop.clear()
+        self._checker = threading.Thread(target=loop, name="pass-host-health", daemon=True)
+        self._checker.start()
+
+    def shutdown(self):
+        self._stop.set()
+        with self.lock:
+            hosts, self.hosts = self.hosts, []
+        for host in hosts:
+            host.stop()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "running": sum(1 for host in self.hosts if host.alive()),
+                "idle": self.idle.qsize(),
+                "served": self.served,
+                "restarts": self.restarts,
+            }
+
+
+def create_pool():
+    """A pass host pool if the host is built and not disabled with OBF_PASS_HOSTS=0"""
+    if os.environ.get("OBF_PASS_HOSTS", "2") == "0" or find_binary() is None:
+        return None
+    return PassHostPool()
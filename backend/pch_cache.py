@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from resource_limits import LimitExceeded, run_limited
+
+# Bump when the key or entry layout changes; older entries are then never hit
+# and age out of the size budget
+CACHE_VERSION = 1
+
+# Uploads that get a precompiled header; C headers are cheap to parse
+CXX_EXTENSIONS = {".cpp", ".cc", ".cxx"}
+
+SYSTEM_INCLUDE = re.compile(r'\s*#\s*include\s*<([^>]+)>\s*(//.*|/\*.*)?$')
+
+# Seconds a header set that failed to precompile is skipped before the build is tried again
+FAILED_TTL = 3600
+
+
+def header_prefix(source):
+    """System headers the source includes before anything else, in order.
+
+    Only this leading run goes into the PCH: a macro or declaration ahead of an
+    include could change what the header means, so the prefix stops there.
+    Blank lines and comments, such as a leading /* ... */ licence block,
+    don't end it.
+    """
+    headers = []
+    in_comment = False
+    for line in Path(source).read_text(encoding="utf-8", errors="replace").splitlines():
+        stripped = line.strip()
+        if in_comment:
+            if "*/" not in stripped:
+                continue
+            in_comment = False
+            stripped = line = stripped.split("*/", 1)[1].strip()
+        while stripped.startswith("/*"):
+            if "*/" not in stripped:
+                in_comment = True
+                break
+            stripped = line = stripped.split("*/", 1)[1].strip()
+        if in_comment or not stripped or stripped.startswith("//"):
+            continue
+        match = SYSTEM_INCLUDE.match(line)
+        if not match:
+            break
+        headers.append(match.group(1))
+        # A block comment opened after the include runs on to later lines
+        comment = match.group(2) or ""
+        in_comment = comment.startswith("/*") and "*/" not in comment[2:]
+    return headers
+
+
+class PCHCache:
+    """Precompiled headers for common header sets, shared by all jobs.
+
+    A PCH is keyed by the cache version, the clang binary and its --version
+    output, the compile flags and the ordered header list, so a toolchain
+    upgrade or a different -O level never loads a stale PCH. Each entry
+    records how long the headers took to parse when it was built, which is
+    the frontend time later hits save. Least recently used entries are
+    removed while the cache is over OBF_PCH_CACHE_MB.
+    """
+
+    def __init__(self, root=None, max_bytes=None, stage_limits=None, failed_ttl=None):
+        self.root = Path(root or os.environ.get("OBF_PCH_CACHE", Path(__file__).parent / "pch_cache"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes or int(os.environ.get("OBF_PCH_CACHE_MB", 512)) * 1024 * 1024
+        self.stage_limits = stage_limits
+        self.failed_ttl = failed_ttl if failed_ttl is not None else float(os.environ.get("OBF_PCH_FAILED_TTL", FAILED_TTL))
+        self.lock = threading.Lock()
+        self.building = {}
+        self._toolchain = None
+        self.hits = 0
+        self.builds = 0
+
+    def toolchain_id(self):
+        """clang path, mtime and version; computed once per process"""
+        if self._toolchain is None:
+            clang = shutil.which("clang") or "clang"
+            mtime = os.stat(clang).st_mtime_ns if os.path.exists(clang) else 0
+            version = run_limited(["clang", "--version"], "compile", self.stage_limits).stdout
+            self._toolchain = f"{clang}|{mtime}|{version}"
+        return self._toolchain
+
+    def key(self, headers, flags):
+        material = json.dumps([CACHE_VERSION, self.toolchain_id(), flags, headers])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def lookup(self, source, flags):
+        """PCH for the source's header prefix, building it on a miss.
+
+        Returns {"status", "pch", "headers", "key", "build_seconds"} where
+        status is "hit", "built", "none" (not C++, or no system headers
+        first) or "failed" (the headers don't precompile; compile without).
+        """
+        source = Path(source)
+        headers = header_prefix(source) if source.suffix.lower() in CXX_EXTENSIONS else []
+        if not headers:
+            return {"status": "none", "pch": None, "headers": []}
+        key = self.key(headers, flags)
+        pch = self.root / key[:2] / f"{key}.pch"
+        meta = pch.with_suffix(".json")
+
+        # One build per key at a time; later jobs wait for it and then hit
+        with self.lock:
+            event = self.building.get(key)
+            owner = event is None and not pch.exists() and not self.failed(meta)
+            if owner:
+                event = self.building[key] = threading.Event()
+        if not owner and event is not None:
+            event.wait()
+
+        try:
+            try:
+                entry = json.loads(meta.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                entry = {}
+            if pch.exists() and "build_seconds" in entry:
+                os.utime(pch)
+                with self.lock:
+                    self.hits += 1
+                return {"status": "hit", "pch": pch, "headers": headers, "key": key,
+                        "build_seconds": entry["build_seconds"]}
+            if not owner or self.failed(meta):
+                return {"status": "failed", "pch": None, "headers": headers, "key": key}
+            return self.build(pch, meta, headers, flags, key)
+        finally:
+            if owner:
+                with self.lock:
+                    del self.building[key]
+                event.set()
+
+    def failed(self, meta):
+        """Whether the header set failed to precompile within the last failed_ttl seconds"""
+        try:
+            entry = json.loads(meta.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        return entry.get("failed", False) and time.time() - entry.get("created", 0) < self.failed_ttl
+
+    def build(self, pch, meta, headers, flags, key):
+        pch.parent.mkdir(exist_ok=True)
+        header = pch.with_suffix(".h")
+        header.write_text("".join(f"#include <{h}>\n" for h in headers), encoding="utf-8")
+        tmp_pch = pch.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        start = time.time()
+        try:
+            result = run_limited(["clang", "-x", "c++-header", *flags, str(header), "-o", str(tmp_pch)],
+                                 "compile:pch", self.stage_limits)
+        except LimitExceeded as e:
+            # A timeout or memory kill may not happen next time (a busy machine), so it isn't remembered
+            tmp_pch.unlink(missing_ok=True)
+            print(f"PCH build for {len(headers)} header(s) stopped: {e}")
+            return {"status": "failed", "pch": None, "headers": headers, "key": key}
+        seconds = time.time() - start
+        if result.returncode != 0 or not tmp_pch.exists():
+            tmp_pch.unlink(missing_ok=True)
+            # Remembered for failed_ttl, so later jobs with these headers don't retry the build
+            meta.write_text(json.dumps({"headers": headers, "flags": flags, "failed": True, "created": time.time()}),
+                            encoding="utf-8")
+            return {"status": "failed", "pch": None, "headers": headers, "key": key}
+        # Readers only ever see a complete PCH and its metadata
+        tmp_meta = meta.with_suffix(".json.tmp")
+        tmp_meta.write_text(json.dumps({"headers": headers, "flags": flags, "build_seconds": round(seconds, 4),
+                                        "created": time.time()}), encoding="utf-8")
+        os.replace(tmp_pch, pch)
+        os.replace(tmp_meta, meta)
+        with self.lock:
+            self.builds += 1
+        self.evict(keep=pch)
+        return {"status": "built", "pch": pch, "headers": headers, "key": key, "build_seconds": round(seconds, 4)}
+
+    def evict(self, keep=None):
+        """Remove expired failure markers, then least recently used entries while over the size budget"""
+        for meta in self.root.glob("*/*.json"):
+            if not meta.with_suffix(".pch").exists() and not self.failed(meta) and meta.with_suffix(".pch") != keep:
+                with self.lock:
+                    if meta.stem in self.building:
+                        continue
+                for path in (meta, meta.with_suffix(".h")):
+                    path.unlink(missing_ok=True)
+        entries = sorted((p.stat().st_mtime, p) for p in self.root.glob("*/*.pch"))
+        total = sum(p.stat().st_size for _, p in entries)
+        evicted = 0
+        for _, pch in entries:
+            if total <= self.max_bytes:
+                break
+            if pch == keep:
+                continue
+            total -= pch.stat().st_size
+            for path in (pch, pch.with_suffix(".json"), pch.with_suffix(".h")):
+                path.unlink(missing_ok=True)
+            evicted += 1
+        if evicted:
+            print(f"🧹 PCH cache evicted {evicted} header set(s)")
+
+    def stats(self):
+        entries = list(self.root.glob("*/*.pch"))
+        return {
+            "entries": len(entries),
+            "bytes": sum(p.stat().st_size for p in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "builds": self.builds,
+        }
+
+
+def create_pch_cache():
+    """The shared PCH cache, or None if disabled with OBF_PCH=0"""
+    if os.environ.get("OBF_PCH", "1") == "0":
+        return None
+    return PCHCache()
@@ -0,0 +1,83 @@
+import re
+
+# Optimization levels the pipeline accepts. O0 keeps the original behaviour:
+# unoptimized bitcode in, no post-obfuscation optimization.
+OPT_LEVELS = ("O0", "O1", "O2", "O3", "Os", "Oz")
+
+# Where anti-debug places its debugger check: once per process, at startup
+# and then every N calls (optionally at most every S seconds), or on entry to
+# rarely-run functions only
+ANTI_DEBUG_MODES = ("startup", "sampled", "cold")
+
+# Post-obfuscation pipelines. These are curated rather than default<On>:
+#  - no globalopt, which can evaluate the string decryption constructor at
+#    compile time and fold plaintext back into the initializers
+#  - no jump-threading / dfa-jump-threading, which thread constant states
+#    through the flattening dispatcher and undo cfflatten
+# Opaque predicates read a volatile seed, so instcombine/gvn/sccp can't fold them.
+_CLEANUP = "sroa,early-cse<memssa>,instcombine,simplifycfg"
+_SCALAR = "reassociate,loop-mssa(licm),gvn,sccp,dse,adce,instcombine,simplifycfg"
+POST_OBFUSCATION_PIPELINES = {
+    "O1": f"function({_CLEANUP},dse,adce)",
+    "O2": f"cgscc(inline),function({_CLEANUP},{_SCALAR})",
+    "O3": f"cgscc(inline),function({_CLEANUP},{_SCALAR},loop-unroll<O3>,slp-vectorizer,instcombine)",
+    "Os": f"function({_CLEANUP},{_SCALAR})",
+    "Oz": f"function({_CLEANUP},dse,adce)",
+}
+
+# Textual traces each pass leaves in the IR. Counting them before and after the
+# post-obfuscation pipeline shows whether a protection survived.
+PROTECTION_MARKERS = {
+    # the dispatcher's state PHI; instcombine may narrow the switch itself
+    "cfflatten": re.compile(r'%cff_state(?:\d+|\.i\d*)? = phi '),
+    "opaque-preds": re.compile(r'store volatile i32 .*@__obf_opaque_seed'),
+    "bogus-instructions": re.compile(r'%bogus_(?:alloca|load|calc|add|mul|sub|xor)\w*\s*='),
+    "bbsplit": re.compile(r'^[-\w.$]+_split[\w.]*:', re.M),
+    "rename-symbols": re.compile(r'^define .*@[fg]_\d+_[0-9a-f]{8}\(', re.M),
+    # the masking xors the pass names; unrelated xors in the program don't count
+    "dynamic-xor": re.compile(r'%dxor_(?:enc|dec)[\w.]*\s*= xor '),
+    # every call site of the out-of-line debugger check, including the constructor's
+    "anti-debug": re.compile(r'call void @__obf_debugger_check\(\)'),
+}
+
+
+def ir_string_literal(text):
+    """Body of the c"..." literal LLVM prints for a string constant"""
+    out = []
+    for byte in text.encode("latin-1", errors="replace"):
+        char = chr(byte)
+        if 0x20 <= byte < 0x7F and char not in '"\\':
+            out.append(char)
+        else:
+            out.append(f"\\{byte:02X}")
+    return "".join(out)
+
+
+def count_protection(pass_name, ll_text, details=None):
+    """How many traces of a pass are left in ll_text, or None if it leaves none to count"""
+    if pass_name == "stringenc":
+        # An encrypted string survived if its plaintext isn't back in the IR
+        strings = [s for s in (details or {}).get("encrypted_strings", []) if len(s.rstrip("\0")) >= 4]
+        return sum(1 for s in strings if f'c"{ir_string_literal(s)}"' not in ll_text)
+    marker = PROTECTION_MARKERS.get(pass_name)
+    return len(marker.findall(ll_text)) if marker else None
+
+
+def protection_survival(applied_passes, before_text, after_text):
+    """Per-pass trace counts before and after post-obfuscation optimization.
+
+    applied_passes is a list of (pass name, details) for passes that succeeded.
+    """
+    survival = {}
+    for pass_name, details in applied_passes:
+        before = count_protection(pass_name, before_text, details)
+        if before is None:
+            continue
+        after = count_protection(pass_name, after_text, details)
+        survival[pass_name] = {
+            "before": before,
+            "after": after,
+            "survived": after > 0 if before > 0 else None,
+            "retained_ratio": round(after / before, 3) if before else None,
+        }
+    return survival
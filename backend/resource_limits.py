@@ -0,0 +1,203 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows has no rlimits; only wall-clock timeouts apply
+    resource = None
+
+# Per-stage limits for every toolchain subprocess.
+#   timeout   - wall-clock seconds before the process is killed
+#   cpu       - CPU seconds (RLIMIT_CPU), delivers SIGXCPU when exceeded
+#   memory_mb - address space cap in MiB (RLIMIT_AS), allocation fails past it
+DEFAULT_STAGE_LIMITS = {
+    "compile": {"timeout": 60, "cpu": 60, "memory_mb": 2048},
+    "opt": {"timeout": 60, "cpu": 60, "memory_mb": 2048},
+    "assemble": {"timeout": 30, "cpu": 30, "memory_mb": 1024},
+    "codegen": {"timeout": 90, "cpu": 90, "memory_mb": 2048},
+    "link": {"timeout": 30, "cpu": 30, "memory_mb": 1024},
+}
+
+OOM_MARKERS = ["out of memory", "std::bad_alloc", "cannot allocate memory"]
+
+
+def load_stage_limits():
+    """Return stage limits with OBF_LIMIT_<STAGE>_<LIMIT> env overrides applied.
+
+    Example: OBF_LIMIT_OPT_TIMEOUT=120 or OBF_LIMIT_CODEGEN_MEMORY_MB=4096.
+    A value of 0 disables that limit.
+    """
+    limits = {}
+    for stage, defaults in DEFAULT_STAGE_LIMITS.items():
+        limits[stage] = {}
+        for name, default in defaults.items():
+            env_key = f"OBF_LIMIT_{stage.upper()}_{name.upper()}"
+            try:
+                limits[stage][name] = int(os.environ.get(env_key, default))
+            except ValueError:
+                limits[stage][name] = default
+    return limits
+
+
+class LimitExceeded(Exception):
+    """Raised when a toolchain subprocess is killed for hitting a stage limit"""
+
+    def __init__(self, stage, limit, value, command=None):
+        self.stage = stage
+        self.limit = limit
+        self.value = value
+        self.command = command
+        super().__init__(f"Stage '{stage}' exceeded {limit} limit ({value})")
+
+    def to_dict(self):
+        return {
+            "stage": self.stage,
+            "limit": self.limit,
+            "value": self.value,
+            "command": " ".join(str(c) for c in self.command) if self.command else None,
+        }
+
+
+def _apply_limits(pid, cpu, memory_mb):
+    """Apply rlimits to a started child with prlimit(2).
+
+    preexec_fn would set them before exec, but it isn't safe in a process
+    with threads, and jobs run on worker threads. The child runs for a moment
+    unlimited; its own children (clang's cc1, say) inherit the limits. Where
+    prlimit is missing (macOS) only the wall-clock timeout applies.
+    """
+    if resource is None or not hasattr(resource, "prlimit"):
+        return
+    try:
+        if cpu:
+            # Soft limit sends SIGXCPU, hard limit one second later SIGKILL
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu, cpu + 1))
+        if memory_mb:
+            cap = memory_mb * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (cap, cap))
+    except ProcessLookupError:
+        pass  # Already exited
+
+
+def _communicate(proc, input_bytes, deadline):
+    """Feed stdin and read stdout and stderr on threads, without reaping the child.
+
+    Popen.communicate() also waits for the child, which would discard its
+    resource usage; run_limited reaps it with _reap instead. Returns
+    (stdout, stderr, finished); a child still writing at the deadline is killed.
+    """
+    output = {"stdout": b"", "stderr": b""}
+
+    def read(name, pipe):
+        output[name] = pipe.read()
+
+    def write():
+        try:
+            proc.stdin.write(input_bytes)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass  # The child stopped reading; its exit status says why
+
+    threads = [threading.Thread(target=read, args=("stdout", proc.stdout), daemon=True),
+               threading.Thread(target=read, args=("stderr", proc.stderr), daemon=True)]
+    if proc.stdin is not None:
+        threads.append(threading.Thread(target=write, daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+    finished = not any(thread.is_alive() for thread in threads)
+    if not finished:
+        proc.kill()
+        for thread in threads:
+            thread.join()
+    return output["stdout"], output["stderr"], finished
+
+
+def _reap(proc, deadline=None):
+    """Wait for the child with os.wait4, keeping its resource usage.
+
+    Sets proc.returncode, so Popen never waits for the child itself. Returns
+    (rusage or None where wait4 is missing, timed_out); a child still running
+    at the deadline is killed.
+    """
+    if not hasattr(os, "wait4"):
+        try:
+            proc.wait(None if deadline is None else max(deadline - time.monotonic(), 0))
+            return None, False
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            return None, True
+    timed_out = False
+    while True:
+        try:
+            pid, status, rusage = os.wait4(proc.pid, os.WNOHANG if deadline and not timed_out else 0)
+        except ChildProcessError:
+            proc.wait()  # Reaped elsewhere
+            return None, timed_out
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return rusage, timed_out
+        if time.monotonic() >= deadline:
+            proc.kill()
+            timed_out = True
+        else:
+            time.sleep(0.005)
+
+
+def run_limited(cmd, stage, limits=None, input_bytes=None, binary=False, pass_fds=()):
+    """Run a toolchain command under the limits configured for its stage.
+
+    `stage` is either a stage kind ("opt") or a qualified name ("opt:cfflatten");
+    the part before the colon selects the limits. Returns the CompletedProcess
+    and raises LimitExceeded naming the exact stage and limit that was hit.
+
+    With binary=True, input_bytes is fed to stdin and stdout is returned as
+    bytes, so bitcode can stream between stages; stderr is still text.
+    """
+    if limits is None:
+        limits = load_stage_limits()
+    stage_kind = stage.split(":", 1)[0]
+    stage_limits = limits.get(stage_kind, {})
+    timeout = stage_limits.get("timeout") or None
+    cpu = stage_limits.get("cpu") or 0
+    memory_mb = stage_limits.get("memory_mb") or 0
+
+    if isinstance(input_bytes, str):
+        input_bytes = input_bytes.encode('utf-8')
+    stdin = subprocess.PIPE if input_bytes is not None else None
+    deadline = time.monotonic() + timeout if timeout else None
+    with subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          pass_fds=pass_fds) as proc:
+        _apply_limits(proc.pid, cpu, memory_mb)
+        stdout, stderr, finished = _communicate(proc, input_bytes, deadline)
+        rusage, timed_out = _reap(proc, deadline)
+    if not finished or timed_out:
+        raise LimitExceeded(stage, "timeout", f"{timeout}s", cmd)
+
+    def text(data):
+        # What text=True would give: UTF-8, undecodable bytes dropped, universal newlines
+        return data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+
+    result = subprocess.CompletedProcess(cmd, proc.returncode, stdout if binary else text(stdout), text(stderr))
+
+    if result.returncode < 0 and cpu:
+        killed_by = -result.returncode
+        # SIGKILL is also the OOM killer's signal: it only counts as the CPU
+        # limit (the hard limit, cpu + 1) when the child used that much CPU
+        used = rusage.ru_utime + rusage.ru_stime if rusage is not None else None
+        if killed_by == getattr(signal, "SIGXCPU", None) or (
+            killed_by == getattr(signal, "SIGKILL", None) and used is not None and used >= cpu
+        ):
+            raise LimitExceeded(stage, "cpu", f"{cpu}s", cmd)
+
+    if result.returncode != 0 and memory_mb:
+        stderr = (result.stderr or "").lower()
+        if any(marker in stderr for marker in OOM_MARKERS):
+            raise LimitExceeded(stage, "memory", f"{memory_mb}MB", cmd)
+
+    return result
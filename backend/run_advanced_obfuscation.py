@@ -7,14 +7,126 @@ from pathlib import Path
 import datetime
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+from resource_limits import LimitExceeded, load_stage_limits, run_limited
+from protections import OPT_LEVELS, POST_OBFUSCATION_PIPELINES, protection_survival
+from symbolize import write_symbol_map
+from streaming import (
+    DEFAULT_STREAM_ARTIFACTS, MEMORY_FILESYSTEMS, STREAM_ARTIFACTS, filesystem_type, memory_file, workspace_usage
+)
+from incremental import (
+    FUNCTION_PASSES, FunctionCache, capture_function, clear_skipped, function_key,
+    mark_skipped, splice_function, split_functions
+)
+
+# Every pass in pipeline order: (pass name, description, plugin)
+ALL_PASSES = [
+    ("stringenc", "String Encryption", "AdvancedObfuscationPasses.dll"),
+    ("bogus-instructions", "Bogus Instructions", "AdvancedObfuscationPasses.dll"),
+    ("rename-symbols", "Symbol Renaming", "AdvancedObfuscationPasses.dll"),
+    ("dynamic-xor", "Dynamic XOR Obfuscation", "AdvancedObfuscationPasses.dll"),
+    ("cfflatten", "Control Flow Flattening", "AdvancedObfuscationPasses.dll"), 
+    ("opaque-preds", "Opaque Predicates", "AdvancedObfuscationPasses.dll"),
+    ("bbsplit", "Basic Block Splitting", "AdvancedObfuscationPasses.dll"),
+    ("anti-debug", "Anti-Debugging Protection", "AdvancedObfuscationPasses.dll"),
+]
+
+# Passes that accept a "<seed=N>" pipeline parameter for reproducible output
+SEEDED_PASSES = {"stringenc", "bogus-instructions", "rename-symbols", "dynamic-xor"}
+
+# Optional "<option>" pipeline parameters each pass understands, as patterns
+PASS_OPTIONS = {
+    "cfflatten": r"keep-loops",
+    "opaque-preds": r"(budget=\d+|hot-budget=\d+)(;(budget=\d+|hot-budget=\d+))?",
+    "anti-debug": r"mode=(startup|cold|sampled(;every=[1-9]\d*)?(;seconds=\d+)?)",
+}
+
+# opt failures that mean a pass produced invalid IR rather than crashed
+SOFT_ERRORS = [
+    "broken module", "verifier failed", "does not dominate",
+    "instruction does not dominate all uses", "terminator found in the middle"
+]
+
+# Size-optimized link steps, applied cumulatively: each is linked and measured
+# on top of the steps before it that succeeded
+SIZE_STEPS = [
+    ("baseline", []),
+    ("gc_sections", ["-Wl,--gc-sections"]),
+    ("icf", ["-fuse-ld=lld", "-Wl,--icf=safe"]),
+    ("strip", ["-s"]),
+]
+
+# Triple vendor fields. Triples that differ only in vendor share an ABI, so
+# one obfuscated module serves all of them.
+TRIPLE_VENDORS = {"pc", "unknown", "none", "w64", "apple"}
+
+
+def abi_family(triple):
+    """The triple without its vendor field, e.g. x86_64-linux-gnu for x86_64-pc-linux-gnu"""
+    parts = triple.split("-")
+    if len(parts) > 2 and parts[1] in TRIPLE_VENDORS:
+        del parts[1]
+    return "-".join(parts)
+
+
+def abi_families(triples):
+    """Group triples by ABI family, in order; a family's IR is compiled for its first triple"""
+    families = {}
+    for triple in triples:
+        families.setdefault(abi_family(triple), []).append(triple)
+    return list(families.values())
+
 
 class AdvancedObfuscationPipeline:
-    def __init__(self, input_file, output_file="super_obfuscated.exe"):
-        self.input_file = Path(input_file)
-        self.output_file = Path(output_file)
-        self.work_dir = Path(".")
+    def __init__(self, input_file, output_file="super_obfuscated.exe", stage_limits=None, seed=0, work_dir=".",
+                 incremental=False, pass_options=None, opt_level="O0", pass_hosts=None, streaming=False,
+                 artifacts=None, size_optimize=False, targets=None, ordered=False, pch_cache=None, target=None,
+                 target_workers=1):
+        # Absolute, and every intermediate file lives under work_dir: the run never
+        # chdirs, so concurrent jobs in one process can't see each other's files
+        self.input_file = Path(input_file).resolve()
+        self.output_file = Path(output_file).resolve()
+        self.seed = seed
+        self.work_dir = Path(work_dir).resolve()
+        # Incremental mode reuses cached obfuscated bodies of unchanged functions
+        self.incremental = incremental
+        self.function_cache = FunctionCache() if incremental else None
+        # Above O0, sources compile to optimized bitcode and are re-optimized after obfuscation
+        self.opt_level = opt_level if opt_level in OPT_LEVELS else "O0"
+        # Per-pass pipeline options, e.g. {"cfflatten": "keep-loops"}
+        self.pass_options = {
+            name: option for name, option in (pass_options or {}).items()
+            if name in PASS_OPTIONS and re.fullmatch(PASS_OPTIONS[name], option)
+        }
+        # Optional PassHostPool; without one every pass spawns opt with the plugin
+        self.pass_hosts = pass_hosts
+        # Streaming pipes bitcode between stages and writes only the requested
+        # artifacts. Incremental mode works on per-function files, so it doesn't stream.
+        self.streaming = streaming and not incremental
+        self.artifacts = {a for a in (artifacts or DEFAULT_STREAM_ARTIFACTS) if a in STREAM_ARTIFACTS}
+        self.bytes_piped = 0
+        # Size mode links with section GC, identical-code folding and stripping
+        self.size_optimize = size_optimize
+        # Target triples to build, obfuscated once per ABI family; empty builds for the host
+        self.targets = list(dict.fromkeys(targets or []))
+        # Target pipelines to run at once: the admission slots the job holds
+        self.target_workers = max(1, target_workers)
+        # The one triple this pipeline compiles for, or None for the host
+        self.target = target
+        # Ordered runs apply the selected techniques in the order given (see tuner.py)
+        self.ordered = ordered
+        self.pass_order = None
+        # Optional PCHCache; C++ sources then skip re-parsing their standard headers
+        self.pch_cache = pch_cache
+        self.frontend = None
         self.start_time = time.time()
         self.pass_times = []
+        # Intermediate .bc/.ll files written by this run, so nothing needs globbing
+        self.intermediate_files = []
+        self.final_ll = None
+        self.stage_limits = stage_limits if stage_limits is not None else load_stage_limits()
+        self.limit_violation = None
         self.report_data = {
             "metadata": {},
             "metrics": {},
@@ -30,147 +142,831 @@ class AdvancedObfuscationPipeline:
         if selected_techniques is None:
             selected_techniques = []
             
-        # Store original working directory
-        original_cwd = os.getcwd()
+        # Initialize timing
+        self.start_time = time.time()
+        self.pass_times = []
         
-        try:
-            # Change to the work directory where files should be created
-            os.chdir(self.work_dir)
-            
-            # Initialize timing
-            self.start_time = time.time()
-            self.pass_times = []
-            
-            # Step 1: Initial compilation
-            bc_file = Path("input.bc")
+        passes = self.select_passes(selected_techniques)
+        if self.targets:
+            return self.run_targets(passes)
+        
+        if self.streaming:
+            return self.run_streamed(passes)
+        
+        final_bc = self.obfuscate_bitcode(passes)
+        if final_bc is None:
+            self.generate_comprehensive_report()
+            return False
+        
+        success = self.compile_and_link(final_bc)
+        
+        # Always generate the comprehensive report
+        self.generate_comprehensive_report()
+        
+        return success
+
+    def select_passes(self, selected_techniques):
+        """The passes to run, in pipeline order or in the order selected"""
+        if selected_techniques and self.ordered:
+            by_name = {pass_info[0]: pass_info for pass_info in ALL_PASSES}
+            passes = [by_name[name] for name in dict.fromkeys(selected_techniques) if name in by_name]
+            self.pass_order = [p[0] for p in passes]
+            print(f"Running techniques in order: {self.pass_order}")
+        elif selected_techniques:
+            passes = [pass_info for pass_info in ALL_PASSES if pass_info[0] in selected_techniques]
+            print(f"Running selected techniques: {[p[0] for p in passes]}")
+        else:
+            passes = ALL_PASSES
+            print("Running all techniques")
+        return passes
+
+    def obfuscate_bitcode(self, passes):
+        """Compile the source and run the passes (and post-optimization) over it.
+
+        Returns the final bitcode path, or None if a step failed or a stage
+        limit killed the job.
+        """
+        # Step 1: Initial compilation
+        bc_file = self.path("input.bc")
+        step_start = time.time()
+        self.report_data["steps"].append({
+            "step": "initial_compilation",
+            "command": f"clang -{self.opt_level} -c -emit-llvm {self.input_file} -o {bc_file}",
+            "status": "success" if self.emit_bc(bc_file) else "failed",
+            "output": "Generated initial bitcode" if bc_file.exists() else "Failed to generate bitcode"
+        })
+        self.pass_times.append(("initial_compilation", time.time() - step_start))
+        
+        if self.limit_violation or not bc_file.exists():
+            return None
+        self.intermediate_files.append(bc_file)
+        
+        # Step 2: All passes
+        if self.incremental:
+            final_bc = self.run_incremental(passes, bc_file)
+        else:
+            final_bc = self.apply_passes(passes, bc_file)
+        
+        if final_bc is not None and self.opt_level != "O0":
+            final_bc = self.run_post_optimization(final_bc)
+        return final_bc
+
+    def compile_and_link(self, final_bc, link=True):
+        """Generate final.o from the bitcode with llc, then link self.output_file.
+
+        Returns True if every step that ran succeeded.
+        """
+        # LLC compilation
+        step_start = time.time()
+        obj_file = self.path("final.o")
+        llc_flags = self.llc_flags()
+        llc_success = self.run_command(
+            ["llc", *llc_flags, "-filetype=obj", str(final_bc), "-o", str(obj_file)],
+            "LLC Compile", stage="codegen"
+        )
+        self.report_data["steps"].append({
+            "step": "llc_compile",
+            "command": " ".join(["llc", *llc_flags, "-filetype=obj", str(final_bc), "-o", "final.o"]),
+            "status": "success" if llc_success else "failed",
+            "output": "Generated object file" if llc_success else "Failed to generate object file"
+        })
+        self.pass_times.append(("llc_compile", time.time() - step_start))
+        
+        if self.limit_violation or not link:
+            return llc_success and not self.limit_violation
+        
+        # Final linking
+        self.link_executable(str(obj_file))
+        
+        return self.output_file.exists()
+
+    def run_streamed(self, passes):
+        """Run the job with bitcode piped between clang, the passes and llc.
+
+        Nothing intermediate touches the workspace: only the artifacts in
+        self.artifacts are written, and the object file reaches the linker
+        through a memfd where the platform has one.
+        """
+        # Step 1: Initial compilation
+        step_start = time.time()
+        cmd = self.frontend_command("-")
+        frontend_start = time.time()
+        result = self.pipe_command(cmd, "compile")
+        if (result is None or result.returncode != 0) and "-include-pch" in cmd and not self.limit_violation:
+            self.frontend["pch"] = "rejected"
+            frontend_start = time.time()
+            result = self.pipe_command(self.frontend_command("-", use_pch=False), "compile")
+        self.record_frontend(time.time() - frontend_start)
+        module = result.stdout if result is not None and result.returncode == 0 else None
+        self.report_data["steps"].append({
+            "step": "initial_compilation",
+            "command": f"clang -{self.opt_level} -c -emit-llvm {self.input_file} -o -",
+            "status": "success" if module else "failed",
+            "output": "Generated initial bitcode" if module else "Failed to generate bitcode"
+        })
+        self.pass_times.append(("initial_compilation", time.time() - step_start))
+        if not module:
+            self.generate_comprehensive_report()
+            return False
+
+        # Step 2: Passes, each one's bitcode piped into the next
+        for pass_name, description, plugin in passes:
             step_start = time.time()
-            self.report_data["steps"].append({
-                "step": "initial_compilation",
-                "command": f"clang -O0 -c -emit-llvm {self.input_file} -o {bc_file}",
-                "status": "success" if self.emit_bc(bc_file) else "failed",
-                "output": "Generated initial bitcode" if bc_file.exists() else "Failed to generate bitcode"
-            })
-            self.pass_times.append(("initial_compilation", time.time() - step_start))
-            
-            if not bc_file.exists():
-                return False
-            
-            # Step 2: All passes (filter if techniques are specified)
-            all_passes = [
-                ("stringenc", "String Encryption", "AdvancedObfuscationPasses.dll"),
-                ("bogus-instructions", "Bogus Instructions", "AdvancedObfuscationPasses.dll"),
-                ("rename-symbols", "Symbol Renaming", "AdvancedObfuscationPasses.dll"),
-                ("dynamic-xor", "Dynamic XOR Obfuscation", "AdvancedObfuscationPasses.dll"),
-                ("cfflatten", "Control Flow Flattening", "AdvancedObfuscationPasses.dll"), 
-                ("opaque-preds", "Opaque Predicates", "AdvancedObfuscationPasses.dll"),
-                ("bbsplit", "Basic Block Splitting", "AdvancedObfuscationPasses.dll"),
-                ("anti-debug", "Anti-Debugging Protection", "AdvancedObfuscationPasses.dll"),
-            ]
-            
-            # Filter passes if specific techniques are selected
-            if selected_techniques:
-                passes = [pass_info for pass_info in all_passes if pass_info[0] in selected_techniques]
-                print(f"Running selected techniques: {[p[0] for p in passes]}")
+            output = self.stream_pass(module, pass_name, description, plugin)
+            self.pass_times.append((pass_name, time.time() - step_start))
+            step_info = {
+                "step": f"opt-pass-{pass_name}",
+                "command": f"opt -load-pass-plugin build/{plugin} -passes {self.pass_pipeline_name(pass_name)} - -o -",
+                "status": "success" if output else "failed",
+                "stderr": self.get_last_stderr()
+            }
+            if output:
+                module = output
+                pass_details = self.get_pass_details(pass_name)
+                if pass_details:
+                    step_info["details"] = pass_details
             else:
-                passes = all_passes
-                print("Running all techniques")
-            
-            current_bc = bc_file
-            for i, (pass_name, description, plugin) in enumerate(passes):
-                step_start = time.time()
-                next_bc = Path(f"pass_{i}.bc")
-                next_ll = Path(f"pass_{i}.ll")
-                
-                # Run the optimization pass
-                pass_success = self.run_opt_pass(current_bc, next_ll, pass_name, description, plugin)
-                
-                # Record step with timing
-                step_duration = time.time() - step_start
-                self.pass_times.append((pass_name, step_duration))
-                
-                step_info = {
-                    "step": f"opt-pass-{pass_name}",
-                    "command": f"opt -load-pass-plugin build/{plugin} -passes {pass_name} -S {current_bc} -o {next_ll}",
-                    "status": "success" if pass_success else "failed",
-                    "stderr": self.get_last_stderr()
-                }
-                
-                if not pass_success:
-                    print(f"Pass {pass_name} failed, continuing...")
-                    shutil.copy2(str(current_bc), str(next_bc))
-                    step_info["status"] = "failed"
-                    step_info["error"] = "Pass execution failed"
-                else:
-                    if not self.llvm_as(next_ll, next_bc):
-                        step_info["status"] = "failed"
-                        step_info["error"] = "LLVM assembly failed"
-                    else:
-                        # Add pass details if available
-                        pass_details = self.get_pass_details(pass_name)
-                        if pass_details:
-                            step_info["details"] = pass_details
-                
+                print(f"Pass {pass_name} failed, continuing...")
+                step_info["error"] = "Pass execution failed"
+            if self.limit_violation:
+                step_info["status"] = "killed"
+                step_info["error"] = f"{self.limit_violation['limit']} limit exceeded"
                 self.report_data["steps"].append(step_info)
-                current_bc = next_bc
-            
-            # Final compilation steps
-            if passes:  # Only if we have passes
-                final_bc = Path(f"pass_{len(passes)-1}.bc")
-            else:
-                # If no passes selected, compile original
-                final_bc = bc_file
-            
-            # LLC compilation
-            step_start = time.time()
-            obj_file = self.work_dir / "final.o"
-            llc_success = self.run_command(
-                ["llc", "-filetype=obj", str(final_bc), "-o", str(obj_file)],
-                "LLC Compile"
-            )
-            self.report_data["steps"].append({
-                "step": "llc_compile",
-                "command": f"llc -filetype=obj {final_bc} -o final.o",
-                "status": "success" if llc_success else "failed",
-                "output": "Generated object file" if llc_success else "Failed to generate object file"
-            })
-            self.pass_times.append(("llc_compile", time.time() - step_start))
-            
-            # Final linking
-            step_start = time.time()
+                self.generate_comprehensive_report()
+                return False
+            self.report_data["steps"].append(step_info)
+
+        final_ll_text = None
+        if self.opt_level != "O0":
+            module, final_ll_text = self.stream_post_optimization(module)
+            if module is None:
+                self.generate_comprehensive_report()
+                return False
+
+        # Requested artifacts only
+        if "bitcode" in self.artifacts:
+            final_bc = self.path("final.bc")
+            final_bc.write_bytes(module)
+            self.intermediate_files.append(final_bc)
+        if "llvm_ir" in self.artifacts:
+            if final_ll_text is None:
+                final_ll_text = self.disassemble(module)
+            if final_ll_text is not None:
+                final_ll = self.path("final.ll")
+                final_ll.write_text(final_ll_text, encoding='utf-8')
+                self.intermediate_files.append(final_ll)
+                self.final_ll = final_ll.resolve()
+
+        if not self.artifacts & {"exe", "object"}:
+            self.generate_comprehensive_report()
+            return True
+
+        # LLC compilation, object code on stdout
+        step_start = time.time()
+        llc_flags = self.llc_flags()
+        result = self.pipe_command(["llc", *llc_flags, "-filetype=obj", "-", "-o", "-"], "codegen", module)
+        obj = result.stdout if result is not None and result.returncode == 0 else None
+        self.report_data["steps"].append({
+            "step": "llc_compile",
+            "command": " ".join(["llc", *llc_flags, "-filetype=obj", "-", "-o", "-"]),
+            "status": "success" if obj else "failed",
+            "output": "Generated object file" if obj else "Failed to generate object file"
+        })
+        self.pass_times.append(("llc_compile", time.time() - step_start))
+        if obj is None:
+            self.generate_comprehensive_report()
+            return False
+        if "object" in self.artifacts:
+            obj_file = self.path("final.o")
+            obj_file.write_bytes(obj)
+            self.intermediate_files.append(obj_file)
+
+        success = True
+        if "exe" in self.artifacts:
+            # Final linking; the linker needs a path, so hand it an in-memory file
+            with memory_file(obj, "final.o") as (obj_path, fds):
+                self.link_executable(obj_path, pass_fds=fds)
+            success = self.output_file.exists()
+
+        self.generate_comprehensive_report()
+        return success
+
+    def path(self, name):
+        """Absolute path of a file in this job's workspace"""
+        return self.work_dir / name
+
+    def llc_flags(self):
+        flags = [] if self.opt_level == "O0" else ["-O3" if self.opt_level == "O3" else "-O2"]
+        if self.target:
+            # Bitcode is shared within an ABI family, so name the exact triple
+            flags.append(f"-mtriple={self.target}")
+        if self.size_optimize:
+            # One section per function/global so the linker can drop and fold them;
+            # the address-significance table lets --icf=safe keep pointer identity
+            flags += ["-function-sections", "-data-sections", "-addrsig"]
+        return flags
+
+    def link_flags(self):
+        """Target and subsystem flags for the final clang link"""
+        if self.target is None:
+            return ["-mconsole"]
+        return [f"--target={self.target}"] + (["-mconsole"] if "windows" in self.target else [])
+
+    def link_executable(self, obj_path, pass_fds=()):
+        """Link the object into self.output_file, size-optimized if requested"""
+        step_start = time.time()
+        if self.size_optimize:
+            link_success = self.size_optimized_link(obj_path, pass_fds)
+        else:
             link_success = self.run_command(
-                ["clang", str(obj_file), "-o", str(self.output_file), "-mconsole"],
-                "Final Link"
+                ["clang", obj_path, "-o", str(self.output_file), *self.link_flags()],
+                "Final Link", stage="link", pass_fds=pass_fds
             )
             self.report_data["steps"].append({
                 "step": "final_link",
-                "command": f"clang final.o -o {self.output_file} -mconsole",
+                "command": " ".join(["clang", Path(obj_path).name, "-o", str(self.output_file), *self.link_flags()]),
                 "status": "success" if link_success else "failed",
                 "output": "Generated final executable" if link_success else "Failed to generate executable"
             })
-            self.pass_times.append(("final_link", time.time() - step_start))
+        self.pass_times.append(("final_link", time.time() - step_start))
+        return link_success
+
+    def run_targets(self, passes):
+        """Obfuscate once per ABI family, then run llc and the link for every target.
+
+        IR is not portable between ABIs: clang has already lowered calls,
+        varargs and type layout for one, and tagged functions with that CPU's
+        features. Triples that differ only in vendor share an ABI, so each
+        family runs clang --target and the passes once, for its first triple,
+        and every target in it is compiled and linked from that bitcode in its
+        own sub-workspace. At most self.target_workers pipelines run at once,
+        one per admission slot the job holds.
+
+        Per-target results go to report_data["targets"]; the family of the
+        first target that linked supplies the job's output file, IR and
+        metrics. Returns True if code generation succeeded for every target
+        and, when executables are wanted, at least one linked: cross links
+        need a sysroot per target, so a failed link is reported without
+        failing the other targets.
+        """
+        families = abi_families(self.targets)
+        step_start = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.target_workers, len(families))) as pool:
+            obfuscated = list(pool.map(lambda family: self.obfuscate_family(family[0], passes), families))
+        self.pass_times.append(("multi_target_obfuscation", time.time() - step_start))
+
+        builds = [
+            (family_pipeline, final_bc, seconds, triple)
+            for (family_pipeline, final_bc, seconds), family in zip(obfuscated, families) for triple in family
+        ]
+        step_start = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.target_workers, len(builds))) as pool:
+            builds = list(pool.map(lambda build: self.build_target(*build), builds))
+        self.pass_times.append(("multi_target_codegen", time.time() - step_start))
+
+        self.report_data["targets"] = {}
+        for pipeline in [p for p, _, _ in obfuscated] + [p for p, _ in builds]:
+            self.report_data["steps"] += [
+                {**step, "step": f"{pipeline.target}:{step['step']}"} for step in pipeline.report_data["steps"]
+            ]
+            self.intermediate_files += pipeline.intermediate_files
+            if pipeline.limit_violation and not self.limit_violation:
+                self.limit_violation = pipeline.limit_violation
+        for pipeline, result in builds:
+            self.report_data["targets"][pipeline.target] = result
+
+        linked = [result for _, result in builds if result["exe"]]
+        primary = obfuscated[0][0]
+        if linked:
+            primary = next(p for p, _, _ in obfuscated if p.target == linked[0]["ir_target"])
+            self.output_file = Path(linked[0]["exe"])
+        for key, value in primary.report_data.items():
+            if key not in ("steps", "targets"):
+                self.report_data[key] = value
+        self.pass_times = primary.pass_times + self.pass_times
+        self.frontend = primary.frontend
+        self.final_ll = primary.final_ll
+
+        self.generate_comprehensive_report()
+        results = [result for _, result in builds]
+        wants_exe = not self.streaming or "exe" in self.artifacts
+        return all(r["status"] != "failed" for r in results) and (bool(linked) or not wants_exe)
+
+    def target_pipeline(self, triple, output_file):
+        """Pipeline for one triple in its own sub-workspace, with the job's seed and options"""
+        work_dir = self.path(triple)
+        work_dir.mkdir(exist_ok=True)
+        # Targets share bitcode between stages, so they never stream it
+        return AdvancedObfuscationPipeline(
+            self.input_file, output_file, stage_limits=self.stage_limits, seed=self.seed, work_dir=work_dir,
+            incremental=self.incremental, pass_options=self.pass_options, opt_level=self.opt_level,
+            pass_hosts=self.pass_hosts, size_optimize=self.size_optimize, ordered=self.ordered,
+            pch_cache=self.pch_cache, target=triple
+        )
+
+    def target_exe(self, triple):
+        windows = "windows" in triple
+        return self.output_file.with_name(f"{self.output_file.stem}-{triple}{'.exe' if windows else ''}")
+
+    def obfuscate_family(self, triple, passes):
+        """Frontend and passes for one ABI family, compiled for `triple`.
+
+        Returns (pipeline, final bitcode or None, seconds); safe to run concurrently.
+        """
+        pipeline = self.target_pipeline(triple, self.target_exe(triple))
+        start = time.time()
+        try:
+            final_bc = pipeline.obfuscate_bitcode(passes)
+            pipeline.generate_comprehensive_report()
+        except Exception as e:
+            final_bc = None
+            pipeline.last_stderr = str(e)
+        return pipeline, final_bc, round(time.time() - start, 4)
+
+    def build_target(self, family, final_bc, obfuscation_seconds, triple):
+        """llc and link for one triple from its ABI family's bitcode; safe to run concurrently"""
+        exe = self.target_exe(triple)
+        pipeline = self.target_pipeline(triple, exe)
+        # Streamed jobs keep only the artifacts they asked for
+        wanted = (lambda kind: kind in self.artifacts) if self.streaming else (lambda kind: True)
+        if final_bc is not None and (wanted("exe") or wanted("object")):
+            try:
+                pipeline.compile_and_link(final_bc, link=wanted("exe"))
+            except Exception as e:
+                pipeline.last_stderr = str(e)
+        timings = dict(pipeline.pass_times)
+        steps = {step["step"]: step for step in pipeline.report_data["steps"]}
+        compiled = steps.get("llc_compile", {}).get("status") == "success"
+        # Per-target files sit in the job workspace under names no other target uses
+        obj = self.path(f"final-{triple}.o")
+        if compiled and pipeline.path("final.o").exists():
+            if wanted("object"):
+                shutil.move(str(pipeline.path("final.o")), str(obj))
+            else:
+                pipeline.path("final.o").unlink()
+        final_ll = self.path(f"final-{triple}.ll")
+        if wanted("llvm_ir") and family.final_ll and family.final_ll.exists():
+            shutil.copy2(str(family.final_ll), str(final_ll))
+        try:
+            security_score = json.loads(family.path("report.json").read_text(encoding="utf-8"))["metadata"]["security_score"]
+        except (OSError, ValueError, KeyError):
+            security_score = None
+        result = {
+            "triple": triple,
+            # The triple the shared IR was compiled for; the same for the whole ABI family
+            "ir_target": family.target,
+            "status": "failed",
+            "object": str(obj) if obj.exists() else None,
+            "llvm_ir": str(final_ll) if final_ll.exists() else None,
+            "exe": None,
+            "bytes": None,
+            "obfuscation_seconds": obfuscation_seconds,
+            "codegen_seconds": round(timings["llc_compile"], 4) if "llc_compile" in timings else None,
+            "link_seconds": round(timings["final_link"], 4) if "final_link" in timings else None,
+            "security_score": security_score,
+        }
+        if exe.exists():
+            result.update({"status": "linked", "exe": str(exe), "bytes": exe.stat().st_size})
+        elif compiled:
+            result["status"] = "link_failed" if wanted("exe") else "compiled"
+        elif final_bc is not None and not (wanted("exe") or wanted("object")):
+            # A streamed job that kept only IR or bitcode never reaches llc
+            result["status"] = "obfuscated"
+        if result["status"] in ("failed", "link_failed"):
+            result["error"] = (pipeline if final_bc is not None else family).get_last_stderr()
+        return pipeline, result
+
+    def size_optimized_link(self, obj_path, pass_fds=()):
+        """Link once per size step, keeping each step's flags only if it linked.
+
+        Steps are cumulative, so every size in the report is the effect of one
+        more step on top of the ones before it. A step the toolchain can't do
+        (no lld for ICF, say) is recorded as failed and skipped. Protections
+        are kept: constructors (string decryption) are GC roots, opaque
+        predicate seeds are referenced by volatile stores, and --icf=safe only
+        folds functions whose address is never taken.
+        """
+        kept_flags = []
+        best = None
+        steps = []
+        for step, flags in SIZE_STEPS:
+            candidate = self.path(f"link_{step}{self.output_file.suffix}")
+            cmd = ["clang", obj_path, *kept_flags, *flags, "-o", str(candidate), *self.link_flags()]
+            ok = self.run_command(cmd, f"Size Link ({step})", stage="link", pass_fds=pass_fds) and candidate.exists()
+            entry = {"step": step, "flags": flags, "status": "success" if ok else "failed"}
+            if ok:
+                size = candidate.stat().st_size
+                previous = best[1] if best else size
+                entry.update({
+                    "bytes": size,
+                    "saved_bytes": previous - size,
+                    "saved_pct": round((previous - size) / previous * 100, 2) if previous else 0.0,
+                })
+                kept_flags += flags
+                if best:
+                    best[0].unlink()
+                best = (candidate, size)
+            steps.append(entry)
+            self.report_data["steps"].append({
+                "step": f"size_link_{step}",
+                "command": " ".join(["clang", Path(obj_path).name, *cmd[2:]]),
+                "status": entry["status"],
+                "output": f"{entry['bytes']} bytes" if ok else self.get_last_stderr()
+            })
+            if self.limit_violation or (step == "baseline" and not ok):
+                break
+
+        if best:
+            shutil.move(str(best[0]), str(self.output_file))
+        baseline = steps[0].get("bytes") if steps else None
+        final = best[1] if best else None
+        self.report_data["size_optimization"] = {
+            "steps": steps,
+            "flags": kept_flags,
+            "baseline_bytes": baseline,
+            "final_bytes": final,
+            "reduction_pct": round((baseline - final) / baseline * 100, 2) if baseline and final else None,
+        }
+        return best is not None
+
+    def apply_passes(self, passes, current_bc, first_index=0):
+        """Run passes in order starting from current_bc.
+
+        Returns the final bitcode path, or None if a stage limit killed the job.
+        """
+        for i, (pass_name, description, plugin) in enumerate(passes, first_index):
+            step_start = time.time()
+            next_bc = self.path(f"pass_{i}.bc")
+            next_ll = self.path(f"pass_{i}.ll")
             
-            success = self.output_file.exists()
+            # Run the optimization pass
+            pass_success = self.run_opt_pass(current_bc, next_ll, pass_name, description, plugin, next_bc)
             
-            # Always generate the comprehensive report
-            self.generate_comprehensive_report()
+            # Record step with timing
+            step_duration = time.time() - step_start
+            self.pass_times.append((pass_name, step_duration))
+            
+            step_info = {
+                "step": f"opt-pass-{pass_name}",
+                "command": f"opt -load-pass-plugin build/{plugin} -passes {self.pass_pipeline_name(pass_name)} -S {current_bc} -o {next_ll}",
+                "status": "success" if pass_success else "failed",
+                "stderr": self.get_last_stderr()
+            }
+            
+            if not pass_success:
+                print(f"Pass {pass_name} failed, continuing...")
+                shutil.copy2(str(current_bc), str(next_bc))
+                step_info["status"] = "failed"
+                step_info["error"] = "Pass execution failed"
+            else:
+                self.intermediate_files.append(next_ll)
+                self.final_ll = next_ll.resolve()
+                # A pass host returns bitcode alongside the IR; opt needs llvm-as
+                if not next_bc.exists() and not self.llvm_as(next_ll, next_bc):
+                    step_info["status"] = "failed"
+                    step_info["error"] = "LLVM assembly failed"
+                else:
+                    # Add pass details if available
+                    pass_details = self.get_pass_details(pass_name)
+                    if pass_details:
+                        step_info["details"] = pass_details
             
-            return success
+            if self.limit_violation:
+                step_info["status"] = "killed"
+                step_info["error"] = f"{self.limit_violation['limit']} limit exceeded"
+                self.report_data["steps"].append(step_info)
+                return None
             
-        finally:
-            # Always change back to original directory
-            os.chdir(original_cwd)
+            self.report_data["steps"].append(step_info)
+            if next_bc.exists():
+                self.intermediate_files.append(next_bc)
+            current_bc = next_bc
+        
+        return current_bc
+
+    def run_incremental(self, passes, bc_file):
+        """Re-obfuscate only functions whose pre-obfuscation IR changed.
+
+        Passes keep their normal order, so the output matches a full run:
+        the list is split into runs of consecutive function passes and of
+        module passes (stringenc, rename-symbols, dynamic-xor, anti-debug).
+        Module runs go over the whole module; each function run is cached per
+        function on the IR it receives. Returns the final bitcode path, or None if a
+        stage limit killed the job.
+        """
+        segments = []
+        for pass_info in passes:
+            per_function = pass_info[0] in FUNCTION_PASSES
+            if segments and segments[-1][0] == per_function:
+                segments[-1][1].append(pass_info)
+            else:
+                segments.append((per_function, [pass_info]))
+        if not any(per_function for per_function, _ in segments):
+            return self.apply_passes(passes, bc_file)
+
+        stats = []
+        current_bc = bc_file
+        first_index = 0
+        for number, (per_function, segment) in enumerate(segments):
+            if per_function:
+                current_bc = self.run_function_segment(segment, current_bc, first_index, number, stats)
+            else:
+                current_bc = self.apply_passes(segment, current_bc, first_index=first_index)
+            if current_bc is None:
+                return None
+            first_index += len(segment)
+
+        functions = sum(s["functions"] for s in stats)
+        reused = sum(s["reused"] for s in stats)
+        self.report_data["incremental"] = {
+            "functions": functions,
+            "reused": reused,
+            "recompiled": sum(s["recompiled"] for s in stats),
+            "reuse_ratio": round(reused / functions, 3) if functions else 0.0,
+            "reused_functions": sorted({name for s in stats for name in s.pop("reused_functions")}),
+            "recompiled_functions": sorted({name for s in stats for name in s.pop("recompiled_functions")}),
+            "segments": stats,
+        }
+        return current_bc
+
+    def run_function_segment(self, passes, bc_file, first_index, number, stats):
+        """Run consecutive function passes, reusing cached bodies of unchanged functions.
+
+        Appends this segment's reuse counts to stats. If the IR can't be split
+        or spliced, the segment runs normally over the whole module.
+        """
+        input_ll = self.path(f"input_{number}.ll")
+        if not self.llvm_dis(bc_file, input_ll):
+            print("Incremental mode unavailable, running passes over the whole module")
+            return None if self.limit_violation else self.apply_passes(passes, bc_file, first_index)
+        source_text = input_ll.read_text(encoding='utf-8')
+        self.intermediate_files.append(input_ll)
+
+        # Key on the plugin build too, so rebuilt passes invalidate the cache
+        backend_dir = Path(__file__).parent
+        fingerprints = []
+        for pass_name, _, plugin in passes:
+            plugin_path = backend_dir / "build" / plugin
+            mtime = int(plugin_path.stat().st_mtime) if plugin_path.exists() else 0
+            fingerprints.append(f"{self.pass_pipeline_name(pass_name)}@{mtime}")
+
+        functions = split_functions(source_text)
+        keys = {
+            name: function_key(source_text, source_text[start:end], self.seed, fingerprints)
+            for name, (start, end) in functions.items()
+        }
+        reused = {}
+        for name, key in keys.items():
+            entry = self.function_cache.get(key)
+            # Entries without per-pass reports can't be credited in the report
+            if entry and "reports" in entry:
+                reused[name] = entry
+        changed = [name for name in functions if name not in reused]
+        print(f"Incremental: reusing {len(reused)} of {len(functions)} functions before {passes[0][0]}")
+
+        step_start = time.time()
+        first_pass = len(self.report_data.setdefault("advanced_passes", []))
+        current_bc = bc_file
+        text = source_text
+        if changed:
+            marked_text = source_text
+            for name in reused:
+                start, end = split_functions(marked_text)[name]
+                marked_text = marked_text[:start] + mark_skipped(marked_text[start:end]) + marked_text[end:]
+            marked_ll = self.path(f"incremental_input_{number}.ll")
+            marked_bc = self.path(f"incremental_input_{number}.bc")
+            marked_ll.write_text(marked_text, encoding='utf-8')
+            if not self.llvm_as(marked_ll, marked_bc):
+                return None if self.limit_violation else self.apply_passes(passes, bc_file, first_index)
+            self.intermediate_files += [marked_ll, marked_bc]
+
+            first_step = len(self.report_data["steps"])
+            current_bc = self.apply_passes(passes, marked_bc, first_index)
+            if current_bc is None:
+                return None
+            passes_ok = all(step["status"] == "success" for step in self.report_data["steps"][first_step:])
+
+            obfuscated_ll = self.path(f"incremental_obfuscated_{number}.ll")
+            if not self.llvm_dis(current_bc, obfuscated_ll):
+                return None if self.limit_violation else current_bc
+            text = obfuscated_ll.read_text(encoding='utf-8')
+
+            # Only cache bodies produced by a fully successful run, with what
+            # each pass reported for them
+            if passes_ok:
+                reports = {
+                    step["step"][len("opt-pass-"):]: self.function_reports(step.get("stderr", ""))
+                    for step in self.report_data["steps"][first_step:]
+                }
+                obfuscated = split_functions(text)
+                for name in changed:
+                    if name in obfuscated:
+                        start, end = obfuscated[name]
+                        entry = capture_function(text, text[start:end])
+                        entry["reports"] = {
+                            pass_name: by_function[name] for pass_name, by_function in reports.items()
+                            if name in by_function
+                        }
+                        self.function_cache.put(keys[name], entry)
+
+        for name, entry in reused.items():
+            text = splice_function(text, name, entry)
+        text = clear_skipped(text)
+
+        spliced_ll = self.path(f"incremental_spliced_{number}.ll")
+        spliced_bc = self.path(f"incremental_spliced_{number}.bc")
+        spliced_ll.write_text(text, encoding='utf-8')
+        if not self.llvm_as(spliced_ll, spliced_bc):
+            print("Splicing cached functions failed, running passes over the whole module")
+            return None if self.limit_violation else self.apply_passes(passes, bc_file, first_index)
+        self.intermediate_files += [spliced_ll, spliced_bc]
+        self.final_ll = spliced_ll.resolve()
+        self.pass_times.append((f"incremental_splice_{number}", time.time() - step_start))
+        self.credit_reused_functions(passes, reused, first_pass)
+
+        stats.append({
+            "passes": [p[0] for p in passes],
+            "functions": len(functions),
+            "reused": len(reused),
+            "recompiled": len(changed),
+            "reused_functions": sorted(reused),
+            "recompiled_functions": sorted(changed),
+        })
+        return spliced_bc
 
-    def run_command(self, cmd, description):
-        """Run a command and return success status"""
+    def credit_reused_functions(self, passes, reused, first_pass):
+        """Add what each pass reported for reused functions to the pass report.
+
+        A pass that ran on changed functions gets the cached reports merged into
+        its details; a pass that didn't run because every function was reused is
+        recorded as applied, as a full run would have recorded it.
+        """
+        if not reused:
+            return
+        entries = self.report_data["advanced_passes"]
+        for pass_name, description, _ in passes:
+            data = next((p for p in entries[first_pass:] if p["pass"] == pass_name), None)
+            if data is None:
+                data = {"pass": pass_name, "description": description, "status": "success"}
+                entries.append(data)
+            if data.get("status") != "success":
+                continue
+            details = data.setdefault("details", {})
+            for entry in reused.values():
+                if pass_name in entry["reports"]:
+                    self.merge_report(details, entry["reports"][pass_name])
+            data["reused_functions"] = len(reused)
+
+    def run_post_optimization(self, final_bc):
+        """Re-optimize obfuscated bitcode with a pipeline that keeps the protections.
+
+        Records which protections survived by comparing their traces in the IR
+        before and after. Returns the bitcode to compile (final_bc itself if
+        the pipeline failed), or None if a stage limit killed the job.
+        """
+        step_start = time.time()
+        pipeline = POST_OBFUSCATION_PIPELINES[self.opt_level]
+        before_ll = self.path("pre_opt.ll")
+        after_bc = self.path("post_opt.bc")
+        after_ll = self.path("post_opt.ll")
+
+        success = self.run_command(
+            ["opt", "-passes", pipeline, str(final_bc), "-o", str(after_bc)],
+            "Post-obfuscation Optimization", stage="opt:post-optimization"
+        )
+        duration = time.time() - step_start
+        self.pass_times.append(("post_optimization", duration))
+        step_info = {
+            "step": "post_optimization",
+            "command": f"opt -passes '{pipeline}' {final_bc} -o {after_bc}",
+            "status": "success" if success else "failed",
+        }
+        if self.limit_violation:
+            step_info["status"] = "killed"
+            self.report_data["steps"].append(step_info)
+            return None
+        if not success:
+            step_info["error"] = self.get_last_stderr()
+            self.report_data["steps"].append(step_info)
+            print("Post-obfuscation optimization failed, compiling unoptimized output")
+            return final_bc
+
+        survival = {}
+        if self.llvm_dis(final_bc, before_ll) and self.llvm_dis(after_bc, after_ll):
+            survival = protection_survival(
+                self.applied_passes(), before_ll.read_text(encoding='utf-8'), after_ll.read_text(encoding='utf-8')
+            )
+            self.intermediate_files += [before_ll, after_ll]
+            self.final_ll = after_ll.resolve()
+        elif self.limit_violation:
+            return None
+        self.intermediate_files.append(after_bc)
+
+        self.report_data["steps"].append(step_info)
+        self.record_post_optimization(pipeline, duration, survival)
+        return after_bc
+
+    def stream_post_optimization(self, module):
+        """run_post_optimization over in-memory bitcode.
+
+        Returns (bitcode, its IR text or None); the bitcode is None if a stage
+        limit killed the job.
+        """
+        step_start = time.time()
+        pipeline = POST_OBFUSCATION_PIPELINES[self.opt_level]
+        result = self.pipe_command(["opt", "-passes", pipeline, "-", "-o", "-"], "opt:post-optimization", module)
+        duration = time.time() - step_start
+        self.pass_times.append(("post_optimization", duration))
+        step_info = {
+            "step": "post_optimization",
+            "command": f"opt -passes '{pipeline}' - -o -",
+            "status": "success" if result is not None and result.returncode == 0 else "failed",
+        }
+        if self.limit_violation:
+            step_info["status"] = "killed"
+            self.report_data["steps"].append(step_info)
+            return None, None
+        if step_info["status"] == "failed":
+            step_info["error"] = self.get_last_stderr()
+            self.report_data["steps"].append(step_info)
+            print("Post-obfuscation optimization failed, compiling unoptimized output")
+            return module, None
+
+        before, after = self.disassemble(module), self.disassemble(result.stdout)
+        if self.limit_violation:
+            return None, None
+        survival = {}
+        if before is not None and after is not None:
+            survival = protection_survival(self.applied_passes(), before, after)
+
+        self.report_data["steps"].append(step_info)
+        self.record_post_optimization(pipeline, duration, survival)
+        return result.stdout, after
+
+    def applied_passes(self):
+        """(pass name, details) of every pass that succeeded"""
+        return [
+            (p["pass"], p.get("details", {})) for p in self.report_data.get("advanced_passes", [])
+            if p.get("status") == "success"
+        ]
+
+    def record_post_optimization(self, pipeline, duration, survival):
+        self.report_data["post_optimization"] = {
+            "opt_level": self.opt_level,
+            "pipeline": pipeline,
+            "seconds": round(duration, 4),
+            "protections": survival,
+            "lost": sorted(name for name, s in survival.items() if s["survived"] is False),
+        }
+        for name, s in survival.items():
+            status = "✅" if s["survived"] is not False else "⚠️"
+            print(f"{status} {name}: {s['before']} -> {s['after']} traces after {self.opt_level}")
+
+    def run_command(self, cmd, description, stage="compile", pass_fds=()):
+        """Run a command under its stage limits and return success status"""
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+            result = run_limited(cmd, stage, self.stage_limits, pass_fds=pass_fds)
             self.last_stderr = result.stderr
             self.last_stdout = result.stdout
             return result.returncode == 0
+        except LimitExceeded as e:
+            self.record_limit_violation(e)
+            return False
         except Exception as e:
             self.last_stderr = str(e)
             return False
     
+    def pipe_command(self, cmd, stage, input_bytes=None):
+        """Run a command with bytes on stdin and stdout under its stage limits.
+
+        Returns the CompletedProcess (stdout as bytes), or None if it couldn't
+        run or a stage limit killed it.
+        """
+        try:
+            result = run_limited(cmd, stage, self.stage_limits, input_bytes=input_bytes, binary=True)
+        except LimitExceeded as e:
+            self.record_limit_violation(e)
+            return None
+        except Exception as e:
+            self.last_stderr = str(e)
+            return None
+        self.last_stderr = result.stderr
+        self.bytes_piped += len(input_bytes or b"") + len(result.stdout)
+        return result
+
+    def disassemble(self, module):
+        """IR text of in-memory bitcode, or None"""
+        result = self.pipe_command(["llvm-dis", "-", "-o", "-"], "assemble", module)
+        if result is None or result.returncode != 0:
+            return None
+        return result.stdout.decode('utf-8', errors='ignore')
+
+    def record_limit_violation(self, error):
+        """Remember the stage and limit that killed this job"""
+        self.limit_violation = error.to_dict()
+        self.last_stderr = str(error)
+        print(f"⛔ {error}")
+    
     def get_last_stderr(self):
         """Get the last stderr output"""
         return getattr(self, 'last_stderr', '')
@@ -182,37 +978,43 @@ class AdvancedObfuscationPipeline:
                 return pass_info.get("details", {})
         return {}
 
-    def run_opt_pass(self, input_bc, output_ll, pass_name, description, plugin):
+    def pass_pipeline_name(self, pass_name):
+        """Pass name as given to opt -passes, carrying the seed where supported"""
+        if self.seed and pass_name in SEEDED_PASSES:
+            return f"{pass_name}<seed={self.seed}>"
+        if pass_name in self.pass_options:
+            return f"{pass_name}<{self.pass_options[pass_name]}>"
+        return pass_name
+
+    def run_opt_pass(self, input_bc, output_ll, pass_name, description, plugin, output_bc=None):
         """Run a single opt pass"""
+        if self.pass_hosts is not None and output_bc is not None:
+            return self.run_host_pass(input_bc, output_ll, output_bc, pass_name, description)
+
         backend_dir = Path(__file__).parent
         plugin_path = backend_dir / "build" / plugin
         
         cmd = [
             "opt", "-load-pass-plugin", str(plugin_path),
-            "-passes", pass_name, "-S", str(input_bc), "-o", str(output_ll)
+            "-passes", self.pass_pipeline_name(pass_name), "-S", str(input_bc), "-o", str(output_ll)
         ]
         
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+            result = run_limited(cmd, f"opt:{pass_name}", self.stage_limits)
             self.last_stderr = result.stderr
+        except LimitExceeded as e:
+            self.record_limit_violation(e)
+            return False
         except Exception as e:
             self.last_stderr = str(e)
             return False
         
         if result.returncode != 0:
-            soft_errors = [
-                "broken module", "verifier failed", "does not dominate",
-                "instruction does not dominate all uses", "terminator found in the middle"
-            ]
-            
             error_msg = result.stderr.lower() if result.stderr else ""
-            is_soft_error = any(soft_err in error_msg for soft_err in soft_errors)
+            is_soft_error = any(soft_err in error_msg for soft_err in SOFT_ERRORS)
             
             if is_soft_error:
-                self.report_data["advanced_passes"].append({
-                    "pass": pass_name, "description": description,
-                    "status": "soft_failure", "error": "Soft failure"
-                })
+                self.record_soft_failure(pass_name, description)
                 with open(output_ll, 'w', encoding='utf-8') as f:
                     f.write("; Empty file due to pass failure\n")
                 return True
@@ -222,6 +1024,78 @@ class AdvancedObfuscationPipeline:
         self.parse_pass_output(result.stderr, pass_name, description)
         return True
     
+    def run_host_pass(self, input_bc, output_ll, output_bc, pass_name, description):
+        """Run a single pass on a persistent pass host, writing both IR and bitcode"""
+        stage = f"opt:{pass_name}"
+        try:
+            response = self.pass_hosts.run(self.pass_pipeline_name(pass_name), Path(input_bc).read_bytes(), stage)
+        except LimitExceeded as e:
+            self.record_limit_violation(e)
+            return False
+        except Exception as e:
+            self.last_stderr = str(e)
+            return False
+
+        self.last_stderr = response.get("stderr", "")
+        if not response.get("ok"):
+            if not response.get("soft"):
+                self.last_stderr += response.get("error") or ""
+                return False
+            self.record_soft_failure(pass_name, description)
+            with open(output_ll, 'w', encoding='utf-8') as f:
+                f.write("; Empty file due to pass failure\n")
+            return True
+
+        Path(output_bc).write_bytes(response["bitcode"])
+        with open(output_ll, 'w', encoding='utf-8') as f:
+            f.write(response["ll"])
+        self.parse_pass_output(self.last_stderr, pass_name, description)
+        return True
+
+    def stream_pass(self, module, pass_name, description, plugin):
+        """Run a single pass over in-memory bitcode.
+
+        Returns the new bitcode, or None if the pass failed; a pass that left
+        broken IR is recorded as a soft failure and its input is kept.
+        """
+        stage = f"opt:{pass_name}"
+        pipeline = self.pass_pipeline_name(pass_name)
+        if self.pass_hosts is not None:
+            try:
+                response = self.pass_hosts.run(pipeline, module, stage, emit_ll=False)
+            except LimitExceeded as e:
+                self.record_limit_violation(e)
+                return None
+            except Exception as e:
+                self.last_stderr = str(e)
+                return None
+            self.last_stderr = response.get("stderr", "")
+            ok, soft, output = response.get("ok"), response.get("soft"), response["bitcode"]
+            if not ok and not soft:
+                self.last_stderr += response.get("error") or ""
+        else:
+            plugin_path = Path(__file__).parent / "build" / plugin
+            result = self.pipe_command(
+                ["opt", "-load-pass-plugin", str(plugin_path), "-passes", pipeline, "-", "-o", "-"], stage, module
+            )
+            if result is None:
+                return None
+            ok, output = result.returncode == 0, result.stdout
+            soft = not ok and any(soft_err in result.stderr.lower() for soft_err in SOFT_ERRORS)
+
+        if not ok:
+            if soft:
+                self.record_soft_failure(pass_name, description)
+            return None
+        self.parse_pass_output(self.last_stderr, pass_name, description)
+        return output
+
+    def record_soft_failure(self, pass_name, description):
+        self.report_data.setdefault("advanced_passes", []).append({
+            "pass": pass_name, "description": description,
+            "status": "soft_failure", "error": "Soft failure"
+        })
+
     def safe_json_parse(self, json_str):
         """Safely parse JSON with error recovery for invalid escape sequences"""
         try:
@@ -286,14 +1160,19 @@ class AdvancedObfuscationPipeline:
                 # Look for JSON data in stderr
                 if "{" in stderr and "}" in stderr:
                     try:
-                        json_start = stderr.find('{')
-                        json_end = stderr.rfind('}') + 1
-                        json_str = stderr[json_start:json_end]
-                        
-                        # Use safe JSON parsing
-                        json_data = self.safe_json_parse(json_str)
+                        # Function passes print one JSON line per function
+                        json_data = self.merge_function_reports(stderr)
+                        if json_data is None:
+                            json_start = stderr.find('{')
+                            json_end = stderr.rfind('}') + 1
+                            json_str = stderr[json_start:json_end]
+                            
+                            # Use safe JSON parsing
+                            json_data = self.safe_json_parse(json_str)
                         
                         if json_data:
+                            if isinstance(json_data, dict):
+                                json_data.pop("function", None)
                             data["details"] = json_data
                             print(f"✅ Successfully parsed {pass_name} output")
                             
@@ -343,6 +1222,50 @@ class AdvancedObfuscationPipeline:
                 "status": "success", "message": f"Output parsing failed: {str(e)}"
             })
     
+    def merge_function_reports(self, stderr):
+        """Sum the numeric fields of several one-line JSON reports, or None if there aren't several"""
+        reports = []
+        for line in stderr.splitlines():
+            line = line.strip()
+            if line.startswith('{') and line.endswith('}'):
+                try:
+                    reports.append(json.loads(line))
+                except json.JSONDecodeError:
+                    return None
+        if len(reports) < 2:
+            return None
+
+        merged = {}
+        for report in reports:
+            self.merge_report(merged, report)
+        return merged
+
+    def merge_report(self, into, report):
+        """Add one pass report into another: numbers are summed, nested objects merged"""
+        for key, value in report.items():
+            if key == "function":
+                continue
+            if key not in into:
+                into[key] = value
+            elif isinstance(value, dict) and isinstance(into[key], dict):
+                self.merge_report(into[key], value)
+            elif isinstance(value, (int, float)) and isinstance(into[key], (int, float)):
+                into[key] = round(into[key] + value, 4)
+
+    def function_reports(self, stderr):
+        """Map function name -> the one-line JSON report a function pass printed for it"""
+        reports = {}
+        for line in (stderr or "").splitlines():
+            line = line.strip()
+            if line.startswith('{') and line.endswith('}'):
+                try:
+                    report = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(report, dict) and "function" in report:
+                    reports[report.pop("function")] = report
+        return reports
+    
     def extract_pass_data_from_text(self, text, pass_name):
         """Extract pass data from text when JSON parsing fails"""
         data = {}
@@ -379,12 +1302,45 @@ class AdvancedObfuscationPipeline:
         return data if data else None
     
     def emit_bc(self, output_bc):
-        cmd = ["clang", "-O0", "-c", "-emit-llvm", str(self.input_file), "-o", str(output_bc)]
-        return self.run_command(cmd, "Emit BC")
+        cmd = self.frontend_command(output_bc)
+        start = time.time()
+        success = self.run_command(cmd, "Emit BC", stage="compile")
+        if not success and "-include-pch" in cmd and not self.limit_violation:
+            # A PCH clang rejects must not fail the job; compile without it
+            self.frontend["pch"] = "rejected"
+            start = time.time()
+            success = self.run_command(self.frontend_command(output_bc, use_pch=False), "Emit BC", stage="compile")
+        self.record_frontend(time.time() - start)
+        return success
+    
+    def frontend_command(self, output, use_pch=True):
+        """clang command for the initial bitcode, loading the cached PCH of the source's headers if any"""
+        flags = [f"-{self.opt_level}"]
+        if self.target:
+            # The frontend lowers calls, varargs and type layout for the target's ABI,
+            # so cross builds start from IR clang produced for that target
+            flags.append(f"--target={self.target}")
+        if use_pch:
+            pch = self.pch_cache.lookup(self.input_file, flags) if self.pch_cache else None
+            pch = pch or {"status": "none", "pch": None, "headers": []}
+            self.frontend = {"pch": pch["status"], "headers": pch["headers"], "build_seconds": pch.get("build_seconds")}
+        include = ["-include-pch", str(pch["pch"])] if use_pch and pch["pch"] else []
+        return ["clang", *flags, "-c", "-emit-llvm", *include, str(self.input_file), "-o", str(output)]
+    
+    def record_frontend(self, seconds):
+        """Frontend time of this job and the header parsing a cached PCH saved it"""
+        self.frontend["seconds"] = round(seconds, 4)
+        # A hit skips what parsing the headers cost when the PCH was built
+        self.frontend["saved_seconds"] = self.frontend["build_seconds"] if self.frontend["pch"] == "hit" else 0.0
+        self.report_data["frontend"] = self.frontend
     
     def llvm_as(self, input_ll, output_bc):
         cmd = ["llvm-as", str(input_ll), "-o", str(output_bc)]
-        return self.run_command(cmd, "LLVM Assemble")
+        return self.run_command(cmd, "LLVM Assemble", stage="assemble")
+    
+    def llvm_dis(self, input_bc, output_ll):
+        cmd = ["llvm-dis", str(input_bc), "-o", str(output_ll)]
+        return self.run_command(cmd, "LLVM Disassemble", stage="assemble")
     
     def calculate_timing_metrics(self):
         """Calculate timing metrics from pass times"""
@@ -430,18 +1386,57 @@ class AdvancedObfuscationPipeline:
                 "input_file": str(self.input_file),
                 "output_file": str(self.output_file),
                 "obfuscation_level": "advanced",
+                "seed": self.seed,
+                "incremental": self.incremental,
+                "opt_level": self.opt_level,
+                "pass_options": self.pass_options,
+                "pass_host": self.pass_hosts is not None,
+                "streaming": self.streaming,
+                "size_optimize": self.size_optimize,
+                "targets": self.targets,
+                "pass_order": self.pass_order,
+                "security_score": self.calculate_security_score(metrics),
                 "security_rating": self.calculate_security_rating(metrics)
             },
             "metrics": metrics,
             "timing": timing,
+            "pass_timings": [{"pass": name, "seconds": round(duration, 4)} for name, duration in self.pass_times],
             "file_sizes": file_sizes,
             "steps": self.report_data["steps"],
             "pass_reports": self.build_pass_reports(),
             "summary": self.build_summary(metrics)
         }
         
+        if self.limit_violation:
+            report["limit_violation"] = self.limit_violation
+        
+        if "incremental" in self.report_data:
+            report["incremental"] = self.report_data["incremental"]
+        
+        if "post_optimization" in self.report_data:
+            report["post_optimization"] = self.report_data["post_optimization"]
+        
+        if "size_optimization" in self.report_data:
+            report["size_optimization"] = self.report_data["size_optimization"]
+        
+        if "targets" in self.report_data:
+            report["targets"] = self.report_data["targets"]
+        
+        if "frontend" in self.report_data:
+            report["frontend"] = self.report_data["frontend"]
+        
+        report["io"] = self.calculate_io_metrics()
+        
+        # Rename map as its own sorted artifact for symbolizing crash reports
+        rename_details = self.get_pass_details("rename-symbols")
+        if rename_details.get("renamed_functions") or rename_details.get("renamed_globals"):
+            write_symbol_map(
+                self.path("symbols.map"), rename_details.get("renamed_functions", {}), rename_details.get("renamed_globals", {})
+            )
+            report["symbol_map"] = "symbols.map"
+        
         # Write the report
-        with open("report.json", "w", encoding='utf-8') as f:
+        with open(self.path("report.json"), "w", encoding='utf-8') as f:
             json.dump(report, f, indent=2, ensure_ascii=False)
         
         return report
@@ -452,7 +1447,7 @@ class AdvancedObfuscationPipeline:
             "strings_encrypted": 0, "functions_renamed": 0, "globals_renamed": 0,
             "bogus_instr_count": 0, "control_flow_obfuscated": 0,
             "opaque_predicates_added": 0, "anti_debugging_checks": 0,
-            "basic_blocks_split": 0
+            "basic_blocks_split": 0, "blocks_flattened": 0, "opaque_predicate_cycles": 0
         }
         
         print("=== CALCULATING METRICS ===")
@@ -498,8 +1493,9 @@ class AdvancedObfuscationPipeline:
                     print(f"✅ Bogus instructions: {details['bogus_instr_count']}")
                     
             elif pass_name == "cfflatten":
-                metrics["control_flow_obfuscated"] = 1
-                print("✅ Control flow flattened")
+                metrics["control_flow_obfuscated"] = details.get("functions_flattened", 0)
+                metrics["blocks_flattened"] = details.get("blocks_flattened", 0)
+                print(f"✅ Control flow flattened: {metrics['control_flow_obfuscated']} functions")
                 
             elif pass_name == "opaque-preds":
                 # Count actual predicates if available, otherwise mark as applied
@@ -507,10 +1503,11 @@ class AdvancedObfuscationPipeline:
                     metrics["opaque_predicates_added"] = details["predicates_added"]
                 else:
                     metrics["opaque_predicates_added"] = 1
+                metrics["opaque_predicate_cycles"] = details.get("estimated_cycles", 0)
                 print("✅ Opaque predicates added")
                 
             elif pass_name == "anti-debug":
-                metrics["anti_debugging_checks"] = 1
+                metrics["anti_debugging_checks"] = details.get("checks_inserted", 1)
                 print("✅ Anti-debugging checks added")
                 
             elif pass_name == "bbsplit":
@@ -541,6 +1538,22 @@ class AdvancedObfuscationPipeline:
                 pass_reports.append(report)
         return pass_reports
     
+    def calculate_io_metrics(self):
+        """Workspace writes of this job so far (the report itself comes after)"""
+        fs_type = filesystem_type(self.work_dir)
+        files, written = workspace_usage(self.work_dir)
+        in_memory = fs_type in MEMORY_FILESYSTEMS
+        return {
+            "mode": "streaming" if self.streaming else "files",
+            "artifacts": sorted(self.artifacts) if self.streaming else None,
+            "workspace_fs": fs_type,
+            "files_written": files,
+            "workspace_bytes": written,
+            # tmpfs workspaces live in memory, so they cost no disk writes
+            "disk_bytes_written": 0 if in_memory else written,
+            "bytes_piped": self.bytes_piped,
+        }
+
     def calculate_file_sizes(self):
         """Calculate file sizes including intermediate files"""
         sizes = {}
@@ -550,8 +1563,9 @@ class AdvancedObfuscationPipeline:
             sizes["output_size"] = self.output_file.stat().st_size
         
         # Add intermediate file sizes if they exist
-        bc_files = list(Path(".").glob("*.bc"))
-        ll_files = list(Path(".").glob("*.ll"))
+        existing = [f for f in self.intermediate_files if f.exists()]
+        bc_files = [f for f in existing if f.suffix == ".bc"]
+        ll_files = [f for f in existing if f.suffix == ".ll"]
         
         if bc_files:
             sizes["largest_bc"] = max(f.stat().st_size for f in bc_files)
@@ -564,6 +1578,17 @@ class AdvancedObfuscationPipeline:
     
     def calculate_security_rating(self, metrics):
         """Calculate security rating based on applied obfuscations"""
+        score = self.calculate_security_score(metrics)
+        
+        if score >= 8:
+            return "HIGH"
+        elif score >= 5:
+            return "MEDIUM"
+        else:
+            return "BASIC"
+    
+    def calculate_security_score(self, metrics):
+        """Weighted protection score (0-13) behind the security rating"""
         score = 0
         
         # Weight different obfuscation techniques
@@ -582,12 +1607,7 @@ class AdvancedObfuscationPipeline:
         if metrics["basic_blocks_split"] > 0:
             score += 1
         
-        if score >= 8:
-            return "HIGH"
-        elif score >= 5:
-            return "MEDIUM"
-        else:
-            return "BASIC"
+        return score
     
     def build_summary(self, metrics):
         """Build summary with consistent achievement reporting"""
@@ -631,6 +1651,8 @@ class AdvancedObfuscationPipeline:
             recommendations.append("Additional function renaming would improve obfuscation")
         if metrics['bogus_instr_count'] < 20:
             recommendations.append("Consider adding more bogus instructions for increased complexity")
+        for name in self.report_data.get("post_optimization", {}).get("lost", []):
+            recommendations.append(f"{name} did not survive {self.opt_level} re-optimization; use O0 to keep it")
         
         return {
             "total_passes_applied": successful_passes,
@@ -0,0 +1,151 @@
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    job_id TEXT PRIMARY KEY,
+    content_hash TEXT,
+    techniques TEXT,
+    seed INTEGER,
+    created REAL,
+    status TEXT,
+    security_rating TEXT,
+    total_seconds REAL,
+    metrics TEXT,
+    artifacts TEXT,
+    report TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_hash ON runs (content_hash, created);
+CREATE INDEX IF NOT EXISTS runs_by_created ON runs (created);
+CREATE TABLE IF NOT EXISTS pass_timings (
+    job_id TEXT,
+    pass_name TEXT,
+    seconds REAL
+);
+CREATE INDEX IF NOT EXISTS pass_timings_by_job ON pass_timings (job_id);
+"""
+
+
+class RunHistory:
+    """Indexed SQLite store of every job's report, metrics, timings and artifacts.
+
+    Runs are keyed by job ID and indexed by content hash, so report lookups
+    never scan files and history survives across runs.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.lock = threading.Lock()
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def connect(self):
+        """A connection that commits (or rolls back) and is closed on exit"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record_run(self, job_id, content_hash, techniques, seed, status, report=None, artifacts=None):
+        """Insert or replace one job's run record and its per-pass timings"""
+        report = report or {}
+        metrics = report.get("metrics", {})
+        pass_timings = report.get("pass_timings", [])
+        total_seconds = sum(t["seconds"] for t in pass_timings)
+        with self.lock, self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, content_hash, json.dumps(sorted(techniques or [])), int(seed or 0),
+                    time.time(), status, report.get("metadata", {}).get("security_rating"),
+                    total_seconds, json.dumps(metrics), json.dumps(artifacts or {}),
+                    json.dumps(report, ensure_ascii=False)
+                )
+            )
+            conn.execute("DELETE FROM pass_timings WHERE job_id = ?", (job_id,))
+            conn.executemany(
+                "INSERT INTO pass_timings VALUES (?, ?, ?)",
+                [(job_id, t["pass"], t["seconds"]) for t in pass_timings]
+            )
+
+    def _row_to_run(self, row, include_report=True):
+        if row is None:
+            return None
+        run = dict(row)
+        for field in ("techniques", "metrics", "artifacts", "report"):
+            if field in run:
+                run[field] = json.loads(run[field]) if run[field] else None
+        if not include_report:
+            run.pop("report", None)
+        return run
+
+    def get(self, job_id):
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM runs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_run(row)
+
+    def latest(self, status="success"):
+        """Most recent run with the given status"""
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM runs WHERE status = ? ORDER BY created DESC LIMIT 1", (status,)
+            ).fetchone()
+        return self._row_to_run(row)
+
+    def latest_by_hash(self, content_hash, status="success"):
+        """Most recent run for a source content hash"""
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM runs WHERE content_hash = ? AND status = ? ORDER BY created DESC LIMIT 1",
+                (content_hash, status)
+            ).fetchone()
+        return self._row_to_run(row)
+
+    def runs_by_hash(self, content_hash, status="success", limit=20):
+        """Runs for a source content hash, newest first"""
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM runs WHERE content_hash = ? AND status = ? ORDER BY created DESC LIMIT ?",
+                (content_hash, status, limit)
+            ).fetchall()
+        return [self._row_to_run(row) for row in rows]
+
+    def recent(self, limit=20):
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id, content_hash, techniques, seed, created, status, security_rating, "
+                "total_seconds, metrics FROM runs ORDER BY created DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row_to_run(row, include_report=False) for row in rows]
+
+    def pass_time_trends(self, last_n=50):
+        """Average, min and max time per pass over the last N runs"""
+        with self.connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT pass_name, AVG(seconds) AS avg_seconds, MIN(seconds) AS min_seconds,
+                       MAX(seconds) AS max_seconds, COUNT(*) AS runs
+                FROM pass_timings
+                WHERE job_id IN (SELECT job_id FROM runs ORDER BY created DESC LIMIT ?)
+                GROUP BY pass_name ORDER BY avg_seconds DESC
+                """, (last_n,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def status_counts(self, last_n=50):
+        with self.connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT status, COUNT(*) AS runs, AVG(total_seconds) AS avg_total_seconds
+                FROM (SELECT * FROM runs ORDER BY created DESC LIMIT ?) GROUP BY status
+                """, (last_n,)
+            ).fetchall()
+        return [dict(row) for row in rows]
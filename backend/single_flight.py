@@ -0,0 +1,53 @@
+import asyncio
+import hashlib
+
+
+def job_key(content, techniques, seed, *options):
+    """Identity of an obfuscation job: source content hash, technique set and seed.
+
+    The pipeline applies passes in a fixed order, so the technique list is
+    compared as a set. Any further pipeline options are part of the key too.
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+    return (content_hash, tuple(sorted(set(techniques))), int(seed or 0)) + options
+
+
+class SingleFlight:
+    """Coalesce identical in-flight jobs onto one execution.
+
+    The first caller for a key becomes the leader and runs the job; callers
+    arriving with the same key while it runs wait for the leader and receive
+    the same result, or the same exception if the leader fails.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+        self.coalesced = 0
+
+    def is_inflight(self, key):
+        return key in self.inflight
+
+    async def run(self, key, job):
+        """Run `job()` (a coroutine factory) once per key; returns (result, shared)"""
+        future = self.inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield so a disconnecting waiter cannot cancel the leader's job
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            result = await job()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so a leader failure with no waiters isn't logged as unhandled
+            future.exception()
+            raise
+        finally:
+            del self.inflight[key]
+
+    def stats(self):
+        return {"inflight": len(self.inflight), "coalesced": self.coalesced}
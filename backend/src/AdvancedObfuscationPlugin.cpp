@@ -4,6 +4,19 @@
 
 using namespace llvm;
 
+// Matches "<pass>" or "<pass><seed=N>" so seeded passes can be driven from
+// the pipeline text. Returns false if Name is a different pass.
+bool parseSeededPassName(StringRef Name, StringRef PassName, unsigned &Seed) {
+    Seed = 0;
+    if (!Name.consume_front(PassName))
+        return false;
+    if (Name.empty())
+        return true;
+    if (!Name.consume_front("<seed=") || !Name.consume_back(">"))
+        return false;
+    return !Name.getAsInteger(10, Seed);
+}
+
 // Forward declarations from PrintFuncsPass
 // extern void registerPrintFunctionsPass(PassBuilder &PB);
 extern void registerRenameSymbolsPass(PassBuilder &PB);
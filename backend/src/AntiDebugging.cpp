@@ -1,54 +1,296 @@
+#include "llvm/Analysis/LoopInfo.h"
 #include "llvm/IR/IRBuilder.h"
 #include "llvm/IR/Instructions.h"
+#include "llvm/IR/MDBuilder.h"
 #include "llvm/IR/PassManager.h"
 #include "llvm/Passes/PassBuilder.h"
+#include "llvm/Transforms/Utils/BasicBlockUtils.h"
+#include "llvm/Transforms/Utils/ModuleUtils.h"
+#include <set>
+#include <vector>
 
 using namespace llvm;
 
 namespace {
 
+// Where the debugger check runs. The check itself is a file read on Linux
+// (TracerPid in /proc/self/status), so running it on every call of every
+// function would cost a syscall per call; each mode amortizes it differently.
+enum class CheckMode {
+  Startup, // once per process, from a constructor
+  Sampled, // at startup, then on every Every-th call of an instrumented function
+  Cold,    // on entry to functions that run rarely (see coldFunctions)
+};
+
+struct AntiDebugOptions {
+  CheckMode Mode = CheckMode::Startup;
+  unsigned Every = 1024;
+  // Sampled mode: when nonzero, a due sample re-checks only if this many
+  // seconds passed since the last check
+  unsigned Seconds = 0;
+};
+
+const char *modeName(CheckMode Mode) {
+  switch (Mode) {
+  case CheckMode::Startup: return "startup";
+  case CheckMode::Sampled: return "sampled";
+  case CheckMode::Cold: return "cold";
+  }
+  return "startup";
+}
+
 struct AntiDebugging : public PassInfoMixin<AntiDebugging> {
+  AntiDebugging(AntiDebugOptions opts = {}) : Opts(opts) {}
+
   PreservedAnalyses run(Module &M, ModuleAnalysisManager &AM) {
-    // ONLY add to non-main functions
-    bool changed = false;
-    
-    for (Function &F : M) {
-      if (F.isDeclaration() || F.getName() == "main") continue;
-      
-      // Add simple bogus instruction that does nothing
-      addBogusDebugCheck(&F);
-      changed = true;
-    }
+    std::vector<Function *> functions;
+    for (Function &F : M)
+      if (!F.isDeclaration() && !F.getName().starts_with("__obf_"))
+        functions.push_back(&F);
+    if (functions.empty())
+      return PreservedAnalyses::all();
+
+    // Decide which functions are cold before anything changes
+    std::set<Function *> cold;
+    if (Opts.Mode == CheckMode::Cold)
+      cold = coldFunctions(M, functions, AM);
 
-    if (changed) {
-      errs() << "🕵️‍♂️ AntiDebugging: Added to non-main functions\n";
-      return PreservedAnalyses::none();
+    Function *Check = getCheck(M);
+    unsigned checks = 0;
+    if (Opts.Mode != CheckMode::Cold) {
+      addStartupCheck(M, Check);
+      checks++;
+    }
+    for (Function *F : functions) {
+      if (Opts.Mode == CheckMode::Sampled && F->getName() != "main") {
+        insertSampledCheck(*F, Check);
+        checks++;
+      } else if (Opts.Mode == CheckMode::Cold && cold.count(F)) {
+        IRBuilder<> B(entryInsertionPoint(*F));
+        B.CreateCall(Check);
+        checks++;
+      }
     }
-    return PreservedAnalyses::all();
+
+    errs() << "🕵️‍♂️ AntiDebugging: " << checks << " checks (" << modeName(Opts.Mode) << ")\n";
+    errs() << "{\"pass\": \"anti-debug\", \"mode\": \"" << modeName(Opts.Mode)
+           << "\", \"checks_inserted\": " << checks
+           << ", \"every\": " << (Opts.Mode == CheckMode::Sampled ? Opts.Every : 0)
+           << ", \"seconds\": " << (Opts.Mode == CheckMode::Sampled ? Opts.Seconds : 0)
+           << ", \"target\": \"" << (isWindows(M) ? "windows" : "linux") << "\"}\n";
+    return PreservedAnalyses::none();
   }
 
 private:
-  void addBogusDebugCheck(Function *F) {
-    // Just add a harmless arithmetic operation that gets optimized away
-    BasicBlock &entry = F->getEntryBlock();
-    IRBuilder<> builder(&entry.front());
-    
-    Value *dummy1 = builder.getInt32(42);
-    Value *dummy2 = builder.getInt32(123);
-    builder.CreateAdd(dummy1, dummy2, "bogus_debug_check"); // This does nothing
+  AntiDebugOptions Opts;
+
+  static bool isWindows(Module &M) {
+    // Normalized, so *-mingw32 and *-win32 triples parse as Windows too
+    return Triple(Triple::normalize(Triple(M.getTargetTriple()).str())).isOSWindows();
+  }
+
+  // First instruction after the entry block's allocas, so splitting there
+  // keeps them static
+  static Instruction *entryInsertionPoint(Function &F) {
+    BasicBlock &Entry = F.getEntryBlock();
+    for (Instruction &I : Entry)
+      if (!isa<AllocaInst>(I) && !isa<PHINode>(I))
+        return &I;
+    return Entry.getTerminator();
+  }
+
+  // void __obf_debugger_check(): aborts if a debugger is attached. Kept out of
+  // line so the protection marker survives post-obfuscation inlining.
+  Function *getCheck(Module &M) {
+    if (Function *Check = M.getFunction("__obf_debugger_check"))
+      return Check;
+    LLVMContext &Ctx = M.getContext();
+    Function *Check = Function::Create(FunctionType::get(Type::getVoidTy(Ctx), false),
+                                       GlobalValue::InternalLinkage, "__obf_debugger_check", M);
+    Check->addFnAttr(Attribute::NoInline);
+
+    BasicBlock *Entry = BasicBlock::Create(Ctx, "entry", Check);
+    BasicBlock *Clean = BasicBlock::Create(Ctx, "clean", Check);
+    BasicBlock *Traced = BasicBlock::Create(Ctx, "traced", Check);
+    IRBuilder<> B(Entry);
+    Type *I32 = B.getInt32Ty();
+    Type *Ptr = PointerType::get(Ctx, 0);
+
+    Value *Detected;
+    if (isWindows(M)) {
+      // Reads the PEB; no system call
+      FunctionCallee IsDebuggerPresent = M.getOrInsertFunction("IsDebuggerPresent", I32);
+      Detected = B.CreateICmpNE(B.CreateCall(IsDebuggerPresent), B.getInt32(0));
+    } else {
+      // A traced process has a nonzero "TracerPid:" in /proc/self/status
+      Type *SizeTy = M.getDataLayout().getIntPtrType(Ctx);
+      FunctionCallee Open = M.getOrInsertFunction("open", FunctionType::get(I32, {Ptr, I32}, true));
+      FunctionCallee Read = M.getOrInsertFunction("read", SizeTy, I32, Ptr, SizeTy);
+      FunctionCallee Close = M.getOrInsertFunction("close", I32, I32);
+      FunctionCallee StrStr = M.getOrInsertFunction("strstr", Ptr, Ptr, Ptr);
+      FunctionCallee Atoi = M.getOrInsertFunction("atoi", I32, Ptr);
+
+      const unsigned BufSize = 1024;
+      ArrayType *BufTy = ArrayType::get(B.getInt8Ty(), BufSize);
+      Value *Buf = B.CreateConstInBoundsGEP2_32(BufTy, B.CreateAlloca(BufTy), 0, 0);
+      Value *Fd = B.CreateCall(Open, {B.CreateGlobalStringPtr("/proc/self/status"), B.getInt32(0)});
+      BasicBlock *ReadBB = BasicBlock::Create(Ctx, "read", Check, Clean);
+      B.CreateCondBr(B.CreateICmpSLT(Fd, B.getInt32(0)), Clean, ReadBB);
+
+      B.SetInsertPoint(ReadBB);
+      Value *N = B.CreateCall(Read, {Fd, Buf, ConstantInt::get(SizeTy, BufSize - 1)});
+      B.CreateCall(Close, {Fd});
+      N = B.CreateSelect(B.CreateICmpSLT(N, ConstantInt::get(SizeTy, 0)), ConstantInt::get(SizeTy, 0), N);
+      B.CreateStore(B.getInt8(0), B.CreateInBoundsGEP(B.getInt8Ty(), Buf, N));
+      Value *Field = B.CreateCall(StrStr, {Buf, B.CreateGlobalStringPtr("TracerPid:")});
+      BasicBlock *ParseBB = BasicBlock::Create(Ctx, "parse", Check, Clean);
+      B.CreateCondBr(B.CreateIsNull(Field), Clean, ParseBB);
+
+      B.SetInsertPoint(ParseBB);
+      Value *Pid = B.CreateCall(Atoi, {B.CreateConstInBoundsGEP1_32(B.getInt8Ty(), Field, 10)});
+      Detected = B.CreateICmpNE(Pid, B.getInt32(0));
+    }
+    B.CreateCondBr(Detected, Traced, Clean);
+
+    B.SetInsertPoint(Traced);
+    B.CreateCall(M.getOrInsertFunction("abort", Type::getVoidTy(Ctx)));
+    B.CreateUnreachable();
+
+    B.SetInsertPoint(Clean);
+    B.CreateRetVoid();
+    return Check;
+  }
+
+  void addStartupCheck(Module &M, Function *Check) {
+    LLVMContext &Ctx = M.getContext();
+    Function *Init = Function::Create(FunctionType::get(Type::getVoidTy(Ctx), false),
+                                      GlobalValue::InternalLinkage, "__obf_antidebug_init", M);
+    IRBuilder<> B(BasicBlock::Create(Ctx, "entry", Init));
+    B.CreateCall(Check);
+    B.CreateRetVoid();
+    appendToGlobalCtors(M, Init, 65535);
+  }
+
+  GlobalVariable *getGlobal(Module &M, Type *Ty, StringRef Name) {
+    if (GlobalVariable *G = M.getNamedGlobal(Name))
+      return G;
+    return new GlobalVariable(M, Ty, false, GlobalValue::InternalLinkage, ConstantInt::get(Ty, 0), Name);
+  }
+
+  // if (++calls >= Every) { calls = 0; [if (time(0) - last >= Seconds) { last = now;] check(); [}] }
+  // The counter is a plain global: in threaded programs a lost update only
+  // shifts when the next sample falls.
+  void insertSampledCheck(Function &F, Function *Check) {
+    Module &M = *F.getParent();
+    LLVMContext &Ctx = M.getContext();
+    IRBuilder<> B(entryInsertionPoint(F));
+    Type *I32 = B.getInt32Ty();
+    GlobalVariable *Calls = getGlobal(M, I32, "__obf_antidebug_calls");
+    Value *Count = B.CreateAdd(B.CreateLoad(I32, Calls), B.getInt32(1));
+    B.CreateStore(Count, Calls);
+    MDNode *Rare = MDBuilder(Ctx).createBranchWeights(1, std::max(Opts.Every, 1u));
+    Instruction *Due = SplitBlockAndInsertIfThen(B.CreateICmpUGE(Count, B.getInt32(Opts.Every)),
+                                                 &*B.GetInsertPoint(), false, Rare);
+    Due->getParent()->setName("antidebug_sample");
+    B.SetInsertPoint(Due);
+    B.CreateStore(B.getInt32(0), Calls);
+
+    if (Opts.Seconds) {
+      Type *TimeTy = M.getDataLayout().getIntPtrType(Ctx);
+      GlobalVariable *Last = getGlobal(M, TimeTy, "__obf_antidebug_last");
+      FunctionCallee Time = M.getOrInsertFunction("time", TimeTy, PointerType::get(Ctx, 0));
+      Value *Now = B.CreateCall(Time, {ConstantPointerNull::get(PointerType::get(Ctx, 0))});
+      Value *Elapsed = B.CreateSub(Now, B.CreateLoad(TimeTy, Last));
+      Due = SplitBlockAndInsertIfThen(B.CreateICmpSGE(Elapsed, ConstantInt::get(TimeTy, Opts.Seconds)),
+                                      Due, false);
+      B.SetInsertPoint(Due);
+      B.CreateStore(Now, Last);
+    }
+    B.CreateCall(Check);
+  }
+
+  // Functions that run rarely, so a full check on entry costs little: main,
+  // functions marked cold, and functions whose every caller is itself cold
+  // and calls them outside any loop. Address-taken and recursive functions
+  // never qualify, since their call counts can't be bounded.
+  std::set<Function *> coldFunctions(Module &M, const std::vector<Function *> &functions,
+                                     ModuleAnalysisManager &AM) {
+    auto &FAM = AM.getResult<FunctionAnalysisManagerModuleProxy>(M).getManager();
+    std::set<Function *> cold;
+    for (Function *F : functions)
+      if (F->getName() == "main" || F->hasFnAttribute(Attribute::Cold))
+        cold.insert(F);
+
+    bool grew = true;
+    while (grew) {
+      grew = false;
+      for (Function *F : functions) {
+        if (cold.count(F) || F->hasAddressTaken() || F->use_empty())
+          continue;
+        bool rare = true;
+        for (User *U : F->users()) {
+          auto *Call = dyn_cast<CallBase>(U);
+          Function *Caller = Call ? Call->getFunction() : nullptr;
+          if (!Caller || Caller == F || !cold.count(Caller) ||
+              FAM.getResult<LoopAnalysis>(*Caller).getLoopDepth(Call->getParent()) > 0) {
+            rare = false;
+            break;
+          }
+        }
+        if (rare) {
+          cold.insert(F);
+          grew = true;
+        }
+      }
+    }
+    return cold;
   }
 };
 
+// "anti-debug" or "anti-debug<mode=startup|sampled|cold;every=N;seconds=N>"
+bool parseAntiDebugOptions(StringRef Name, AntiDebugOptions &Opts) {
+  if (!Name.consume_front("anti-debug"))
+    return false;
+  if (Name.empty())
+    return true;
+  if (!Name.consume_front("<") || !Name.consume_back(">"))
+    return false;
+  SmallVector<StringRef, 3> Params;
+  Name.split(Params, ';');
+  for (StringRef Param : Params) {
+    if (Param.consume_front("mode=")) {
+      if (Param == "startup")
+        Opts.Mode = CheckMode::Startup;
+      else if (Param == "sampled")
+        Opts.Mode = CheckMode::Sampled;
+      else if (Param == "cold")
+        Opts.Mode = CheckMode::Cold;
+      else
+        return false;
+    } else if (Param.consume_front("every=")) {
+      if (Param.getAsInteger(10, Opts.Every) || Opts.Every == 0)
+        return false;
+    } else if (Param.consume_front("seconds=")) {
+      if (Param.getAsInteger(10, Opts.Seconds))
+        return false;
+    } else {
+      return false;
+    }
+  }
+  return true;
+}
+
 } // anonymous namespace
 
 void registerAntiDebuggingPass(PassBuilder &PB) {
   PB.registerPipelineParsingCallback(
     [](StringRef Name, ModulePassManager &MPM,
        ArrayRef<PassBuilder::PipelineElement>) {
-      if (Name == "anti-debug") {
-        MPM.addPass(AntiDebugging());
+      AntiDebugOptions Opts;
+      if (parseAntiDebugOptions(Name, Opts)) {
+        MPM.addPass(AntiDebugging(Opts));
         return true;
       }
       return false;
     });
-}
\ No newline at end of file
+}
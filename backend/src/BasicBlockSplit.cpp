@@ -11,7 +11,7 @@ namespace {
 
 struct BasicBlockSplit : public PassInfoMixin<BasicBlockSplit> {
   PreservedAnalyses run(Function &F, FunctionAnalysisManager &AM) {
-    if (F.isDeclaration() || F.size() < 2) 
+    if (F.isDeclaration() || F.size() < 2 || F.hasFnAttribute("obf-skip")) 
       return PreservedAnalyses::all();
 
     bool changed = false;
@@ -30,6 +30,8 @@ struct BasicBlockSplit : public PassInfoMixin<BasicBlockSplit> {
     if (changed) {
       errs() << "🧱 BasicBlockSplit: Split " << blocksToSplit.size() 
              << " blocks in " << F.getName() << "\n";
+      errs() << "{\"pass\": \"bbsplit\", \"function\": \"" << F.getName()
+             << "\", \"blocks_split\": " << blocksToSplit.size() << "}\n";
       return PreservedAnalyses::none();
     }
     return PreservedAnalyses::all();
@@ -40,12 +42,17 @@ private:
     size_t splitPoint = BB->size() / 3;
     if (splitPoint < 2) return false;
 
+    // Optimized input has PHIs and EH pads at block tops; never split among them
+    BasicBlock::iterator firstInsertion = BB->getFirstInsertionPt();
+    if (firstInsertion == BB->end()) return false;
+    splitPoint = std::max<size_t>(splitPoint, std::distance(BB->begin(), firstInsertion));
+
     auto it = BB->begin();
     for (size_t i = 0; i < splitPoint; ++i) {
       ++it;
     }
 
-    if (it == BB->end()) return false;
+    if (it == BB->end() || it->isTerminator()) return false;
 
     BasicBlock *newBB = SplitBlock(BB, &*it);
     newBB->setName(BB->getName() + "_split");
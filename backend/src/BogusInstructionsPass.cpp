@@ -19,28 +19,32 @@ struct BogusInstructionsPass : PassInfoMixin<BogusInstructionsPass> {
       LLVMContext &Ctx = M.getContext();
       
       for (Function &F : M) {
-          if (F.isDeclaration()) continue;
+          if (F.isDeclaration() || F.hasFnAttribute("obf-skip")) continue;
           
+          unsigned functionCount = 0;
           for (BasicBlock &BB : F) {
               if (BB.empty()) continue;
               
-              Instruction *insertPoint = nullptr;
-              for (Instruction &I : BB) {
-                  if (!I.isTerminator()) {
-                      insertPoint = &I;
-                      break;
-                  }
-              }
-              if (!insertPoint) continue;
+              // After any PHIs/EH pads, which optimized input has
+              BasicBlock::iterator firstInsertion = BB.getFirstInsertionPt();
+              if (firstInsertion == BB.end() || firstInsertion->isTerminator()) continue;
+              Instruction *insertPoint = &*firstInsertion;
               
               IRBuilder<> B(insertPoint);
               
-              if (insertBogusArithmetic(B, Ctx)) bogusCount++;
-              if (insertBogusMemory(B, Ctx, &F)) bogusCount++;
+              if (insertBogusArithmetic(B, Ctx)) functionCount++;
+              if (insertBogusMemory(B, Ctx, &F)) functionCount++;
           }
+
+          // One line per function, so incremental runs can credit cached bodies
+          if (functionCount)
+              errs() << "{\"pass\": \"bogus-instructions\", \"function\": \"" << F.getName()
+                     << "\", \"bogus_instr_count\": " << functionCount << "}\n";
+          bogusCount += functionCount;
       }
 
-      errs() << "{\"pass\": \"bogus-instructions\", \"bogus_instr_count\": " << bogusCount << "}\n";
+      if (!bogusCount)
+          errs() << "{\"pass\": \"bogus-instructions\", \"bogus_instr_count\": 0}\n";
       
       return PreservedAnalyses::all();
   }
@@ -68,7 +72,9 @@ private:
   
   bool insertBogusMemory(IRBuilder<> &B, LLVMContext &Ctx, Function *F) {
       try {
-          AllocaInst *bogusAlloca = B.CreateAlloca(Type::getInt32Ty(Ctx), nullptr, "bogus_alloca");
+          // Allocas live in the entry block; one inside a loop would grow the stack every iteration
+          IRBuilder<> EntryB(&*F->getEntryBlock().getFirstInsertionPt());
+          AllocaInst *bogusAlloca = EntryB.CreateAlloca(Type::getInt32Ty(Ctx), nullptr, "bogus_alloca");
           
           Value *bogusVal = ConstantInt::get(Type::getInt32Ty(Ctx), RNG() % 1000 + 1);
           B.CreateStore(bogusVal, bogusAlloca);
@@ -85,11 +91,14 @@ private:
 
 } // namespace
 
+extern bool parseSeededPassName(StringRef Name, StringRef PassName, unsigned &Seed);
+
 void registerBogusInstructionsPass(PassBuilder &PB) {
     PB.registerPipelineParsingCallback(
         [](StringRef name, ModulePassManager &MPM, ArrayRef<PassBuilder::PipelineElement>) {
-            if (name == "bogus-instructions") {
-                MPM.addPass(BogusInstructionsPass());
+            unsigned seed;
+            if (parseSeededPassName(name, "bogus-instructions", seed)) {
+                MPM.addPass(BogusInstructionsPass(seed));
                 return true;
             }
             return false;
@@ -1,45 +1,196 @@
+#include "llvm/Analysis/CFG.h"
 #include "llvm/IR/IRBuilder.h"
 #include "llvm/IR/Instructions.h"
 #include "llvm/IR/PassManager.h"
 #include "llvm/Passes/PassBuilder.h"
+#include "llvm/Transforms/Utils/BasicBlockUtils.h"
+#include "llvm/Transforms/Utils/Local.h"
+#include <map>
+#include <set>
+#include <vector>
 
 using namespace llvm;
 
 namespace {
 
+// Routes every block through a switch-based state machine.
+//
+// The dispatcher is built for runtime cost: states are numbered densely
+// (0..N-1) so the switch lowers to a jump table, the state lives in a PHI
+// node (a register) instead of an alloca, and with keep-loops loop
+// back-edges stay direct branches so hot loops skip the dispatcher.
 struct ControlFlowFlattening : public PassInfoMixin<ControlFlowFlattening> {
+  ControlFlowFlattening(bool keepLoops = false) : KeepLoops(keepLoops) {}
+
   PreservedAnalyses run(Function &F, FunctionAnalysisManager &AM) {
     // Skip small functions and declarations
-    if (F.isDeclaration() || F.size() <= 3) 
+    if (F.isDeclaration() || F.size() <= 3)
+      return PreservedAnalyses::all();
+
+    // Skip main, obfuscation functions and bodies reused by incremental mode
+    if (F.getName() == "main" || F.getName().starts_with("__obf_") || F.hasFnAttribute("obf-skip"))
       return PreservedAnalyses::all();
-    
-    // Skip main and obfuscation functions
-    if (F.getName() == "main" || F.getName().starts_with("__obf_"))
+
+    if (!canFlatten(F))
       return PreservedAnalyses::all();
 
     errs() << "🌀 ControlFlowFlattening: Processing " << F.getName() << "\n";
 
-    // Use minimal flattening that won't break
-    if (minimalFlatten(F)) {
-      errs() << "🌀 ControlFlowFlattening: Applied to " << F.getName() << "\n";
+    unsigned flattened = 0, keptEdges = 0;
+    if (flatten(F, flattened, keptEdges)) {
+      errs() << "{\"pass\": \"cfflatten\", \"function\": \"" << F.getName() << "\", \"functions_flattened\": 1"
+             << ", \"blocks_flattened\": " << flattened
+             << ", \"back_edges_kept\": " << keptEdges << "}\n";
       return PreservedAnalyses::none();
     }
-    
+
     return PreservedAnalyses::all();
   }
 
 private:
-  bool minimalFlatten(Function &F) {
-    // Just add a simple state variable without complex restructuring
-    BasicBlock &entry = F.getEntryBlock();
-    IRBuilder<> builder(&entry.front());
-    
-    // Add state variable but don't restructure control flow
-    AllocaInst *stateVar = builder.CreateAlloca(builder.getInt32Ty(), nullptr, "cff_state");
-    builder.CreateStore(builder.getInt32(0), stateVar);
-    
+  bool KeepLoops;
+
+  // Exception handling and indirect branches can't be routed through a switch
+  bool canFlatten(Function &F) {
+    for (BasicBlock &BB : F) {
+      if (BB.isEHPad() || BB.isLandingPad())
+        return false;
+      Instruction *T = BB.getTerminator();
+      if (!T || isa<InvokeInst>(T) || isa<IndirectBrInst>(T) || isa<CallBrInst>(T) ||
+          isa<ResumeInst>(T))
+        return false;
+    }
     return true;
   }
+
+  bool flatten(Function &F, unsigned &flattened, unsigned &keptEdges) {
+    LLVMContext &Ctx = F.getContext();
+    Type *I32 = Type::getInt32Ty(Ctx);
+
+    // Keep static allocas in the entry block; everything after them is flattened
+    BasicBlock *entry = &F.getEntryBlock();
+    BasicBlock::iterator firstReal = entry->begin();
+    while (isa<AllocaInst>(&*firstReal))
+      ++firstReal;
+    SplitBlock(entry, &*firstReal, static_cast<DominatorTree *>(nullptr), nullptr, nullptr, "cff_first");
+
+    std::set<std::pair<const BasicBlock *, const BasicBlock *>> backEdges;
+    if (KeepLoops) {
+      SmallVector<std::pair<const BasicBlock *, const BasicBlock *>, 8> edges;
+      FindFunctionBackedges(F, edges);
+      backEdges.insert(edges.begin(), edges.end());
+    }
+
+    // Values live across blocks no longer dominate their uses once every
+    // edge goes through the dispatcher, so move them to the stack.
+    // PHIs go first since their reloads may themselves be used elsewhere.
+    std::vector<PHINode *> phis;
+    for (BasicBlock &BB : F)
+      for (PHINode &PN : BB.phis())
+        phis.push_back(&PN);
+    for (PHINode *PN : phis)
+      DemotePHIToStack(PN);
+
+    std::vector<Instruction *> escaping;
+    for (BasicBlock &BB : F)
+      for (Instruction &I : BB)
+        if (!(isa<AllocaInst>(&I) && &BB == entry) && I.isUsedOutsideOfBlock(&BB))
+          escaping.push_back(&I);
+    for (Instruction *I : escaping)
+      DemoteRegToStack(*I);
+
+    // Dense state numbering in layout order
+    std::vector<BasicBlock *> blocks;
+    std::map<BasicBlock *, unsigned> stateOf;
+    for (BasicBlock &BB : F) {
+      if (&BB == entry) continue;
+      stateOf[&BB] = blocks.size();
+      blocks.push_back(&BB);
+    }
+    if (blocks.size() < 2)
+      return false;
+
+    BasicBlock *dispatch = BasicBlock::Create(Ctx, "cff_dispatch", &F);
+    BasicBlock *invalid = BasicBlock::Create(Ctx, "cff_invalid", &F);
+    new UnreachableInst(Ctx, invalid);
+
+    IRBuilder<> B(dispatch);
+    PHINode *state = B.CreatePHI(I32, blocks.size(), "cff_state");
+    SwitchInst *sw = B.CreateSwitch(state, invalid, blocks.size());
+    for (BasicBlock *BB : blocks)
+      sw->addCase(ConstantInt::get(cast<IntegerType>(I32), stateOf[BB]), BB);
+
+    auto stateValue = [&](BasicBlock *target) {
+      return ConstantInt::get(I32, stateOf[target]);
+    };
+    auto isKept = [&](BasicBlock *from, BasicBlock *to) {
+      return backEdges.count({from, to}) > 0;
+    };
+
+    std::vector<BasicBlock *> sources(blocks.begin(), blocks.end());
+    sources.insert(sources.begin(), entry);
+    for (BasicBlock *BB : sources) {
+      Instruction *T = BB->getTerminator();
+
+      if (auto *br = dyn_cast<BranchInst>(T)) {
+        if (br->isUnconditional()) {
+          BasicBlock *succ = br->getSuccessor(0);
+          if (isKept(BB, succ)) { keptEdges++; continue; }
+          IRBuilder<> TB(br);
+          TB.CreateBr(dispatch);
+          state->addIncoming(stateValue(succ), BB);
+          br->eraseFromParent();
+          flattened++;
+          continue;
+        }
+
+        BasicBlock *t = br->getSuccessor(0), *f = br->getSuccessor(1);
+        bool keepT = isKept(BB, t), keepF = isKept(BB, f);
+        if (keepT && keepF) { keptEdges += 2; continue; }
+        if (!keepT && !keepF) {
+          // One select picks the next state; no extra blocks needed
+          IRBuilder<> TB(br);
+          Value *next = TB.CreateSelect(br->getCondition(), stateValue(t), stateValue(f), "cff_next");
+          TB.CreateBr(dispatch);
+          state->addIncoming(next, BB);
+          br->eraseFromParent();
+          flattened++;
+          continue;
+        }
+        // Keep the loop edge direct, route the exit through the dispatcher
+        keptEdges++;
+        unsigned routed = keepT ? 1 : 0;
+        br->setSuccessor(routed, trampoline(BB, br->getSuccessor(routed), dispatch, state, stateValue));
+        flattened++;
+        continue;
+      }
+
+      if (auto *swi = dyn_cast<SwitchInst>(T)) {
+        std::map<BasicBlock *, BasicBlock *> routedTo;
+        for (unsigned i = 0; i < swi->getNumSuccessors(); ++i) {
+          BasicBlock *succ = swi->getSuccessor(i);
+          if (isKept(BB, succ)) { keptEdges++; continue; }
+          if (!routedTo.count(succ))
+            routedTo[succ] = trampoline(BB, succ, dispatch, state, stateValue);
+          swi->setSuccessor(i, routedTo[succ]);
+        }
+        flattened++;
+      }
+      // ret/unreachable leave the function and need no routing
+    }
+
+    return flattened > 0;
+  }
+
+  template <typename StateFn>
+  BasicBlock *trampoline(BasicBlock *from, BasicBlock *to, BasicBlock *dispatch,
+                         PHINode *state, StateFn stateValue) {
+    BasicBlock *tramp = BasicBlock::Create(from->getContext(), "cff_route",
+                                           from->getParent(), dispatch);
+    BranchInst::Create(dispatch, tramp);
+    state->addIncoming(stateValue(to), tramp);
+    return tramp;
+  }
 };
 
 } // anonymous namespace
@@ -52,6 +203,10 @@ void registerControlFlowFlatteningPass(PassBuilder &PB) {
         FPM.addPass(ControlFlowFlattening());
         return true;
       }
+      if (Name == "cfflatten<keep-loops>") {
+        FPM.addPass(ControlFlowFlattening(/*keepLoops=*/true));
+        return true;
+      }
       return false;
     });
-}
\ No newline at end of file
+}
@@ -1,96 +1,108 @@
+#include "llvm/IR/Constants.h"
 #include "llvm/IR/IRBuilder.h"
 #include "llvm/IR/Instructions.h"
+#include "llvm/IR/Module.h"
 #include "llvm/IR/PassManager.h"
 #include "llvm/Passes/PassBuilder.h"
 #include "llvm/Support/raw_ostream.h"
 #include <random>
+#include <vector>
 
 using namespace llvm;
 
 namespace {
 
+// Keeps i32 globals XOR-encrypted in memory. Each global gets one key, drawn
+// from the job seed, that is applied to its initializer and to every load and
+// store of it, so the program sees the original values.
 struct DynamicXORPass : public PassInfoMixin<DynamicXORPass> {
-  PreservedAnalyses run(Function &F, FunctionAnalysisManager &AM) {
-    if (F.getName().starts_with("__obf_")) 
-      return PreservedAnalyses::all();
+  DynamicXORPass(unsigned seed = 0) : RNG(seed ? seed : 0xC0FFEE) {}
 
-    bool changed = false;
-    std::random_device rd;
-    std::mt19937 gen(rd());
-    std::uniform_int_distribution<> dis(1, 255);
+  PreservedAnalyses run(Module &M, ModuleAnalysisManager &) {
+    std::uniform_int_distribution<uint32_t> dis(1, UINT32_MAX);
+    unsigned globalCount = 0, accessCount = 0;
 
-    for (auto &BB : F) {
-      for (auto &I : BB) {
-        if (auto *store = dyn_cast<StoreInst>(&I)) {
-          if (shouldObfuscateStore(store)) {
-            changed |= obfuscateStore(store, dis(gen));
-          }
-        } else if (auto *load = dyn_cast<LoadInst>(&I)) {
-          if (shouldObfuscateLoad(load)) {
-            changed |= obfuscateLoad(load, dis(gen));
-          }
+    for (GlobalVariable &G : M.globals()) {
+      std::vector<Instruction *> accesses;
+      if (!canEncrypt(G, accesses))
+        continue;
+
+      // Draw for every candidate so a key doesn't depend on the globals before it
+      uint32_t key = dis(RNG);
+      auto *I32 = cast<IntegerType>(G.getValueType());
+      G.setInitializer(ConstantInt::get(I32, G.getInitializer()->getUniqueInteger().getZExtValue() ^ key));
+      for (Instruction *I : accesses) {
+        if (auto *store = dyn_cast<StoreInst>(I)) {
+          IRBuilder<> builder(store);
+          Value *encrypted = builder.CreateXor(store->getValueOperand(), builder.getInt32(key), "dxor_enc");
+          store->setOperand(0, encrypted);
+        } else {
+          auto *load = cast<LoadInst>(I);
+          IRBuilder<> builder(load->getNextNode());
+          Value *decrypted = builder.CreateXor(load, builder.getInt32(key), "dxor_dec");
+          load->replaceUsesWithIf(decrypted, [&](Use &U) { return U.getUser() != decrypted; });
         }
       }
+      globalCount++;
+      accessCount += accesses.size();
     }
 
-    if (changed) {
-      errs() << "🔀 DynamicXOR: Obfuscated " << F.getName() << "\n";
-      return PreservedAnalyses::none();
-    }
-    return PreservedAnalyses::all();
+    errs() << "{\"pass\": \"dynamic-xor\", \"globals_encrypted\": " << globalCount
+           << ", \"accesses_rewritten\": " << accessCount << "}\n";
+    return globalCount ? PreservedAnalyses::none() : PreservedAnalyses::all();
   }
 
 private:
-  bool shouldObfuscateStore(StoreInst *store) {
-    return isa<GlobalVariable>(store->getPointerOperand()) ||
-           store->getValueOperand()->getType()->isArrayTy();
-  }
+  std::mt19937 RNG;
 
-  bool shouldObfuscateLoad(LoadInst *load) {
-    return isa<GlobalVariable>(load->getPointerOperand()) ||
-           load->getType()->isArrayTy();
-  }
-
-  bool obfuscateStore(StoreInst *store, int key) {
-    IRBuilder<> builder(store);
-    Value *originalValue = store->getValueOperand();
-    
-    Value *dynamicKey = builder.getInt32(key);
-    Value *addrHash = builder.getInt32((intptr_t)store & 0xFFFF);
-    Value *finalKey = builder.CreateXor(dynamicKey, addrHash);
-    
-    Value *encrypted = builder.CreateXor(originalValue, finalKey);
-    builder.CreateStore(encrypted, store->getPointerOperand());
-    
-    store->eraseFromParent();
-    return true;
-  }
+  // A global can be encrypted when this module holds its only definition and
+  // every use is a plain i32 load or store in a function the pass may rewrite.
+  // Anything else (address taken, other-typed or atomic access, use from a
+  // constant or a skipped function) could read or write the raw value.
+  static bool canEncrypt(GlobalVariable &G, std::vector<Instruction *> &accesses) {
+    if (!G.getValueType()->isIntegerTy(32) || !G.hasDefinitiveInitializer() ||
+        G.isInterposable() || G.isThreadLocal() || G.getName().starts_with("__obf_") ||
+        G.getName().starts_with("llvm."))
+      return false;
+    Constant *init = G.getInitializer();
+    if (!isa<ConstantInt>(init) && !init->isNullValue())
+      return false;
 
-  bool obfuscateLoad(LoadInst *load, int key) {
-    IRBuilder<> builder(load);
-    
-    Value *dynamicKey = builder.getInt32(key);
-    Value *addrHash = builder.getInt32((intptr_t)load & 0xFFFF);
-    Value *finalKey = builder.CreateXor(dynamicKey, addrHash);
-    
-    Value *encrypted = builder.CreateLoad(load->getType(), load->getPointerOperand());
-    Value *decrypted = builder.CreateXor(encrypted, finalKey);
-    
-    load->replaceAllUsesWith(decrypted);
-    load->eraseFromParent();
+    for (User *U : G.users()) {
+      auto *I = dyn_cast<Instruction>(U);
+      if (!I)
+        return false;
+      Function *F = I->getFunction();
+      if (F->getName().starts_with("__obf_") || F->hasFnAttribute("obf-skip"))
+        return false;
+      if (auto *load = dyn_cast<LoadInst>(I)) {
+        if (!load->isSimple() || !load->getType()->isIntegerTy(32))
+          return false;
+      } else if (auto *store = dyn_cast<StoreInst>(I)) {
+        if (!store->isSimple() || store->getValueOperand() == &G ||
+            !store->getValueOperand()->getType()->isIntegerTy(32))
+          return false;
+      } else {
+        return false;
+      }
+      accesses.push_back(I);
+    }
     return true;
   }
 };
 
 } // anonymous namespace
 
+extern bool parseSeededPassName(StringRef Name, StringRef PassName, unsigned &Seed);
+
 // Registration function instead of llvmGetPassPluginInfo
 void registerDynamicXORPass(PassBuilder &PB) {
   PB.registerPipelineParsingCallback(
-    [](StringRef Name, FunctionPassManager &FPM,
+    [](StringRef Name, ModulePassManager &MPM,
        ArrayRef<PassBuilder::PipelineElement>) {
-      if (Name == "dynamic-xor") {
-        FPM.addPass(DynamicXORPass());
+      unsigned seed;
+      if (parseSeededPassName(Name, "dynamic-xor", seed)) {
+        MPM.addPass(DynamicXORPass(seed));
         return true;
       }
       return false;
@@ -1,71 +1,284 @@
+#include "llvm/Analysis/LoopInfo.h"
 #include "llvm/IR/IRBuilder.h"
 #include "llvm/IR/Instructions.h"
 #include "llvm/IR/PassManager.h"
 #include "llvm/Passes/PassBuilder.h"
 #include "llvm/Passes/PassPlugin.h"
 #include "llvm/Transforms/Utils/BasicBlockUtils.h"
+#include <map>
+#include <set>
+#include <vector>
 
 using namespace llvm;
 
 namespace {
+
+// Runtime inputs of a predicate; X and Y have the same integer type
+struct PredicateInputs {
+  Value *X;
+  Value *Y;
+  Module *M;
+};
+
+// An always-true condition over values only known at runtime.
+//   Cost: tenths of a cycle per evaluation on x86-64, measured by
+//         benchmark_predicates.py (the branch is always predicted, so this is
+//         throughput cost rather than latency)
+//   Resistance: 1 (falls to local bit reasoning) .. 5 (needs non-linear or
+//   memory reasoning to prove)
+struct OpaquePredicate {
+  const char *Name;
+  unsigned Cost;
+  unsigned Resistance;
+  Value *(*Build)(IRBuilder<> &B, const PredicateInputs &In);
+};
+
+// Two distinct globals behind a table of pointers. Volatile loads keep the
+// optimizer from seeing through the table, and distinct objects never alias.
+GlobalVariable *getAliasSlots(Module &M) {
+  if (GlobalVariable *Slots = M.getNamedGlobal("__obf_opaque_slots"))
+    return Slots;
+  LLVMContext &Ctx = M.getContext();
+  Type *I8 = Type::getInt8Ty(Ctx);
+  auto *A = new GlobalVariable(M, I8, false, GlobalValue::InternalLinkage,
+                               ConstantInt::get(I8, 0), "__obf_opaque_a");
+  auto *B = new GlobalVariable(M, I8, false, GlobalValue::InternalLinkage,
+                               ConstantInt::get(I8, 0), "__obf_opaque_b");
+  ArrayType *ArrTy = ArrayType::get(A->getType(), 2);
+  return new GlobalVariable(M, ArrTy, false, GlobalValue::InternalLinkage,
+                            ConstantArray::get(ArrTy, {A, B}), "__obf_opaque_slots");
+}
+
+const OpaquePredicate Library[] = {
+  // (x | y) >= (x & y), unsigned
+  {"bitwise-order", 8, 1, [](IRBuilder<> &B, const PredicateInputs &In) -> Value * {
+     return B.CreateICmpUGE(B.CreateOr(In.X, In.Y), B.CreateAnd(In.X, In.Y), "opaque_pred");
+   }},
+  // x * (x + 1) is even; holds modulo 2^n too
+  {"consecutive-even", 11, 2, [](IRBuilder<> &B, const PredicateInputs &In) -> Value * {
+     Value *P = B.CreateMul(In.X, B.CreateAdd(In.X, ConstantInt::get(In.X->getType(), 1)));
+     Value *Low = B.CreateAnd(P, ConstantInt::get(In.X->getType(), 1));
+     return B.CreateICmpEQ(Low, ConstantInt::get(In.X->getType(), 0), "opaque_pred");
+   }},
+  // x^2 + y^2 is never 3 mod 4
+  {"sum-of-squares", 12, 3, [](IRBuilder<> &B, const PredicateInputs &In) -> Value * {
+     Value *S = B.CreateAdd(B.CreateMul(In.X, In.X), B.CreateMul(In.Y, In.Y));
+     Value *Low = B.CreateAnd(S, ConstantInt::get(In.X->getType(), 3));
+     return B.CreateICmpNE(Low, ConstantInt::get(In.X->getType(), 3), "opaque_pred");
+   }},
+  // x^2 != 7y^2 - 1: no solution even mod 8
+  {"quadratic-residue", 14, 4, [](IRBuilder<> &B, const PredicateInputs &In) -> Value * {
+     Type *Ty = In.X->getType();
+     Value *Rhs = B.CreateSub(B.CreateMul(ConstantInt::get(Ty, 7), B.CreateMul(In.Y, In.Y)),
+                              ConstantInt::get(Ty, 1));
+     return B.CreateICmpNE(B.CreateMul(In.X, In.X), Rhs, "opaque_pred");
+   }},
+  // Two slots of a pointer table never hold the same object
+  {"alias-slots", 5, 3, [](IRBuilder<> &B, const PredicateInputs &In) -> Value * {
+     GlobalVariable *Slots = getAliasSlots(*In.M);
+     Type *ArrTy = Slots->getValueType();
+     Type *PtrTy = ArrTy->getArrayElementType();
+     Value *P0 = B.CreateLoad(PtrTy, B.CreateConstInBoundsGEP2_32(ArrTy, Slots, 0, 0), true);
+     Value *P1 = B.CreateLoad(PtrTy, B.CreateConstInBoundsGEP2_32(ArrTy, Slots, 0, 1), true);
+     return B.CreateICmpNE(P0, P1, "opaque_pred");
+   }},
+};
+
+const OpaquePredicate *findPredicate(StringRef Name) {
+  for (const OpaquePredicate &P : Library)
+    if (Name == P.Name)
+      return &P;
+  return nullptr;
+}
+
+struct OpaquePredicateOptions {
+  // Cost budget per block in tenths of a cycle; blocks inside loops get
+  // HotBudget instead, which by default admits only the cheapest predicate
+  unsigned Budget = 30;
+  unsigned HotBudget = 5;
+  // Insert only this predicate in every block, ignoring budgets (benchmarking)
+  const OpaquePredicate *Only = nullptr;
+};
+
 struct OpaquePredicates : public PassInfoMixin<OpaquePredicates> {
+  OpaquePredicates(OpaquePredicateOptions opts = {}) : Opts(opts) {}
+
   PreservedAnalyses run(Function &F, FunctionAnalysisManager &AM) {
-    if (F.isDeclaration() || F.size() < 2) 
+    if (F.isDeclaration() || F.size() < 2 || F.hasFnAttribute("obf-skip"))
       return PreservedAnalyses::all();
-    
-    bool changed = false;
-    unsigned predicateCount = 0;
 
+    // Decide hotness before the CFG changes
+    LoopInfo &LI = AM.getResult<LoopAnalysis>(F);
+    std::vector<std::pair<BasicBlock *, bool>> blocks;
     for (auto &BB : F) {
-      if (BB.size() > 5 && predicateCount < 2) {
-        if (insertSimpleOpaquePredicate(&BB)) {
-          changed = true;
-          predicateCount++;
-        }
+      Instruction *T = BB.getTerminator();
+      if (!T || BB.isEHPad() || !isa<BranchInst, ReturnInst, SwitchInst>(T))
+        continue;
+      blocks.push_back({&BB, LI.getLoopDepth(&BB) > 0});
+    }
+
+    unsigned predicateCount = 0, hotCount = 0, totalCost = 0;
+    std::map<std::string, unsigned> uses;
+    for (unsigned i = 0; i < blocks.size(); ++i) {
+      BasicBlock *BB = blocks[i].first;
+      bool hot = blocks[i].second;
+      for (const OpaquePredicate *P : choosePredicates(hot, i)) {
+        BB = insertPredicate(BB, *P);
+        predicateCount++;
+        hotCount += hot;
+        totalCost += P->Cost;
+        uses[P->Name]++;
       }
     }
 
-    if (changed) {
-      errs() << "🧠 OpaquePredicates: Added " << predicateCount << " predicates to " << F.getName() << "\n";
-      return PreservedAnalyses::none();
+    if (predicateCount == 0)
+      return PreservedAnalyses::all();
+
+    errs() << "🧠 OpaquePredicates: Added " << predicateCount << " predicates to " << F.getName() << "\n";
+    errs() << "{\"pass\": \"opaque-preds\", \"function\": \"" << F.getName()
+           << "\", \"predicates_added\": " << predicateCount
+           << ", \"hot_predicates\": " << hotCount
+           << ", \"estimated_cycles\": " << totalCost / 10 << "." << totalCost % 10
+           << ", \"by_predicate\": {";
+    bool first = true;
+    for (auto &Use : uses) {
+      errs() << (first ? "" : ", ") << "\"" << Use.first << "\": " << Use.second;
+      first = false;
     }
-    return PreservedAnalyses::all();
+    errs() << "}}\n";
+    return PreservedAnalyses::none();
   }
 
 private:
-  bool insertSimpleOpaquePredicate(BasicBlock *BB) {
-    if (!BB->getTerminator()) return false;
-    
-    IRBuilder<> builder(BB->getTerminator());
-    
-    // Simple always-true condition
-    Value *x = builder.getInt32(42);
-    Value *square = builder.CreateMul(x, x, "square");
-    Value *predicate = builder.CreateICmpSGE(square, builder.getInt32(0), "opaque_pred");
-    
-    // Split block - use simpler version
-    Instruction *splitPoint = BB->getTerminator();
-    BasicBlock *falseBlock = BB->splitBasicBlock(splitPoint, "bogus_path");
-    BasicBlock *trueBlock = BB;
-    
-    // Replace terminator with conditional branch
-    trueBlock->getTerminator()->eraseFromParent();
-    builder.SetInsertPoint(trueBlock);
-    builder.CreateCondBr(predicate, falseBlock, falseBlock); // Both go to same block
-    
-    return true;
+  OpaquePredicateOptions Opts;
+
+  // Strongest predicates that fit the block's budget, each used at most once
+  // per block. Ties rotate with the block index so blocks don't all look alike.
+  std::vector<const OpaquePredicate *> choosePredicates(bool hot, unsigned blockIndex) {
+    if (Opts.Only)
+      return {Opts.Only};
+
+    std::vector<const OpaquePredicate *> chosen;
+    std::set<const OpaquePredicate *> used;
+    unsigned remaining = hot ? Opts.HotBudget : Opts.Budget;
+    while (true) {
+      std::vector<const OpaquePredicate *> best;
+      for (const OpaquePredicate &P : Library) {
+        if (used.count(&P) || P.Cost > remaining)
+          continue;
+        if (!best.empty() && P.Resistance < best[0]->Resistance)
+          continue;
+        if (!best.empty() && P.Resistance > best[0]->Resistance)
+          best.clear();
+        best.push_back(&P);
+      }
+      if (best.empty())
+        break;
+      const OpaquePredicate *P = best[(blockIndex + chosen.size()) % best.size()];
+      chosen.push_back(P);
+      used.insert(P);
+      remaining -= P->Cost;
+    }
+    return chosen;
+  }
+
+  GlobalVariable *getSeed(Module &M) {
+    if (GlobalVariable *Seed = M.getNamedGlobal("__obf_opaque_seed"))
+      return Seed;
+    Type *I32 = Type::getInt32Ty(M.getContext());
+    return new GlobalVariable(M, I32, false, GlobalValue::InternalLinkage,
+                              ConstantInt::get(I32, 0x5EED), "__obf_opaque_seed");
+  }
+
+  // A volatile load of a module-private seed: a runtime value the optimizer can't know
+  Value *loadSeed(IRBuilder<> &B, Module &M, Type *Ty) {
+    Value *V = B.CreateLoad(B.getInt32Ty(), getSeed(M), true, "opaque_seed");
+    return B.CreateZExtOrTrunc(V, Ty);
+  }
+
+  // Integer values computed in this block, most recent first
+  std::vector<Value *> runtimeValues(BasicBlock *BB) {
+    std::vector<Value *> values;
+    for (Instruction &I : *BB) {
+      if (I.isTerminator())
+        break;
+      auto *Ty = dyn_cast<IntegerType>(I.getType());
+      if (Ty && Ty->getBitWidth() >= 8 && Ty->getBitWidth() <= 64)
+        values.insert(values.begin(), &I);
+    }
+    return values;
+  }
+
+  // Branch on the predicate before BB's terminator. The never-taken edge goes
+  // to a block that clobbers the seed, so the check can't be dropped as dead.
+  // Returns the block that now holds the original terminator.
+  BasicBlock *insertPredicate(BasicBlock *BB, const OpaquePredicate &P) {
+    Module &M = *BB->getModule();
+    Instruction *T = BB->getTerminator();
+    IRBuilder<> B(T);
+
+    std::vector<Value *> values = runtimeValues(BB);
+    Value *X = values.empty() ? loadSeed(B, M, B.getInt32Ty()) : values[0];
+    Value *Y = nullptr;
+    for (unsigned i = 1; i < values.size() && !Y; ++i)
+      if (values[i]->getType() == X->getType())
+        Y = values[i];
+    if (!Y)
+      Y = loadSeed(B, M, X->getType());
+
+    Value *Pred = P.Build(B, {X, Y, &M});
+
+    BasicBlock *Cont = BB->splitBasicBlock(T, BB->getName() + ".opaque_cont");
+    BasicBlock *Bogus = BasicBlock::Create(BB->getContext(), BB->getName() + ".opaque_false",
+                                           BB->getParent(), Cont);
+    IRBuilder<> BogusB(Bogus);
+    BogusB.CreateStore(BogusB.CreateZExtOrTrunc(X, BogusB.getInt32Ty()), getSeed(M), true);
+    BogusB.CreateBr(Cont);
+
+    BB->getTerminator()->eraseFromParent();
+    BranchInst::Create(Cont, Bogus, Pred, BB);
+    return Cont;
   }
 };
+
+// "opaque-preds" or "opaque-preds<budget=N;hot-budget=N;only=NAME>"
+bool parseOpaqueOptions(StringRef Name, OpaquePredicateOptions &Opts) {
+  if (!Name.consume_front("opaque-preds"))
+    return false;
+  if (Name.empty())
+    return true;
+  if (!Name.consume_front("<") || !Name.consume_back(">"))
+    return false;
+  SmallVector<StringRef, 4> Params;
+  Name.split(Params, ';');
+  for (StringRef Param : Params) {
+    if (Param.consume_front("budget=")) {
+      if (Param.getAsInteger(10, Opts.Budget))
+        return false;
+    } else if (Param.consume_front("hot-budget=")) {
+      if (Param.getAsInteger(10, Opts.HotBudget))
+        return false;
+    } else if (Param.consume_front("only=")) {
+      if (!(Opts.Only = findPredicate(Param)))
+        return false;
+    } else {
+      return false;
+    }
+  }
+  return true;
 }
 
+} // anonymous namespace
+
 void registerOpaquePredicatesPass(PassBuilder &PB) {
   PB.registerPipelineParsingCallback(
     [](StringRef Name, FunctionPassManager &FPM,
        ArrayRef<PassBuilder::PipelineElement>) {
-      if (Name == "opaque-preds") {
-        FPM.addPass(OpaquePredicates());
+      OpaquePredicateOptions Opts;
+      if (parseOpaqueOptions(Name, Opts)) {
+        FPM.addPass(OpaquePredicates(Opts));
         return true;
       }
       return false;
     });
-}
\ No newline at end of file
+}
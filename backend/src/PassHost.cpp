@@ -0,0 +1,225 @@
+#include "llvm/Bitcode/BitcodeWriter.h"
+#include "llvm/IR/LLVMContext.h"
+#include "llvm/IR/Module.h"
+#include "llvm/IR/Verifier.h"
+#include "llvm/IRReader/IRReader.h"
+#include "llvm/Passes/PassBuilder.h"
+#include "llvm/Passes/PassPlugin.h"
+#include "llvm/Support/JSON.h"
+#include "llvm/Support/MemoryBuffer.h"
+#include "llvm/Support/Program.h"
+#include "llvm/Support/SourceMgr.h"
+#include "llvm/Support/raw_ostream.h"
+#include <chrono>
+#include <cstdint>
+#include <cstdio>
+#include <string>
+
+#ifdef _WIN32
+#include <io.h>
+#include <process.h>
+#define close _close
+#define dup _dup
+#define dup2 _dup2
+#define fileno _fileno
+#define getpid _getpid
+#else
+#include <unistd.h>
+#endif
+
+using namespace llvm;
+
+// Long-lived opt replacement for the backend's worker pool.
+//
+// The obfuscation passes are linked in, so LLVM and the plugin are loaded
+// once per process instead of once per pass per job. Requests arrive on
+// stdin as length-prefixed frames (4-byte little-endian size + payload):
+//
+//   request:  JSON header {"op": "run", "pipeline": "...", "emit_ll": true}
+//             followed by one frame holding the input module (.bc or .ll)
+//   response: JSON header {"ok": ..., "error": ..., "seconds": ..., "stderr": ...}
+//             followed by a bitcode frame and a textual IR frame
+//
+// "ping" answers with a header only; "shutdown" exits. Every request gets
+// a fresh LLVMContext, so nothing leaks between jobs.
+
+namespace {
+
+bool readFrame(std::string &Out) {
+  unsigned char Len[4];
+  if (std::fread(Len, 1, 4, stdin) != 4)
+    return false;
+  uint32_t Size = Len[0] | (Len[1] << 8) | (Len[2] << 16) | (uint32_t(Len[3]) << 24);
+  Out.resize(Size);
+  return Size == 0 || std::fread(&Out[0], 1, Size, stdin) == Size;
+}
+
+void writeFrame(StringRef Data) {
+  uint32_t Size = Data.size();
+  unsigned char Len[4] = {static_cast<unsigned char>(Size), static_cast<unsigned char>(Size >> 8),
+                          static_cast<unsigned char>(Size >> 16), static_cast<unsigned char>(Size >> 24)};
+  std::fwrite(Len, 1, 4, stdout);
+  if (Size)
+    std::fwrite(Data.data(), 1, Size, stdout);
+}
+
+void writeHeader(json::Object Header) {
+  std::string Text;
+  raw_string_ostream OS(Text);
+  OS << json::Value(std::move(Header));
+  OS.flush();
+  writeFrame(Text);
+}
+
+// The passes report through errs(); point fd 2 at a temp file while a
+// pipeline runs so their JSON lines travel back in the response.
+class StderrCapture {
+public:
+  StderrCapture() {
+    errs().flush();
+    std::fflush(stderr);
+    File = std::tmpfile();
+    if (File) {
+      Saved = dup(2);
+      dup2(fileno(File), 2);
+    }
+  }
+
+  std::string finish() {
+    errs().flush();
+    std::fflush(stderr);
+    std::string Text;
+    if (!File)
+      return Text;
+    dup2(Saved, 2);
+    close(Saved);
+    std::fseek(File, 0, SEEK_END);
+    long Size = std::ftell(File);
+    if (Size > 0) {
+      Text.resize(Size);
+      std::rewind(File);
+      Text.resize(std::fread(&Text[0], 1, Size, File));
+    }
+    std::fclose(File);
+    File = nullptr;
+    return Text;
+  }
+
+  ~StderrCapture() { finish(); }
+
+private:
+  std::FILE *File = nullptr;
+  int Saved = -1;
+};
+
+json::Object runPipeline(StringRef Pipeline, StringRef Input, bool EmitLL,
+                         std::string &Bitcode, std::string &Text) {
+  auto Start = std::chrono::steady_clock::now();
+  auto elapsed = [&] {
+    return std::chrono::duration<double>(std::chrono::steady_clock::now() - Start).count();
+  };
+  auto failure = [&](std::string Message, bool Soft, std::string Stderr) {
+    return json::Object{{"ok", false}, {"soft", Soft}, {"error", json::fixUTF8(Message)},
+                        {"stderr", json::fixUTF8(Stderr)}, {"seconds", elapsed()}};
+  };
+
+  LLVMContext Ctx;
+  SMDiagnostic Err;
+  std::unique_ptr<Module> M = parseIR(MemoryBufferRef(Input, "input"), Err, Ctx);
+  if (!M) {
+    std::string Message;
+    raw_string_ostream OS(Message);
+    Err.print("obf-pass-host", OS);
+    return failure(OS.str(), false, "");
+  }
+
+  LoopAnalysisManager LAM;
+  FunctionAnalysisManager FAM;
+  CGSCCAnalysisManager CGAM;
+  ModuleAnalysisManager MAM;
+  PassBuilder PB;
+  llvmGetPassPluginInfo().RegisterPassBuilderCallbacks(PB);
+  PB.registerModuleAnalyses(MAM);
+  PB.registerCGSCCAnalyses(CGAM);
+  PB.registerFunctionAnalyses(FAM);
+  PB.registerLoopAnalyses(LAM);
+  PB.crossRegisterProxies(LAM, FAM, CGAM, MAM);
+
+  ModulePassManager MPM;
+  if (Error E = PB.parsePassPipeline(MPM, Pipeline))
+    return failure(toString(std::move(E)), false, "");
+
+  StderrCapture Capture;
+  MPM.run(*M, MAM);
+  std::string Stderr = Capture.finish();
+
+  // Same soft failure opt reports when a pass leaves broken IR behind
+  std::string Broken;
+  raw_string_ostream BrokenOS(Broken);
+  if (verifyModule(*M, &BrokenOS))
+    return failure("broken module found: " + BrokenOS.str(), true, Stderr);
+
+  raw_string_ostream BC(Bitcode);
+  WriteBitcodeToFile(*M, BC);
+  BC.flush();
+  if (EmitLL) {
+    raw_string_ostream LL(Text);
+    M->print(LL, nullptr);
+    LL.flush();
+  }
+
+  return json::Object{{"ok", true}, {"stderr", json::fixUTF8(Stderr)}, {"seconds", elapsed()}};
+}
+
+} // anonymous namespace
+
+int main() {
+  sys::ChangeStdinToBinary();
+  sys::ChangeStdoutToBinary();
+
+  int64_t Requests = 0;
+  std::string HeaderText, Input;
+  while (readFrame(HeaderText)) {
+    Expected<json::Value> Parsed = json::parse(HeaderText);
+    if (!Parsed) {
+      writeHeader(json::Object{{"ok", false}, {"error", toString(Parsed.takeError())}});
+      std::fflush(stdout);
+      continue;
+    }
+    const json::Object *Header = Parsed->getAsObject();
+    StringRef Op = "run";
+    if (Header)
+      if (auto Value = Header->getString("op"))
+        Op = *Value;
+
+    if (Op == "shutdown")
+      break;
+
+    if (Op == "ping") {
+      writeHeader(json::Object{{"ok", true}, {"pid", static_cast<int64_t>(getpid())},
+                               {"requests", Requests}});
+      std::fflush(stdout);
+      continue;
+    }
+
+    if (!readFrame(Input))
+      break;
+    Requests++;
+
+    StringRef Pipeline;
+    bool EmitLL = true;
+    if (Header) {
+      if (auto Value = Header->getString("pipeline"))
+        Pipeline = *Value;
+      if (auto Value = Header->getBoolean("emit_ll"))
+        EmitLL = *Value;
+    }
+
+    std::string Bitcode, Text;
+    writeHeader(runPipeline(Pipeline, Input, EmitLL, Bitcode, Text));
+    writeFrame(Bitcode);
+    writeFrame(Text);
+    std::fflush(stdout);
+  }
+  return 0;
+}
@@ -83,11 +83,14 @@ private:
 
 } // namespace
 
+extern bool parseSeededPassName(StringRef Name, StringRef PassName, unsigned &Seed);
+
 void registerRenameSymbolsPass(PassBuilder &PB) {
     PB.registerPipelineParsingCallback(
         [](StringRef name, ModulePassManager &MPM, ArrayRef<PassBuilder::PipelineElement>) {
-            if (name == "rename-symbols") {
-                MPM.addPass(RenameSymbolsPass());
+            unsigned seed;
+            if (parseSeededPassName(name, "rename-symbols", seed)) {
+                MPM.addPass(RenameSymbolsPass(seed));
                 return true;
             }
             return false;
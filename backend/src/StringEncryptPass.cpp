@@ -181,11 +181,14 @@ private:
 
 } // namespace
 
+extern bool parseSeededPassName(StringRef Name, StringRef PassName, unsigned &Seed);
+
 void registerStringEncryptPass(PassBuilder &PB) {
     PB.registerPipelineParsingCallback(
         [](StringRef name, ModulePassManager &MPM, ArrayRef<PassBuilder::PipelineElement>) {
-            if (name == "stringenc") {
-                MPM.addPass(StringEncryptPass());
+            unsigned seed;
+            if (parseSeededPassName(name, "stringenc", seed)) {
+                MPM.addPass(StringEncryptPass(seed));
                 return true;
             }
             return false;
@@ -0,0 +1,67 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# Artifacts a streamed job can write into its workspace; everything else
+# stays in memory. Without a request the exe and final IR are kept, which is
+# what the API returns.
+STREAM_ARTIFACTS = ("exe", "llvm_ir", "bitcode", "object")
+DEFAULT_STREAM_ARTIFACTS = ("exe", "llvm_ir")
+
+MEMORY_FILESYSTEMS = {"tmpfs", "ramfs"}
+
+
+@contextmanager
+def memory_file(data, name):
+    """Yield (path, fds) of a file holding `data` for a tool that can't read stdin.
+
+    On Linux this is a memfd, visible to children passed `fds` as /dev/fd/N,
+    so nothing reaches the filesystem. Elsewhere it falls back to a temp
+    file in OBF_SCRATCH_DIR (or the system temp dir).
+    """
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create(name)
+        try:
+            os.write(fd, data)
+            yield f"/dev/fd/{fd}", (fd,)
+        finally:
+            os.close(fd)
+        return
+
+    handle, path = tempfile.mkstemp(suffix=Path(name).suffix, dir=os.environ.get("OBF_SCRATCH_DIR"))
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        yield path, ()
+    finally:
+        os.unlink(path)
+
+
+def filesystem_type(path):
+    """Filesystem type of the mount holding path ("tmpfs", "ext4", ...), or None if unknown"""
+    try:
+        with open("/proc/mounts", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return None
+    path = str(Path(path).resolve())
+    best, fs_type = "", None
+    for mount_point, kind in mounts:
+        inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) >= len(best):
+            best, fs_type = mount_point, kind
+    return fs_type
+
+
+def workspace_usage(work_dir):
+    """(files, bytes) currently in a job workspace"""
+    files = total = 0
+    for root, _, names in os.walk(work_dir):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+                files += 1
+            except OSError:
+                pass
+    return files, total
@@ -0,0 +1,125 @@
+import argparse
+import os
+import re
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+backend_dir = Path(__file__).parent.resolve()
+
+# rename-symbols names look like f_12_3fa9c0d1 (functions) or g_3_0b7e44a2 (globals)
+OBFUSCATED_NAME = re.compile(r"\b[fg]_\d+_[0-9a-f]{8}\b")
+MAP_HEADER = "# obfusca-symbols v1"
+
+
+def write_symbol_map(path, renamed_functions, renamed_globals):
+    """Write a rename map as tab-separated `obfuscated kind original` lines sorted by obfuscated name"""
+    entries = [(new, "f", old) for old, new in renamed_functions.items()]
+    entries += [(new, "g", old) for old, new in renamed_globals.items()]
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(MAP_HEADER + "\n")
+        for new, kind, old in sorted(entries):
+            f.write(f"{new}\t{kind}\t{old}\n")
+
+
+def read_symbol_map(path):
+    """{obfuscated name: original name} from a map written by write_symbol_map"""
+    mapping = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) == 3:
+                mapping[parts[0]] = parts[2]
+    return mapping
+
+
+def symbolize_line(line, mapping):
+    """Replace every obfuscated name in line; returns (line, resolved, unresolved)"""
+    counts = [0, 0]
+
+    def replace(match):
+        original = mapping.get(match.group(0))
+        counts[original is None] += 1
+        return original if original is not None else match.group(0)
+
+    return OBFUSCATED_NAME.sub(replace, line), counts[0], counts[1]
+
+
+class SymbolMapStore:
+    """Rename maps of every build, one sorted file per build ID.
+
+    Maps are kept outside the job workspaces so crash reports can still be
+    symbolized after the build's artifacts are evicted. Parsed maps are held
+    in a small LRU cache, so bulk requests for the same build never re-read
+    the file.
+    """
+
+    def __init__(self, root=None, cache_size=None):
+        self.root = Path(root or os.environ.get("OBF_SYMBOL_MAP_DIR") or backend_dir / "symbol_maps").resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cache_size = cache_size or int(os.environ.get("OBF_SYMBOL_MAP_CACHE", 32))
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path(self, build_id):
+        if not re.fullmatch(r"[0-9A-Za-z_-]+", build_id or ""):
+            raise ValueError(f"Invalid build ID: {build_id!r}")
+        return self.root / f"{build_id}.map"
+
+    def save(self, build_id, map_file):
+        """Move a job's symbols.map into the store; returns the stored path"""
+        path = self.path(build_id)
+        shutil.move(str(map_file), str(path))
+        with self.lock:
+            self.cache.pop(build_id, None)
+        return path
+
+    def get(self, build_id):
+        """{obfuscated: original} for a build, or None if it has no map"""
+        with self.lock:
+            if build_id in self.cache:
+                self.cache.move_to_end(build_id)
+                return self.cache[build_id]
+        path = self.path(build_id)
+        if not path.exists():
+            return None
+        mapping = read_symbol_map(path)
+        with self.lock:
+            self.cache[build_id] = mapping
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return mapping
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="De-obfuscate stack traces of a build using its rename map")
+    parser.add_argument("build_id", nargs="?", help="Build (job) ID whose symbol map to use")
+    parser.add_argument("log", nargs="?", help="Log or stack trace file (default: stdin)")
+    parser.add_argument("--map", help="Use this symbols.map file instead of looking up a build ID")
+    args = parser.parse_args()
+
+    if args.map:
+        mapping = read_symbol_map(args.map)
+        args.log = args.log or args.build_id
+    elif args.build_id:
+        mapping = SymbolMapStore().get(args.build_id)
+        if mapping is None:
+            print(f"No symbol map for build {args.build_id}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        parser.error("give a build ID or --map")
+
+    # Line by line, so arbitrarily large logs stream through in constant memory
+    source = open(args.log, encoding="utf-8", errors="replace") if args.log else sys.stdin
+    resolved = unresolved = 0
+    with source:
+        for line in source:
+            line, hits, misses = symbolize_line(line, mapping)
+            resolved += hits
+            unresolved += misses
+            sys.stdout.write(line)
+    print(f"{resolved} names resolved, {unresolved} unknown", file=sys.stderr)
@@ -0,0 +1,450 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmark_passes import PLUGIN
+from pass_host import PassHostError, create_pool
+from protections import OPT_LEVELS, POST_OBFUSCATION_PIPELINES
+from resource_limits import LimitExceeded, load_stage_limits, run_limited
+from run_advanced_obfuscation import ALL_PASSES, AdvancedObfuscationPipeline
+
+TECHNIQUES = [name for name, _, _ in ALL_PASSES]
+DESCRIPTIONS = {name: description for name, description, _ in ALL_PASSES}
+
+# Intensities the tuner tries per technique; None is the pass's default.
+# Each one can be requested through /obfuscate's form fields (see form_fields).
+INTENSITIES = {
+    "cfflatten": [None, "keep-loops"],
+    "opaque-preds": [None, "budget=10", "budget=60"],
+    "anti-debug": [None, "mode=cold", "mode=sampled;every=4096"],
+}
+
+
+def intensities(name):
+    return INTENSITIES.get(name, [None])
+
+
+def form_fields(steps, opt_level="O0"):
+    """/obfuscate form fields that reproduce a candidate"""
+    fields = {"techniques": json.dumps([name for name, _ in steps]), "ordered": True, "opt_level": opt_level}
+    for name, option in steps:
+        if name == "cfflatten" and option == "keep-loops":
+            fields["keep_loops"] = True
+        elif name == "opaque-preds" and option:
+            fields["opaque_budget"] = int(option.split("=", 1)[1])
+        elif name == "anti-debug" and option:
+            values = dict(part.split("=", 1) for part in option.split(";"))
+            fields["anti_debug_mode"] = values["mode"]
+            if "every" in values:
+                fields["anti_debug_every"] = int(values["every"])
+    return fields
+
+
+class TimedOut(Exception):
+    """A benchmark run took longer than the tuner's per-run timeout"""
+
+
+class TimingGate:
+    """Builds share the CPU with each other; a timing run has it to itself.
+
+    Each build subprocess holds the gate shared, and timing holds it
+    exclusively: it waits for running builds to finish, and no new build
+    starts while a timing run is waiting or running.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.builds = 0
+        self.timing = False
+        self.waiting = 0
+
+    @contextlib.contextmanager
+    def build(self):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.timing and not self.waiting)
+            self.builds += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.builds -= 1
+                self.condition.notify_all()
+
+    @contextlib.contextmanager
+    def measure(self):
+        with self.condition:
+            self.waiting += 1
+            self.condition.wait_for(lambda: not self.timing and not self.builds)
+            self.waiting -= 1
+            self.timing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.timing = False
+                self.condition.notify_all()
+
+
+class PrefixCache:
+    """Bitcode after each applied prefix of steps, shared by all candidates.
+
+    Candidates that start with the same steps (most mutations do) reuse the
+    module instead of re-running those passes. A key being built by one
+    thread is waited on, not built twice.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.building = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        while True:
+            with self.lock:
+                if key in self.entries:
+                    self.hits += 1
+                    return self.entries[key]
+                event = self.building.get(key)
+                if event is None:
+                    event = self.building[key] = threading.Event()
+                    self.misses += 1
+                    break
+            event.wait()
+        try:
+            value = build()
+            with self.lock:
+                self.entries[key] = value
+            return value
+        finally:
+            with self.lock:
+                del self.building[key]
+            event.set()
+
+
+class Tuner:
+    """Search pass orders and intensities for the Pareto frontier of one program.
+
+    A candidate is a tuple of (technique, option) steps applied in order. Each
+    is built, checked against the unobfuscated program's output, timed and
+    scored with the same metrics and security score as a normal job, so
+    frontier entries can be submitted to /obfuscate with ordered=true. Builds
+    use the frontend, post-obfuscation pipeline and llc flags a job at
+    opt_level uses.
+    """
+
+    def __init__(self, source, args=(), stdin=b"", runs=3, jobs=4, seed=0, opt_level="O0", timeout=10.0):
+        if opt_level not in OPT_LEVELS:
+            raise ValueError(f"opt_level must be one of {', '.join(OPT_LEVELS)}")
+        self.source = Path(source).resolve()
+        self.args = list(args)
+        self.stdin = stdin
+        self.runs = runs
+        self.jobs = jobs
+        self.seed = seed
+        self.opt_level = opt_level
+        # Per benchmark run; a candidate that runs longer is rejected
+        self.timeout = timeout
+        self.limits = load_stage_limits()
+        self.pass_hosts = create_pool()
+        self.cache = PrefixCache()
+        # Builds run in parallel, but timings must not compete with them for the CPU
+        self.gate = TimingGate()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work_dir = Path(self.tmp.name)
+        self.results = {}
+        self.counter = 0
+        self.counter_lock = threading.Lock()
+        self.base_key = hashlib.sha256(
+            self.source.read_bytes() + f"|{seed}|{opt_level}|{PLUGIN.stat().st_mtime_ns}".encode()
+        ).hexdigest()
+
+    # Building
+
+    def pipeline_for(self, steps):
+        """Throwaway pipeline carrying the steps' options and seed, for names and scoring"""
+        options = {name: option for name, option in steps if option}
+        return AdvancedObfuscationPipeline(self.source, seed=self.seed, work_dir=self.work_dir,
+                                           pass_options=options, stage_limits=self.limits,
+                                           opt_level=self.opt_level)
+
+    def compile_source(self):
+        with self.gate.build():
+            result = run_limited(self.pipeline_for(()).frontend_command("-", use_pch=False),
+                                 "compile:tuner", self.limits, binary=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"clang failed: {result.stderr.strip()}")
+        return result.stdout, ""
+
+    def apply_step(self, bitcode, step):
+        name, option = step
+        pipeline = self.pipeline_for([step]).pass_pipeline_name(name)
+        if self.pass_hosts is not None:
+            with self.gate.build():
+                response = self.pass_hosts.run(pipeline, bitcode, f"opt:{name}", emit_ll=False)
+            if not response.get("ok"):
+                raise RuntimeError(f"{pipeline} failed: {response.get('error')}")
+            return response["bitcode"], response.get("stderr", "")
+        with self.gate.build():
+            result = run_limited(["opt", "-load-pass-plugin", str(PLUGIN), "-passes", pipeline, "-", "-o", "-"],
+                                 f"opt:{name}", self.limits, input_bytes=bitcode, binary=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{pipeline} failed: {result.stderr.strip()[-500:]}")
+        return result.stdout, result.stderr
+
+    def module_for(self, steps):
+        """(bitcode, [stderr per step]) after applying steps, reusing cached prefixes"""
+        if not steps:
+            bitcode, _ = self.cache.get_or_build(self.base_key, self.compile_source)
+            return bitcode, []
+        prefix, last = steps[:-1], steps[-1]
+        key = hashlib.sha256(f"{self.base_key}|{json.dumps(steps)}".encode()).hexdigest()
+
+        def build():
+            bitcode, stderrs = self.module_for(prefix)
+            next_bitcode, stderr = self.apply_step(bitcode, last)
+            return next_bitcode, stderrs + [stderr]
+
+        return self.cache.get_or_build(key, build)
+
+    def link(self, bitcode, name):
+        """Executable from obfuscated bitcode, optimized and compiled as a job at opt_level would be"""
+        obj = self.work_dir / f"{name}.o"
+        exe = self.work_dir / f"{name}.exe"
+        if self.opt_level != "O0":
+            with self.gate.build():
+                result = run_limited(["opt", "-passes", POST_OBFUSCATION_PIPELINES[self.opt_level], "-", "-o", "-"],
+                                     "opt:post-optimization", self.limits, input_bytes=bitcode, binary=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"post-obfuscation optimization failed: {result.stderr.strip()[-500:]}")
+            bitcode = result.stdout
+        with self.gate.build():
+            result = run_limited(["llc", *self.pipeline_for(()).llc_flags(), "-filetype=obj", "-", "-o", str(obj)],
+                                 "codegen:tuner", self.limits, input_bytes=bitcode, binary=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"llc failed: {result.stderr.strip()[-500:]}")
+        with self.gate.build():
+            result = run_limited(["clang", str(obj), "-o", str(exe), *self.pipeline_for(()).link_flags()],
+                                 "link:tuner", self.limits)
+        if result.returncode != 0:
+            raise RuntimeError(f"link failed: {result.stderr.strip()[-500:]}")
+        return exe
+
+    def time_binary(self, exe):
+        """Fastest of `runs` runs, and the (stdout, exit code) every run must agree on.
+
+        Raises TimedOut if a run takes longer than the timeout.
+        """
+        timings, outputs = [], set()
+        with self.gate.measure():
+            for _ in range(self.runs):
+                start = time.perf_counter()
+                try:
+                    result = subprocess.run([str(exe), *self.args], input=self.stdin, capture_output=True,
+                                            timeout=self.timeout)
+                except subprocess.TimeoutExpired:
+                    raise TimedOut(f"{exe.name} ran longer than {self.timeout}s")
+                timings.append(time.perf_counter() - start)
+                outputs.add((result.stdout, result.returncode))
+        return min(timings), outputs
+
+    # Evaluation
+
+    def build_and_measure(self, steps):
+        with self.counter_lock:
+            self.counter += 1
+            name = f"candidate_{self.counter}"
+        bitcode, stderrs = self.module_for(steps)
+        exe = self.link(bitcode, name)
+        try:
+            seconds, outputs = self.time_binary(exe)
+            size = exe.stat().st_size
+        finally:
+            exe.unlink()
+        return {"seconds": seconds, "outputs": outputs, "size_bytes": size, "stderrs": stderrs}
+
+    def score(self, steps, stderrs):
+        """Metrics and security score, computed exactly as a job's report does"""
+        pipeline = self.pipeline_for(steps)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for (name, _), stderr in zip(steps, stderrs):
+                pipeline.parse_pass_output(stderr, name, DESCRIPTIONS[name])
+            metrics = pipeline.calculate_metrics()
+        return metrics, pipeline.calculate_security_score(metrics), pipeline.calculate_security_rating(metrics)
+
+    def evaluate(self, candidates):
+        """Build, check and time every not yet evaluated candidate"""
+        pending = [c for c in dict.fromkeys(candidates) if c not in self.results]
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {c: executor.submit(self.build_and_measure, c) for c in pending}
+        for steps, future in futures.items():
+            entry = {
+                "techniques": [name for name, _ in steps],
+                "pass_options": {name: option for name, option in steps if option},
+                "form": form_fields(steps, self.opt_level),
+            }
+            try:
+                measured = future.result()
+            except TimedOut as e:
+                # Rejected like a candidate that changes the output, not counted as a failed build
+                entry.update({"timed_out": True, "rejected": str(e)})
+                self.results[steps] = entry
+                continue
+            except (RuntimeError, LimitExceeded, PassHostError) as e:
+                entry["error"] = str(e)
+                self.results[steps] = entry
+                continue
+            metrics, score, rating = self.score(steps, measured["stderrs"])
+            entry.update({
+                "seconds": round(measured["seconds"], 6),
+                "slowdown": round(measured["seconds"] / self.baseline["seconds"], 3) if self.baseline["seconds"] else None,
+                "size_bytes": measured["size_bytes"],
+                "size_ratio": round(measured["size_bytes"] / self.baseline["size_bytes"], 3),
+                "security_score": score,
+                "security_rating": rating,
+                "metrics": metrics,
+                "output_matches": measured["outputs"] == self.baseline["outputs"],
+            })
+            self.results[steps] = entry
+
+    # Search
+
+    def seed_candidates(self):
+        """Each technique alone at each intensity, plus every technique in the default order"""
+        candidates = [((name, option),) for name in TECHNIQUES for option in intensities(name)]
+        candidates.append(tuple((name, None) for name in TECHNIQUES))
+        return candidates
+
+    def random_candidate(self, rng):
+        names = rng.sample(TECHNIQUES, rng.randint(1, len(TECHNIQUES)))
+        return tuple((name, rng.choice(intensities(name))) for name in names)
+
+    def mutate(self, steps, rng):
+        steps = list(steps)
+        unused = [name for name in TECHNIQUES if name not in {n for n, _ in steps}]
+        kind = rng.choice(["swap", "add", "remove", "intensity"])
+        if kind == "swap" and len(steps) > 1:
+            i, j = rng.sample(range(len(steps)), 2)
+            steps[i], steps[j] = steps[j], steps[i]
+        elif kind == "add" and unused:
+            name = rng.choice(unused)
+            steps.insert(rng.randint(0, len(steps)), (name, rng.choice(intensities(name))))
+        elif kind == "remove" and len(steps) > 1:
+            steps.pop(rng.randrange(len(steps)))
+        else:
+            i = rng.randrange(len(steps))
+            steps[i] = (steps[i][0], rng.choice(intensities(steps[i][0])))
+        return tuple(steps)
+
+    def frontier(self):
+        """Correct candidates no other candidate beats on slowdown, size and security at once"""
+        valid = [(steps, r) for steps, r in self.results.items() if self.measured(r) and r["output_matches"]]
+
+        def dominates(a, b):
+            no_worse = (a["slowdown"] <= b["slowdown"] and a["size_ratio"] <= b["size_ratio"]
+                        and a["security_score"] >= b["security_score"])
+            better = (a["slowdown"] < b["slowdown"] or a["size_ratio"] < b["size_ratio"]
+                      or a["security_score"] > b["security_score"])
+            return no_worse and better
+
+        front = [(steps, r) for steps, r in valid if not any(dominates(o, r) for _, o in valid)]
+        return sorted(front, key=lambda item: (-item[1]["security_score"], item[1]["slowdown"]))
+
+    @staticmethod
+    def measured(entry):
+        """Whether a candidate built and finished its timing runs"""
+        return "error" not in entry and not entry.get("timed_out")
+
+    def run(self, budget=40, rng_seed=0):
+        rng = random.Random(rng_seed)
+        start = time.time()
+        base_bitcode, _ = self.module_for(())
+        base_exe = self.link(base_bitcode, "baseline")
+        seconds, outputs = self.time_binary(base_exe)
+        self.baseline = {"seconds": seconds, "outputs": outputs, "size_bytes": base_exe.stat().st_size}
+        print(f"📏 Baseline: {seconds:.6f}s, {self.baseline['size_bytes']} bytes")
+
+        self.evaluate(self.seed_candidates()[:budget])
+        while len(self.results) < budget:
+            front = [steps for steps, _ in self.frontier()]
+            batch = set()
+            attempts = 0
+            while len(batch) < self.jobs and attempts < 50 * self.jobs:
+                attempts += 1
+                candidate = (self.mutate(rng.choice(front), rng) if front and rng.random() < 0.7
+                             else self.random_candidate(rng))
+                if candidate not in self.results:
+                    batch.add(candidate)
+            if not batch:
+                break
+            self.evaluate(list(batch)[:budget - len(self.results)])
+            print(f"🔎 {len(self.results)}/{budget} candidates, frontier {len(self.frontier())}")
+
+        return {
+            "source": str(self.source),
+            "baseline": {"seconds": round(self.baseline["seconds"], 6), "size_bytes": self.baseline["size_bytes"]},
+            "evaluated": len(self.results),
+            "opt_level": self.opt_level,
+            "rejected_output": sum(1 for r in self.results.values() if self.measured(r) and not r["output_matches"]),
+            "rejected_timeout": sum(1 for r in self.results.values() if r.get("timed_out")),
+            "failed": sum(1 for r in self.results.values() if "error" in r),
+            "cache": {"hits": self.cache.hits, "misses": self.cache.misses},
+            "seconds": round(time.time() - start, 3),
+            "frontier": [entry for _, entry in self.frontier()],
+        }
+
+    def close(self):
+        if self.pass_hosts is not None:
+            self.pass_hosts.shutdown()
+        self.tmp.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find Pareto-optimal pass orders and intensities for a program")
+    parser.add_argument("source", help="C/C++ source to tune")
+    parser.add_argument("--args", nargs="*", default=[], help="Arguments for each benchmark run")
+    parser.add_argument("--stdin", help="File fed to stdin of each benchmark run")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per candidate; the fastest is used")
+    parser.add_argument("--jobs", type=int, default=4, help="Candidates built in parallel")
+    parser.add_argument("--budget", type=int, default=40, help="Candidates to evaluate")
+    parser.add_argument("--seed", type=int, default=0, help="Pass seed, as for /obfuscate")
+    parser.add_argument("--opt-level", default="O0", choices=OPT_LEVELS, help="Optimization level, as for /obfuscate")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds per benchmark run before a candidate is rejected")
+    parser.add_argument("--search-seed", type=int, default=0, help="Seed of the random search")
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+
+    if not PLUGIN.exists():
+        print(f"Plugin not found: {PLUGIN}")
+        sys.exit(1)
+
+    stdin = Path(args.stdin).read_bytes() if args.stdin else b""
+    tuner = Tuner(args.source, args.args, stdin, args.runs, args.jobs, args.seed, args.opt_level, args.timeout)
+    try:
+        report = tuner.run(args.budget, args.search_seed)
+    finally:
+        tuner.close()
+    if args.json:
+        print(json.dumps(report, indent=2))
+        sys.exit(0)
+
+    print(f"{report['evaluated']} candidates in {report['seconds']}s "
+          f"({report['failed']} failed, {report['rejected_output']} changed the output, "
+          f"{report['rejected_timeout']} timed out, "
+          f"{report['cache']['hits']} cached prefixes reused)")
+    for entry in report["frontier"]:
+        options = ", ".join(f"{k}<{v}>" for k, v in entry["pass_options"].items())
+        print(f"  score {entry['security_score']:>2} ({entry['security_rating']:<6}) x{entry['slowdown']:<7} "
+              f"size x{entry['size_ratio']:<6} {' → '.join(entry['techniques'])}"
+              + (f"  [{options}]" if options else ""))